@@ -1,17 +1,24 @@
 import os
 import json
-from typing import Dict, Optional, List
-from dotenv import load_dotenv
-import boto3
+import time
 from datetime import datetime, timedelta
-import traceback
-from boto3.dynamodb.conditions import Key, Attr
+from functools import lru_cache
+from threading import Lock
 
-# Load environment variables
-load_dotenv()
+# boto3 and dotenv are imported on first use: importing this module (grants_bot does it)
+# stays cheap until a prompt is actually sent to Bedrock
+
+@lru_cache(maxsize=None)
+def load_environment():
+    """Load the .env file once, before the first AWS client is created"""
+    from dotenv import load_dotenv
+    load_dotenv()
 
 def get_temporary_credentials(duration: int = 3600):
     """Get temporary AWS credentials."""
+    import boto3
+
+    load_environment()
     try:
         sts_client = boto3.client("sts")
         response = sts_client.get_session_token(DurationSeconds=duration)
@@ -27,7 +34,9 @@ def get_temporary_credentials(duration: int = 3600):
 
 def get_aws_session():
     """Create and return an AWS session with temporary credentials."""
-    temp_creds = get_temporary_credentials()
+    import boto3
+
+    temp_creds = get_temporary_credentials(CREDENTIALS_DURATION)
     return boto3.Session(
         aws_access_key_id=temp_creds["aws_access_key_id"],
         aws_secret_access_key=temp_creds["aws_secret_access_key"],
@@ -37,15 +46,32 @@ def get_aws_session():
 
 
 
+# The Bedrock client is reused until its temporary credentials are about to expire,
+# instead of calling STS and building a new client for every prompt
+CREDENTIALS_DURATION = 3600
+CREDENTIALS_REFRESH_MARGIN = timedelta(minutes=5)
+_bedrock_client = None
+_bedrock_client_expiration = None
+_bedrock_client_lock = Lock()
+
+def get_bedrock_client():
+    """Shared Bedrock runtime client, renewed with fresh STS credentials before they expire."""
+    global _bedrock_client, _bedrock_client_expiration
+    with _bedrock_client_lock:
+        if _bedrock_client is None or datetime.now() >= _bedrock_client_expiration - CREDENTIALS_REFRESH_MARGIN:
+            issued_at = datetime.now()
+            session = get_aws_session()
+            _bedrock_client = session.client(
+                service_name='bedrock-runtime',
+                region_name=os.getenv('AWS_REGION')
+            )
+            _bedrock_client_expiration = issued_at + timedelta(seconds=CREDENTIALS_DURATION)
+        return _bedrock_client
+
 def get_bedrock_response(prompt: str):
     """Get response from Bedrock."""
-    session = get_aws_session()
-    
-    bedrock = session.client(
-        service_name='bedrock-runtime',
-        region_name=os.getenv('AWS_REGION')
-    )
-    
+    bedrock = get_bedrock_client()
+
 
     body = {
         "anthropic_version": "bedrock-2023-05-31",
@@ -0,0 +1,70 @@
+"""
+How many concurrent grant matches one worker sustains with AsyncGrantQueries.
+Every request runs the summary query (the result cache is bypassed) over the
+shared async pool, at increasing concurrency levels.
+
+    python benchmarks/bench_async_matching.py [n_grants] [async_db_url]
+
+Without a URL, a synthetic SQLite catalog is created and queried through aiosqlite.
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bench_grant_matching import seed_catalog
+from tools_aurora import AsyncGrantQueries, MAX_RECOMMENDED_GRANTS, REGION_TO_SCOPE, COMPANY_TYPES
+
+CONCURRENCY_LEVELS = [1, 10, 50, 100, 200]
+REQUESTS_PER_LEVEL = 400
+
+
+async def run_level(queries: AsyncGrantQueries, concurrency: int):
+    rng = random.Random(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_match():
+        async with semaphore:
+            start = time.perf_counter()
+            await queries._query_grant_summaries(
+                rng.uniform(0, 500_000), rng.choice(list(REGION_TO_SCOPE.values())),
+                rng.choice(COMPANY_TYPES), MAX_RECOMMENDED_GRANTS,
+            )
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_match() for _ in range(REQUESTS_PER_LEVEL)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"concurrency={concurrency:>4}  matches/s={REQUESTS_PER_LEVEL / elapsed:8.1f}  "
+          f"p50={statistics.median(latencies) * 1000:7.1f} ms  "
+          f"p95={latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms")
+
+
+async def main(url: str):
+    engine = create_async_engine(url)
+    queries = AsyncGrantQueries(engine=engine)
+    for concurrency in CONCURRENCY_LEVELS:
+        await run_level(queries, concurrency)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    if len(sys.argv) > 2:
+        url = sys.argv[2]
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "grants.db")
+        seed_catalog(create_engine(f"sqlite:///{path}"), n)
+        url = f"sqlite+aiosqlite:///{path}"
+        print(f"Synthetic catalog: {n} grants in {path}")
+    asyncio.run(main(url))
@@ -0,0 +1,118 @@
+"""
+Conformance checks and timings shared by every ChatStore implementation.
+The same scenario runs against each store: idempotent inserts, ordered reads,
+monotonic headers and paginated listing; then bulk inserts and reads are timed.
+
+    python benchmarks/bench_chat_store.py [sqlite|dynamodb ...] [n_conversations]
+
+With no store names only SQLite runs (in a temporary file). The dynamodb store uses
+the tables created by dynamodb_setup.py and the AWS_* variables of the backend.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_store import ChatStore, DynamoChatStore, SQLiteChatStore
+
+MESSAGES_PER_CONVERSATION = 12
+
+
+def conversation(n_messages: int, start: int = 0):
+    return [
+        {"sequence": seq, "sender": "user" if seq % 2 else "bot",
+         "text": f"Mensaje {seq} " + "texto de la subvención " * (seq % 5), "timestamp": "2026-10-19T10:00:00"}
+        for seq in range(start, n_messages)
+    ]
+
+
+def check_conformance(store: ChatStore):
+    user_id = f"conformance-{uuid.uuid4().hex[:8]}"
+    now = datetime(2026, 10, 19, 10, 0, tzinfo=timezone.utc)
+
+    # Incremental appends, a replayed append and an out-of-order append
+    messages = conversation(6)
+    store.insert_messages(user_id, "c1", messages[:1], now)
+    store.insert_messages(user_id, "c1", messages[1:4], now + timedelta(seconds=1))
+    store.insert_messages(user_id, "c1", messages[1:4], now + timedelta(seconds=2))
+    store.insert_messages(user_id, "c1", messages[5:], now + timedelta(seconds=3))
+    store.insert_messages(user_id, "c1", messages[4:5], now + timedelta(seconds=4))
+
+    stored = store.get_conversation(user_id, "c1")
+    assert [m["order"] for m in stored] == list(range(6)), "messages are returned once each, in order"
+    assert [m["message_content"] for m in stored] == [m["text"] for m in messages], "content round-trips"
+    assert stored[0]["role"] == "bot" and stored[1]["role"] == "user"
+    assert store.get_conversation(user_id, "missing") == []
+
+    # The first user message gives the title; the count never goes back
+    headers, cursor = store.list_conversations(user_id)
+    assert cursor is None and len(headers) == 1
+    assert headers[0]["message_count"] == 6, headers[0]
+    assert headers[0]["title"].startswith("Mensaje 1"), headers[0]
+    assert headers[0]["conversation_date"] == "19/10/2026 10:00"
+
+    # Most recent first, paginated with an opaque cursor
+    for idx in range(2, 8):
+        store.insert_messages(user_id, f"c{idx}", conversation(2), now + timedelta(minutes=idx))
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.list_conversations(user_id, limit=3, cursor=cursor)
+        assert len(page) <= 3
+        seen += [header["conversationId"] for header in page]
+        if not cursor:
+            break
+    assert seen == [f"c{idx}" for idx in range(7, 1, -1)] + ["c1"], seen
+
+
+def run_benchmark(store: ChatStore, n_conversations: int):
+    user_id = f"bench-{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc)
+    jobs = [(user_id, f"conv-{idx}", conversation(MESSAGES_PER_CONVERSATION), now + timedelta(seconds=idx))
+            for idx in range(n_conversations)]
+
+    start = time.perf_counter()
+    for offset in range(0, len(jobs), 20):
+        store.insert_many(jobs[offset:offset + 20])
+    insert_seconds = time.perf_counter() - start
+
+    read_latencies = []
+    for idx in range(0, n_conversations, max(n_conversations // 50, 1)):
+        start = time.perf_counter()
+        store.get_conversation(user_id, f"conv-{idx}")
+        read_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    store.list_conversations(user_id, limit=50)
+    list_ms = (time.perf_counter() - start) * 1000
+
+    n_messages = n_conversations * MESSAGES_PER_CONVERSATION
+    print(f"  insert: {n_messages / insert_seconds:9.0f} messages/s   "
+          f"get_conversation p50: {statistics.median(read_latencies) * 1000:6.2f} ms   "
+          f"list_conversations: {list_ms:6.2f} ms")
+
+
+def build_store(name: str, directory: str) -> ChatStore:
+    if name == "sqlite":
+        return SQLiteChatStore(os.path.join(directory, "chat_history.db"))
+    if name == "dynamodb":
+        return DynamoChatStore()
+    raise ValueError(f"Unknown store: {name}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    n_conversations = int(args.pop()) if args and args[-1].isdigit() else 500
+    names = args or ["sqlite"]
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            store = build_store(name, directory)
+            print(f"{name}:")
+            check_conformance(store)
+            print("  conformance: ok")
+            run_benchmark(store, n_conversations)
+            store.close()
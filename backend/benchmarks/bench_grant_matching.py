@@ -0,0 +1,113 @@
+"""
+Bytes transferred and Python allocations per grant matching call, comparing the
+full ORM load + slicing in Python (before) with the projected, truncated and
+LIMITed summary query (after), and the same query through find_grant_summaries
+and the result cache (cached). Runs against a synthetic in-memory SQLite catalog.
+
+    python benchmarks/bench_grant_matching.py [n_grants]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+from tools_aurora import Base, Grant, GrantQueries, MAX_RECOMMENDED_GRANTS, get_grant_cache, matching_filters
+
+TEXT_COLUMNS = ["goal_extra", "applicants", "term", "help_type", "expenses",
+                "fund_execution_period", "line", "extra_limit", "info_extra"]
+
+
+def seed_catalog(engine, n_grants: int):
+    """Create the grants table on the engine and fill it with synthetic grants"""
+    Base.metadata.create_all(engine)
+    rng = random.Random(0)
+    filler = "Lorem ipsum dolor sit amet pyme pequeña empresa autónomo. " * 40
+    session = sessionmaker(bind=engine)()
+    session.add_all(Grant(
+        slug=f"grant-{i}",
+        formatted_title=f"Ayuda {i}",
+        status_text="Abierta",
+        entity="Entidad",
+        total_amount=rng.uniform(1e4, 1e7),
+        request_amount=rng.uniform(1e3, 1e6),
+        scope=rng.choice(["Estatal", "Galicia", "Cataluña"]),
+        publisher="Publicador",
+        **{column: filler for column in TEXT_COLUMNS},
+    ) for i in range(n_grants))
+    session.commit()
+    session.close()
+
+
+def build_queries(n_grants: int) -> GrantQueries:
+    queries = GrantQueries(db_url="sqlite://")
+    seed_catalog(queries.engine, n_grants)
+    return queries
+
+
+def payload_bytes(values) -> int:
+    return sum(len(str(v).encode("utf-8")) for v in values if v is not None)
+
+
+def before(queries: GrantQueries):
+    session = queries.Session()
+    try:
+        grants = session.query(Grant)\
+            .filter(*matching_filters(10_000, "Galicia", "pyme"))\
+            .order_by(Grant.request_amount.desc())\
+            .all()
+    finally:
+        session.close()
+    summaries = [{
+        "slug": g.slug,
+        "title": g.formatted_title,
+        "scope": g.scope[:100] if g.scope else "",
+        "request_amount": g.request_amount,
+        "applicants": g.applicants[:150] if g.applicants else "",
+        "line": g.line[:150] if g.line else "",
+    } for g in grants[:MAX_RECOMMENDED_GRANTS]]
+    transferred = sum(payload_bytes(getattr(g, c.key) for c in Grant.__table__.columns) for g in grants)
+    return summaries, transferred
+
+
+def after(queries: GrantQueries):
+    summaries = queries._query_grant_summaries(10_000, "Galicia", "pyme", MAX_RECOMMENDED_GRANTS)
+    return summaries, sum(payload_bytes(s.values()) for s in summaries)
+
+
+def cached(queries: GrantQueries):
+    # Public path: catalog version check, budget band and cache lookup before the summary query
+    summaries = queries.find_grant_summaries(10_000, "Galicia", "pyme")
+    return summaries, sum(payload_bytes(s.values()) for s in summaries)
+
+
+def measure(name, fn, queries):
+    fn(queries)  # warm up
+    tracemalloc.start()
+    start = time.perf_counter()
+    summaries, transferred = fn(queries)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<8} rows={len(summaries):>3}  bytes={transferred:>10,}  "
+          f"peak_alloc={peak:>10,}  time={elapsed * 1000:7.1f} ms")
+    return summaries
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    queries = build_queries(n)
+    print(f"Synthetic catalog: {n} grants")
+    old = measure("before", before, queries)
+    new = measure("after", after, queries)
+    assert old == new, "summary query returned different grants"
+    from_cache = measure("cached", cached, queries)
+    # The band query is cut to the exact budget, so its grants are the first ones of the exact query
+    assert from_cache and from_cache == new[:len(from_cache)], "cached matching returned different grants"
+    stats = get_grant_cache().stats()
+    assert stats["hits"] >= 1, "find_grant_summaries did not hit the cache"
+    print(f"grant cache: hits={stats['hits']} misses={stats['misses']} hit_ratio={stats['hit_ratio']}")
@@ -0,0 +1,118 @@
+"""
+Does chat-history traffic delay chat turns on the same worker?
+A probe coroutine stands in for chat turns: it sleeps 10 ms in a loop and records how
+late the event loop wakes it up. Meanwhile concurrent history reads run either as the
+handlers used to (blocking boto3 inside the coroutine) or through the async client.
+
+    python benchmarks/bench_history_concurrency.py [concurrency] [reads]
+
+Uses AWS_DYNAMO_ENDPOINT_URL when set (e.g. DynamoDB Local); otherwise it starts
+moto's DynamoDB server (moto[server]) in a subprocess as the local stand-in and creates the tables.
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROBE_INTERVAL = 0.01
+N_CONVERSATIONS = 50
+
+
+def start_local_dynamodb(port: int = 5124):
+    # Separate process, so the stand-in does not compete with the event loop for the GIL
+    server = subprocess.Popen([sys.executable, "-m", "moto.server", "-p", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    endpoint = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{endpoint}/moto-api/", timeout=1)
+            break
+        except OSError:
+            time.sleep(0.1)
+    os.environ["AWS_DYNAMO_ENDPOINT_URL"] = endpoint
+    os.environ.setdefault("AWS_DYNAMO_REGION", "eu-west-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+    return server
+
+
+def create_tables():
+    from dynamodb import TABLE_NAME, get_dynamodb
+    from dynamodb_setup import setup_dynamodb
+
+    client = get_dynamodb().meta.client
+    if TABLE_NAME not in client.list_tables()["TableNames"]:
+        client.create_table(
+            TableName=TABLE_NAME,
+            BillingMode="PAY_PER_REQUEST",
+            AttributeDefinitions=[{"AttributeName": "userId", "AttributeType": "S"},
+                                  {"AttributeName": "messageId", "AttributeType": "S"}],
+            KeySchema=[{"AttributeName": "userId", "KeyType": "HASH"},
+                       {"AttributeName": "messageId", "KeyType": "RANGE"}],
+        )
+    setup_dynamodb()
+
+
+async def probe(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run_mode(store, mode: str, concurrency: int, reads: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_read(idx: int):
+        async with semaphore:
+            conversation_id = f"conv-{idx % N_CONVERSATIONS}"
+            if mode == "blocking":
+                store.get_conversation("bench-user", conversation_id)
+            else:
+                await store.get_conversation_async("bench-user", conversation_id)
+
+    stop, lags = asyncio.Event(), []
+    probe_task = asyncio.create_task(probe(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(one_read(idx) for idx in range(reads)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    lags.sort()
+    print(f"{mode:>8}  reads/s={reads / elapsed:7.1f}  chat-turn delay: "
+          f"p50={statistics.median(lags) * 1000:6.1f} ms  p95={lags[int(len(lags) * 0.95)] * 1000:6.1f} ms  "
+          f"max={lags[-1] * 1000:6.1f} ms")
+
+
+async def main(concurrency: int, reads: int):
+    from chat_store import DynamoChatStore
+
+    store = DynamoChatStore()
+    now = datetime.now(timezone.utc)
+    messages = [{"sequence": seq, "sender": "user" if seq % 2 else "bot", "text": f"Mensaje {seq}"} for seq in range(12)]
+    store.insert_many([("bench-user", f"conv-{idx}", messages, now + timedelta(seconds=idx))
+                       for idx in range(N_CONVERSATIONS)])
+
+    print(f"concurrency={concurrency}, reads={reads}")
+    for mode in ["blocking", "async"]:
+        await run_mode(store, mode, concurrency, reads)
+    await store.aclose()
+
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    reads = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    server = None if os.getenv("AWS_DYNAMO_ENDPOINT_URL") else start_local_dynamodb()
+    try:
+        create_tables()
+        asyncio.run(main(concurrency, reads))
+    finally:
+        if server:
+            server.terminate()
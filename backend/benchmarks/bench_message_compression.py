@@ -0,0 +1,109 @@
+"""
+Size and CPU cost of compressing message_content in chat_history.
+Builds synthetic transcripts shaped like the bot's answers (markdown grant
+analyses of ~1000 words plus short user turns) and, for each codec, reports the
+average item size, the DynamoDB write/read units per item and the encode/decode time.
+
+    python benchmarks/bench_message_compression.py [n_conversations]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boto3.dynamodb.types import Binary
+
+import dynamodb
+from dynamodb import build_message_items, decode_message_item
+
+SECTIONS = ["Resumen ejecutivo", "Requisitos clave", "Proceso de solicitud",
+            "Plazos importantes", "Documentación necesaria"]
+PHRASES = [
+    "La convocatoria está dirigida a pequeñas y medianas empresas con domicilio fiscal en la comunidad",
+    "el importe máximo de la ayuda alcanza el {pct}% de los gastos subvencionables del proyecto",
+    "los beneficiarios deberán acreditar estar al corriente de sus obligaciones tributarias y con la Seguridad Social",
+    "la solicitud se presenta por vía telemática a través de la sede electrónica del organismo",
+    "se valorará especialmente la creación de empleo indefinido y la incorporación de mujeres",
+    "los gastos de personal, consultoría externa y adquisición de equipamiento son subvencionables",
+    "el plazo de ejecución del proyecto no podrá superar los {months} meses desde la resolución",
+    "será necesario aportar memoria técnica, plan de negocio y presupuesto desglosado",
+    "la ayuda es compatible con otras subvenciones siempre que no se supere el coste total",
+    "el pago se realizará tras la justificación de los gastos mediante cuenta justificativa",
+]
+USER_TURNS = ["Hola", "Mallorca", "Autónomo", "30.000 €", "Quiero digitalizar mi comercio",
+              "¿Qué documentación necesito?", "¿Cuál es el plazo?", "volver"]
+
+
+def bot_answer(rng: random.Random, words: int = 1000) -> str:
+    """Markdown answer in the format requested by the grant analysis prompt"""
+    title = f"Subvención {rng.choice(['Impulsa', 'Digitaliza', 'Emprende', 'Innova'])} {rng.randint(2023, 2026)}"
+    lines = [f"## {title}", ""]
+    count = 0
+    while count < words:
+        for section in SECTIONS:
+            lines += [f"### {section}", ""]
+            for _ in range(rng.randint(2, 4)):
+                sentence = rng.choice(PHRASES).format(pct=rng.choice([40, 50, 60, 80]), months=rng.choice([12, 18, 24]))
+                lines.append(f"- **{sentence.split()[0].capitalize()}** {sentence}. Importe: {rng.randint(1, 500) * 1000:,} €.")
+                count += len(sentence.split()) + 3
+            lines.append("")
+    lines.append("¿Tienes alguna otra consulta sobre esta subvención?")
+    return "\n".join(lines)
+
+
+def transcript(rng: random.Random):
+    messages = []
+    for turn in range(rng.randint(4, 8)):
+        messages.append({"sender": "user", "text": rng.choice(USER_TURNS)})
+        long_answer = turn >= 3 or rng.random() < 0.3
+        messages.append({"sender": "bot", "text": bot_answer(rng) if long_answer else "¿En qué región está tu empresa?"})
+    return messages
+
+
+def item_size(item) -> int:
+    """Approximate DynamoDB item size: attribute names plus values"""
+    size = 0
+    for name, value in item.items():
+        size += len(name)
+        if isinstance(value, Binary):
+            size += len(value.value)
+        elif isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        else:
+            size += len(str(value)) // 2 + 1
+    return size
+
+
+def run(codec: str, conversations):
+    os.environ["CHAT_COMPRESSION_CODEC"] = codec
+    now = datetime.now(timezone.utc)
+    sizes, encode_us, decode_us = [], [], []
+    for idx, messages in enumerate(conversations):
+        start = time.perf_counter()
+        items = build_message_items("bench-user", f"conv-{idx}", messages, now, 0)
+        encode_us.append((time.perf_counter() - start) * 1e6 / len(items))
+        sizes += [item_size(item) for item in items]
+        start = time.perf_counter()
+        for item in items:
+            decode_message_item(dict(item))
+        decode_us.append((time.perf_counter() - start) * 1e6 / len(items))
+    wcu = sum(-(-size // 1024) for size in sizes) / len(sizes)
+    rcu = sum(-(-size // 4096) for size in sizes) / len(sizes)
+    print(f"{codec:>5}  avg item={statistics.mean(sizes):8.0f} B  max item={max(sizes):7d} B  "
+          f"WCU/item={wcu:5.2f}  RCU/item={rcu:5.2f}  "
+          f"encode={statistics.mean(encode_us):7.1f} µs  decode={statistics.mean(decode_us):6.1f} µs")
+
+
+if __name__ == "__main__":
+    n_conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(7)
+    conversations = [transcript(rng) for _ in range(n_conversations)]
+    print(f"{n_conversations} conversations, {sum(len(c) for c in conversations)} messages, "
+          f"threshold={dynamodb.compression_settings()[0]} B")
+    codecs = ["none", "gzip"] + (["zstd"] if dynamodb.zstandard else [])
+    for codec in codecs:
+        run(codec, conversations)
@@ -0,0 +1,89 @@
+"""
+Cold-start budget of the API: time to import main and time until a freshly started
+uvicorn worker answers its first request. Each measurement runs in a new process;
+the median of the runs is compared with the budget and the script exits with
+status 1 when it is exceeded, so it can gate CI.
+
+    python benchmarks/bench_startup.py [--runs 5] [--import-budget 1.0] [--first-request-budget 1.5]
+
+AWS is not needed: the chat history uses the SQLite store and grants an in-memory SQLite database.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_REQUEST_PATH = "/metrics"
+
+
+def bench_env(directory: str):
+    env = dict(os.environ)
+    env.update(CHAT_STORE="sqlite", CHAT_SQLITE_PATH=os.path.join(directory, "chat_history.db"),
+               GRANTS_DB_URL="sqlite://", PYTHONDONTWRITEBYTECODE="0")
+    return env
+
+
+def measure_import(env) -> float:
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(env, timeout: float = 60) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{FIRST_REQUEST_PATH}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"The API did not answer {FIRST_REQUEST_PATH} within {timeout} s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1.0, help="Seconds allowed to import main")
+    parser.add_argument("--first-request-budget", type=float, default=1.5,
+                        help="Seconds allowed from process start to the first response")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = bench_env(directory)
+        measure_import(env)  # Warm the bytecode cache so every run measures the same thing
+        imports = [measure_import(env) for _ in range(args.runs)]
+        first_requests = [measure_first_request(env) for _ in range(args.runs)]
+
+    failures = []
+    for name, values, budget in [("import main", imports, args.import_budget),
+                                 ("first request", first_requests, args.first_request_budget)]:
+        median = statistics.median(values)
+        status = "ok" if median <= budget else "OVER BUDGET"
+        print(f"{name:>14}: median {median:6.3f} s  (min {min(values):.3f}, max {max(values):.3f})  "
+              f"budget {budget:.2f} s  {status}")
+        if median > budget:
+            failures.append(name)
+    sys.exit(1 if failures else 0)
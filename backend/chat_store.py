@@ -0,0 +1,293 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import dynamodb
+from dynamodb import (batch_write_items, build_message_items, conversation_order_key, conversation_title,
+                      decode_cursor, encode_cursor, format_conversation_date, message_count,
+                      upsert_conversation_header)
+from dynamodb_async import AIOBOTO3_AVAILABLE, AsyncDynamoHistory
+
+# Conversations expire after 30 days (DynamoDB TTL on expirationTime)
+CONVERSATION_TTL = timedelta(days=30)
+
+# Write job for insert_many: (user_id, conversation_id, messages, now)
+WriteJob = Tuple[str, str, List[Dict[str, str]], datetime]
+
+
+class ChatStore(ABC):
+    """
+    Storage of the chat history. Messages are dicts with "sender", "text", an optional
+    "timestamp" and an optional "sequence" (their position in the conversation). Writing
+    the same (conversation, sequence) twice overwrites the message instead of duplicating it.
+    """
+
+    def insert_messages(self, user_id: str, conversation_id: str, messages: List[Dict[str, str]],
+                        now: Optional[datetime] = None) -> int:
+        """Store the messages and update the conversation header. Returns the number of messages not written"""
+        failed = self.insert_many([(user_id, conversation_id, messages, now or datetime.now(timezone.utc))])
+        return sum(len(job[2]) for job in failed)
+
+    @abstractmethod
+    def insert_many(self, jobs: List[WriteJob]) -> List[WriteJob]:
+        """
+        Store several conversations at once (used by the write-behind queue).
+        Returns the jobs that were not fully written, each with only its unwritten messages
+        """
+
+    @abstractmethod
+    def get_conversation(self, user_id: str, conversation_id: str) -> List[Dict]:
+        """Messages of one conversation, in order"""
+
+    @abstractmethod
+    def list_conversations(self, user_id: str, limit: int = 50,
+                           cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Conversation headers, most recent first, and the cursor of the next page (or None)"""
+
+    # Coroutine versions for the API handlers. By default the blocking call runs in a
+    # worker thread so it never stalls the event loop; stores with a native async client override them
+
+    async def get_conversation_async(self, user_id: str, conversation_id: str) -> List[Dict]:
+        return await asyncio.to_thread(self.get_conversation, user_id, conversation_id)
+
+    async def list_conversations_async(self, user_id: str, limit: int = 50,
+                                       cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return await asyncio.to_thread(self.list_conversations, user_id, limit, cursor)
+
+    def close(self):
+        pass
+
+    async def warm_up(self):
+        """Create the store's clients before the first request (called while the API starts)"""
+
+    async def aclose(self):
+        """Release the async connections (called when the API shuts down)"""
+
+
+class DynamoChatStore(ChatStore):
+    """
+    chat_history / chat_conversations tables in DynamoDB (see dynamodb.py).
+    Reads from the API go through aioboto3 when it is installed (dynamodb_async.py).
+    """
+
+    def __init__(self):
+        self._async_history = AsyncDynamoHistory() if AIOBOTO3_AVAILABLE else None
+
+    def insert_many(self, jobs: List[WriteJob]) -> List[WriteJob]:
+        # Every conversation's items go through the same 25-item BatchWriteItem calls
+        items = []
+        for user_id, conversation_id, messages, now in jobs:
+            expiration_time = int((now + CONVERSATION_TTL).timestamp())
+            items += build_message_items(user_id, conversation_id, messages, now, expiration_time)
+        unprocessed = {(item["userId"], item["messageId"]) for item in batch_write_items(items)}
+
+        failed = []
+        for user_id, conversation_id, messages, now in jobs:
+            # Each message keeps its position, so writing it again overwrites the same item
+            unwritten = [{**msg, "sequence": msg.get("sequence", idx)} for idx, msg in enumerate(messages)
+                         if (user_id, conversation_order_key(conversation_id, msg.get("sequence", idx))) in unprocessed]
+            if unwritten:
+                failed.append((user_id, conversation_id, unwritten, now))
+
+        for user_id, conversation_id, messages, now in jobs:
+            expiration_time = int((now + CONVERSATION_TTL).timestamp())
+            try:
+                upsert_conversation_header(user_id, conversation_id, messages, now, expiration_time)
+            except Exception as e:
+                print(f"❌ Error actualizando la cabecera de la conversación {conversation_id}: {str(e)}")
+        return failed
+
+    def get_conversation(self, user_id: str, conversation_id: str) -> List[Dict]:
+        return dynamodb.get_conversation_messages(user_id, conversation_id)
+
+    def list_conversations(self, user_id: str, limit: int = 50,
+                           cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return dynamodb.list_conversations(user_id, limit=limit, cursor=cursor)
+
+    async def get_conversation_async(self, user_id: str, conversation_id: str) -> List[Dict]:
+        if self._async_history is None:
+            return await super().get_conversation_async(user_id, conversation_id)
+        return await self._async_history.get_conversation_messages(user_id, conversation_id)
+
+    async def list_conversations_async(self, user_id: str, limit: int = 50,
+                                       cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        if self._async_history is None:
+            return await super().list_conversations_async(user_id, limit, cursor)
+        return await self._async_history.list_conversations(user_id, limit=limit, cursor=cursor)
+
+    async def warm_up(self):
+        # boto3 loads the service model when the resource is first built
+        await asyncio.to_thread(dynamodb.get_table)
+        await asyncio.to_thread(dynamodb.get_conversations_table)
+        if self._async_history is not None:
+            await self._async_history.open()
+
+    async def aclose(self):
+        if self._async_history is not None:
+            await self._async_history.close()
+
+
+SQLITE_SCHEMA = [
+    # Same access paths as DynamoDB: the primary key plays the role of the
+    # (userId, conversationOrder) index and idx_conversations_recent of (userId, last_activity)
+    """
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        user_id TEXT NOT NULL,
+        conversation_id TEXT NOT NULL,
+        sequence INTEGER NOT NULL,
+        conversation_date TEXT,
+        role TEXT,
+        message_content TEXT,
+        expiration_time INTEGER,
+        PRIMARY KEY (user_id, conversation_id, sequence)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_conversations (
+        user_id TEXT NOT NULL,
+        conversation_id TEXT NOT NULL,
+        conversation_date TEXT,
+        title TEXT,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        last_activity TEXT,
+        expiration_time INTEGER,
+        PRIMARY KEY (user_id, conversation_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_conversations_recent ON chat_conversations(user_id, last_activity)",
+]
+
+UPSERT_MESSAGE_SQL = """
+INSERT INTO chat_messages (user_id, conversation_id, sequence, conversation_date, role, message_content, expiration_time)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, conversation_id, sequence) DO UPDATE SET
+    conversation_date = excluded.conversation_date, role = excluded.role,
+    message_content = excluded.message_content, expiration_time = excluded.expiration_time
+"""
+
+# Mirrors upsert_conversation_header: date and title are set once, message_count only grows
+UPSERT_HEADER_SQL = """
+INSERT INTO chat_conversations (user_id, conversation_id, conversation_date, title, message_count, last_activity, expiration_time)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, conversation_id) DO UPDATE SET
+    title = coalesce(title, excluded.title),
+    message_count = excluded.message_count,
+    last_activity = excluded.last_activity,
+    expiration_time = excluded.expiration_time
+WHERE excluded.message_count > chat_conversations.message_count
+"""
+
+
+class SQLiteChatStore(ChatStore):
+    """
+    Embedded chat history in a single SQLite file, for running the API, tests and
+    benchmarks without AWS. One connection is shared by every thread behind a lock.
+    """
+
+    def __init__(self, path: str = "chat_history.db"):
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in SQLITE_SCHEMA:
+                self._conn.execute(statement)
+
+    def insert_many(self, jobs: List[WriteJob]) -> List[WriteJob]:
+        message_rows, header_rows = [], []
+        for user_id, conversation_id, messages, now in jobs:
+            expiration_time = int((now + CONVERSATION_TTL).timestamp())
+            for idx, msg in enumerate(messages):
+                message_rows.append((
+                    user_id, conversation_id, msg.get("sequence", idx),
+                    msg.get("timestamp", now.isoformat()), msg.get("sender", "unknown"),
+                    msg.get("text", ""), expiration_time,
+                ))
+            header_rows.append((
+                user_id, conversation_id,
+                messages[0].get("timestamp", now.isoformat()) if messages else now.isoformat(),
+                conversation_title(messages), message_count(messages), now.isoformat(), expiration_time,
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(UPSERT_MESSAGE_SQL, message_rows)
+            self._conn.executemany(UPSERT_HEADER_SQL, header_rows)
+        return []
+
+    def get_conversation(self, user_id: str, conversation_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM chat_messages WHERE user_id = ? AND conversation_id = ? ORDER BY sequence",
+                (user_id, conversation_id),
+            ).fetchall()
+        return [
+            {
+                "userId": row["user_id"],
+                "conversationId": row["conversation_id"],
+                "messageId": conversation_order_key(row["conversation_id"], row["sequence"]),
+                "conversation_date": row["conversation_date"],
+                "role": row["role"],
+                "message_content": row["message_content"],
+                "order": row["sequence"],
+                "conversationOrder": conversation_order_key(row["conversation_id"], row["sequence"]),
+                "expirationTime": row["expiration_time"],
+            }
+            for row in rows
+        ]
+
+    def list_conversations(self, user_id: str, limit: int = 50,
+                           cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        # Keyset pagination on (last_activity, conversation_id), like LastEvaluatedKey
+        query = "SELECT * FROM chat_conversations WHERE user_id = ?"
+        params: list = [user_id]
+        start_key = decode_cursor(cursor)
+        if start_key:
+            query += " AND (last_activity, conversation_id) < (?, ?)"
+            params += [start_key["last_activity"], start_key["conversationId"]]
+        query += " ORDER BY last_activity DESC, conversation_id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        conversations = [
+            {
+                "conversationId": row["conversation_id"],
+                "conversation_date": format_conversation_date(row["conversation_date"]),
+                "title": row["title"] or "Conversación",
+                "message_count": row["message_count"],
+                "last_activity": row["last_activity"],
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = conversations[-1]
+            next_cursor = encode_cursor({"last_activity": last["last_activity"],
+                                         "conversationId": last["conversationId"]})
+        return conversations, next_cursor
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+CHAT_STORES = {
+    "dynamodb": lambda: DynamoChatStore(),
+    "sqlite": lambda: SQLiteChatStore(os.getenv("CHAT_SQLITE_PATH", "chat_history.db")),
+}
+
+
+@lru_cache(maxsize=None)
+def get_chat_store() -> ChatStore:
+    """Chat store selected by CHAT_STORE (dynamodb by default, or sqlite)"""
+    name = os.getenv("CHAT_STORE", "dynamodb").lower()
+    if name not in CHAT_STORES:
+        raise ValueError(f"CHAT_STORE desconocido: {name} (opciones: {', '.join(CHAT_STORES)})")
+    return CHAT_STORES[name]()
@@ -0,0 +1,203 @@
+import json
+import os
+import queue
+import time
+from datetime import datetime, timezone
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+
+from chat_store import ChatStore, WriteJob, get_chat_store
+from dynamodb import BATCH_WRITE_LIMIT
+
+
+class ChatWriteBehind:
+    """
+    In-process write-behind queue for chat history.
+
+    submit() returns immediately; a background thread coalesces every pending
+    conversation into store.insert_many() calls of up to 25 messages (with DynamoDB,
+    one BatchWriteItem call each, followed by the header updates).
+    Messages still unwritten after the store's retries are appended to a dead-letter
+    file (CHAT_DEAD_LETTER_PATH) and written again when the next writer starts.
+    shutdown() drains whatever is still queued.
+    """
+
+    def __init__(self, store: Optional[ChatStore] = None, max_pending_items: int = 10000, max_wait: float = 0.2,
+                 dead_letter_path: Optional[str] = None):
+        self._store = store  # Defaults to get_chat_store(), resolved on the first flush
+        # Bounded by pending messages (see submit), not by jobs: one job can carry a whole conversation
+        self.jobs: "queue.Queue" = queue.Queue()
+        self.max_pending_items = max_pending_items
+        self.max_wait = max_wait
+        self.dead_letter_path = dead_letter_path or os.getenv("CHAT_DEAD_LETTER_PATH", "chat_dead_letter.jsonl")
+        self.thread = None
+        self.is_active = False
+        self.lock = Lock()
+        self.pending_items = 0
+        self.written_items = 0
+        self.failed_items = 0
+        self.dead_letter_items = 0
+        self.replayed_items = 0
+        self.batches = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        if self.thread is None:
+            self.is_active = True
+            self.thread = Thread(target=self._run, name="chat-write-behind", daemon=True)
+            self.thread.start()
+
+    def submit(self, user_id: str, conversation_id: str, messages: List[Dict[str, str]]):
+        """Queue a conversation for persistence. Raises queue.Full when max_pending_items messages are waiting"""
+        with self.lock:
+            if self.pending_items and self.pending_items + len(messages) > self.max_pending_items:
+                raise queue.Full
+            self.pending_items += len(messages)
+        self.jobs.put_nowait((user_id, conversation_id, messages, datetime.now(timezone.utc)))
+
+    def _drain(self, first_job) -> list:
+        """Collect queued jobs until there is at least one full batch or max_wait has elapsed"""
+        jobs = [first_job]
+        item_count = len(first_job[2])
+        deadline = time.monotonic() + self.max_wait
+        while item_count < BATCH_WRITE_LIMIT:
+            try:
+                job = self.jobs.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if job is None:
+                self.jobs.put(None)  # Keep the shutdown signal for the main loop
+                break
+            jobs.append(job)
+            item_count += len(job[2])
+        # Take everything else already waiting, so large backlogs are written in full batches
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self.jobs.put(None)
+                break
+            jobs.append(job)
+        return jobs
+
+    @staticmethod
+    def _batches(jobs: list):
+        """Split the jobs into groups of up to BATCH_WRITE_LIMIT messages (a larger job is a group on its own)"""
+        batch, item_count = [], 0
+        for job in jobs:
+            if batch and item_count + len(job[2]) > BATCH_WRITE_LIMIT:
+                yield batch
+                batch, item_count = [], 0
+            batch.append(job)
+            item_count += len(job[2])
+        if batch:
+            yield batch
+
+    def _flush(self, jobs: list):
+        start = time.perf_counter()
+        item_count = sum(len(job[2]) for job in jobs)
+        failed_jobs, batches = [], 0
+        for batch in self._batches(jobs):
+            batches += 1
+            try:
+                failed_jobs += (self._store or get_chat_store()).insert_many(batch)
+            except Exception as e:
+                # Only this batch is lost for now; the others are still written
+                print(f"❌ Error guardando mensajes del historial: {str(e)}")
+                failed_jobs += batch
+        failed = sum(len(job[2]) for job in failed_jobs)
+        if failed_jobs:
+            self._dead_letter(failed_jobs)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.pending_items -= item_count
+            self.written_items += item_count - failed
+            self.failed_items += failed
+            self.batches += batches
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.total_flush_ms += elapsed_ms
+
+    def _dead_letter(self, jobs: List[WriteJob]):
+        """Append the unwritten messages to the dead-letter file, one conversation per line"""
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for user_id, conversation_id, messages, now in jobs:
+                    f.write(json.dumps({"userId": user_id, "conversationId": conversation_id,
+                                        "messages": messages, "now": now.isoformat()}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"❌ No se pudieron guardar los mensajes fallidos en {self.dead_letter_path}: {str(e)}")
+            return
+        with self.lock:
+            self.dead_letter_items += sum(len(job[2]) for job in jobs)
+
+    def _replay_dead_letters(self):
+        """
+        Write again the messages dead-lettered by earlier runs. The file is renamed first, so
+        what fails again goes to a new dead-letter file; a replay interrupted by a crash is
+        retried on the next start (the writes are idempotent)
+        """
+        replay_path = self.dead_letter_path + ".replay"
+        if os.path.exists(self.dead_letter_path) and not os.path.exists(replay_path):
+            os.replace(self.dead_letter_path, replay_path)
+        if not os.path.exists(replay_path):
+            return
+        with open(replay_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        jobs = [(record["userId"], record["conversationId"], record["messages"],
+                 datetime.fromisoformat(record["now"])) for record in records]
+        if jobs:
+            item_count = sum(len(job[2]) for job in jobs)
+            with self.lock:
+                self.pending_items += item_count
+            self._flush(jobs)
+            with self.lock:
+                self.replayed_items += item_count
+        os.remove(replay_path)
+
+    def _run(self):
+        try:
+            self._replay_dead_letters()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Error reenviando los mensajes fallidos de {self.dead_letter_path}: {str(e)}")
+        while True:
+            try:
+                job = self.jobs.get(timeout=1)
+            except queue.Empty:
+                if not self.is_active:
+                    break
+                continue
+            if job is None:  # Shutdown signal, everything before it has been flushed
+                break
+            self._flush(self._drain(job))
+
+    def shutdown(self, timeout: float = 30):
+        """Flush every queued conversation and stop the background thread"""
+        if self.thread is None:
+            return
+        self.is_active = False
+        self.jobs.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "queue_depth": self.jobs.qsize(),
+                "pending_items": self.pending_items,
+                "written_items": self.written_items,
+                "failed_items": self.failed_items,
+                "dead_letter_items": self.dead_letter_items,
+                "replayed_items": self.replayed_items,
+                "batches": self.batches,
+                "flushes": self.flushes,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+                "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            }
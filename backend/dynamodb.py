@@ -1,25 +1,129 @@
+import base64
 import boto3
+import gzip
+import json
 import os
+import random
+import time
 import uuid
-from dotenv import load_dotenv
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import Binary
 
-# Cargar variables de entorno
-load_dotenv()
+try:
+    import zstandard
+except ImportError:  # Opcional: sin zstandard se comprime con gzip
+    zstandard = None
 
-# Conexión con DynamoDB
-dynamodb = boto3.resource(
-    "dynamodb",
-    region_name=os.getenv("AWS_DYNAMO_REGION"),
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-)
-
-# Obtener la tabla de DynamoDB
+# Tabla de DynamoDB con los mensajes
 TABLE_NAME = "chat_history"
-table = dynamodb.Table(TABLE_NAME)
+
+# Índice secundario global (userId, conversationOrder) para leer una conversación ya ordenada
+# sin recorrer todo el historial del usuario. Se crea con dynamodb_setup.py
+CONVERSATION_INDEX = "userId-conversationOrder-index"
+
+
+# Tabla de cabeceras: un ítem por conversación (PK userId, SK conversationId) con título, número de
+# mensajes y última actividad. El índice (userId, last_activity) lista las conversaciones recientes primero
+CONVERSATIONS_TABLE_NAME = "chat_conversations"
+RECENT_CONVERSATIONS_INDEX = "userId-lastActivity-index"
+
+# Máximo de ítems por llamada a BatchWriteItem
+BATCH_WRITE_LIMIT = 25
+
+# Longitud máxima del título, tomado del primer mensaje del usuario
+TITLE_MAX_LENGTH = 80
+
+
+# Compresión de message_content: los textos de más de CHAT_COMPRESSION_THRESHOLD bytes se guardan
+# comprimidos como Binary, con content_encoding indicando el formato. Los ítems sin marcador
+# (todos los anteriores) siguen siendo texto plano
+def compression_settings() -> Tuple[int, str]:
+    """Umbral (bytes) y códec de compresión, leídos del entorno al usarlos y no al importar"""
+    return (int(os.getenv("CHAT_COMPRESSION_THRESHOLD", "1024")),
+            os.getenv("CHAT_COMPRESSION_CODEC", "zstd" if zstandard else "gzip"))
+
+
+def compress_content(text: str, codec: str = None) -> Tuple[object, Optional[str]]:
+    """
+    Comprime el texto si supera el umbral y el resultado es más pequeño.
+
+    :return: (valor a guardar en message_content, content_encoding o None si va en claro)
+    """
+    threshold, default_codec = compression_settings()
+    codec = codec or default_codec
+    raw = text.encode("utf-8")
+    if codec == "none" or len(raw) < threshold:
+        return text, None
+    if codec == "zstd" and zstandard:
+        compressed = zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        codec = "gzip"
+        compressed = gzip.compress(raw, compresslevel=6, mtime=0)
+    if len(compressed) >= len(raw):
+        return text, None
+    return Binary(compressed), codec
+
+
+def decompress_content(value, encoding: Optional[str]) -> str:
+    """Inversa de compress_content; acepta texto plano de ítems sin content_encoding"""
+    if not encoding:
+        return value
+    data = value.value if isinstance(value, Binary) else bytes(value)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Mensaje comprimido con zstd y el paquete zstandard no está instalado")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if encoding == "gzip":
+        return gzip.decompress(data).decode("utf-8")
+    raise ValueError(f"content_encoding desconocido: {encoding}")
+
+
+def decode_message_item(item: Dict) -> Dict:
+    """Devuelve el ítem con message_content como texto, quitando el marcador de compresión"""
+    encoding = item.pop("content_encoding", None)
+    if encoding:
+        item["message_content"] = decompress_content(item.get("message_content"), encoding)
+    return item
+
+
+def connection_options() -> Dict[str, Optional[str]]:
+    """
+    Región, credenciales y endpoint de DynamoDB, comunes al cliente síncrono y al asíncrono.
+    AWS_DYNAMO_ENDPOINT_URL permite apuntar a un sustituto local (DynamoDB Local, moto_server)
+    """
+    return {
+        "region_name": os.getenv("AWS_DYNAMO_REGION"),
+        "aws_access_key_id": os.getenv("AWS_ACCESS_KEY_ID"),
+        "aws_secret_access_key": os.getenv("AWS_SECRET_ACCESS_KEY"),
+        "endpoint_url": os.getenv("AWS_DYNAMO_ENDPOINT_URL") or None,
+    }
+
+
+@lru_cache(maxsize=None)
+def get_dynamodb():
+    """
+    Conexión con DynamoDB, creada en el primer uso: importar este módulo no
+    necesita credenciales de AWS (p. ej. con CHAT_STORE=sqlite)
+    """
+    return boto3.resource("dynamodb", **connection_options())
+
+
+@lru_cache(maxsize=None)
+def get_table():
+    return get_dynamodb().Table(TABLE_NAME)
+
+
+@lru_cache(maxsize=None)
+def get_conversations_table():
+    return get_dynamodb().Table(CONVERSATIONS_TABLE_NAME)
+
+
+def conversation_order_key(conversation_id: str, order: int) -> str:
+    """Clave de ordenación 'conversationId#000012': agrupa los mensajes de una conversación y los ordena"""
+    return f"{conversation_id}#{order:06d}"
 
 # def insert_chat_messages(user_id: str, conversation_id: str, messages: List[Dict[str, str]]):
 #     """
@@ -53,85 +157,270 @@ table = dynamodb.Table(TABLE_NAME)
 #     except Exception as e:
 #         print(f"❌ Error guardando la conversación en DynamoDB: {str(e)}")
 
+def build_message_items(user_id: str, conversation_id: str, messages: List[Dict[str, str]],
+                        now: datetime, expiration_time: int) -> List[Dict]:
+    """
+    Convierte los mensajes de una conversación en ítems de chat_history.
+    Cada mensaje usa su 'sequence' (o su posición en la lista) como orden, y el messageId se
+    deriva de (conversationId, orden): reescribir un mensaje ya guardado sobrescribe el mismo ítem.
+    """
+    items = []
+    for idx, msg in enumerate(messages):
+        order = msg.get("sequence", idx)
+        content, encoding = compress_content(msg.get("text", ""))
+        item = {
+            "userId": user_id,
+            "conversationId": conversation_id,
+            "messageId": conversation_order_key(conversation_id, order),
+            "conversation_date": msg.get("timestamp", now.isoformat()),
+            "role": msg.get("sender", "unknown"),
+            "message_content": content,
+            "order": order,
+            "conversationOrder": conversation_order_key(conversation_id, order),
+            "expirationTime": expiration_time  # Se usará para TTL
+        }
+        if encoding:
+            item["content_encoding"] = encoding
+        items.append(item)
+    return items
+
+
+def message_count(messages: List[Dict[str, str]]) -> int:
+    """Número de mensajes de la conversación hasta el último de la lista (secuencia máxima + 1)"""
+    return max((msg.get("sequence", idx) for idx, msg in enumerate(messages)), default=-1) + 1
+
+
+def batch_write_items(items: List[Dict], max_retries: int = 5, base_delay: float = 0.05) -> List[Dict]:
+    """
+    Escribe los ítems con BatchWriteItem en lotes de 25 (el máximo de DynamoDB),
+    reintentando los UnprocessedItems con backoff exponencial y jitter.
+
+    :return: Ítems que siguen sin escribirse tras agotar los reintentos
+    """
+    client = get_dynamodb().meta.client
+    # BatchWriteItem rechaza claves repetidas en una misma llamada: si un mismo mensaje se
+    # reenvía antes de escribirse, se queda la última versión
+    items = list({(item["userId"], item["messageId"]): item for item in items}.values())
+    failed = []
+    for start in range(0, len(items), BATCH_WRITE_LIMIT):
+        requests = [{"PutRequest": {"Item": item}} for item in items[start:start + BATCH_WRITE_LIMIT]]
+        for attempt in range(max_retries + 1):
+            response = client.batch_write_item(RequestItems={TABLE_NAME: requests})
+            requests = response.get("UnprocessedItems", {}).get(TABLE_NAME, [])
+            if not requests:
+                break
+            if attempt < max_retries:
+                time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+        failed.extend(request["PutRequest"]["Item"] for request in requests)
+    return failed
+
+
 def insert_chat_messages(user_id: str, conversation_id: str, messages: List[Dict[str, str]]):
     """
     Guarda múltiples mensajes en DynamoDB, con un tiempo de expiración automático.
     """
-    print("Guardando con TTL activado")
     try:
-        existing_message_ids = set()
         now = datetime.now(timezone.utc)
         expiration_time = int((now + timedelta(days=30)).timestamp())  # Conversaciones expiran en 30 días
 
-        with table.batch_writer() as batch:
-            for idx, msg in enumerate(messages):
-                message_id = str(uuid.uuid4())
-                while message_id in existing_message_ids:
-                    message_id = str(uuid.uuid4())
-
-                existing_message_ids.add(message_id)
-
-                item = {
-                    "userId": user_id,
-                    "conversationId": conversation_id,
-                    "messageId": message_id,
-                    "conversation_date": msg.get("timestamp", now.isoformat()),
-                    "role": msg.get("sender", "unknown"),
-                    "message_content": msg.get("text", ""),
-                    "order": idx,
-                    "expirationTime": expiration_time  # Se usará para TTL
-                }
-                batch.put_item(Item=item)
-                print(f"✅ Mensaje insertado: {item}")
-
-        print("✅ Conversación guardada con TTL en DynamoDB correctamente")
+        failed = batch_write_items(build_message_items(user_id, conversation_id, messages, now, expiration_time))
+        if failed:
+            print(f"❌ {len(failed)} mensajes de la conversación {conversation_id} no se pudieron guardar")
+
+        upsert_conversation_header(user_id, conversation_id, messages, now, expiration_time)
     except Exception as e:
         print(f"❌ Error guardando la conversación en DynamoDB: {str(e)}")
 
 
+def conversation_title(messages: List[Dict[str, str]]) -> Optional[str]:
+    """Título de la conversación: el primer mensaje del usuario, recortado (None si no hay ninguno)"""
+    for msg in messages:
+        text = (msg.get("text") or "").strip()
+        if msg.get("sender") == "user" and text:
+            return text if len(text) <= TITLE_MAX_LENGTH else text[:TITLE_MAX_LENGTH - 1] + "…"
+    return None
+
+
+def upsert_conversation_header(user_id: str, conversation_id: str, messages: List[Dict[str, str]],
+                               now: datetime, expiration_time: int):
+    """
+    Crea o actualiza la cabecera de la conversación. La fecha y el título se fijan en
+    la primera escritura que los trae; el número de mensajes solo crece, de modo que
+    reenviar mensajes ya guardados (o recibirlos desordenados) no lo hace retroceder.
+    """
+    update_expression = (
+        "SET conversation_date = if_not_exists(conversation_date, :date), "
+        "message_count = :count, last_activity = :now, expirationTime = :exp"
+    )
+    values = {
+        ":date": messages[0].get("timestamp", now.isoformat()) if messages else now.isoformat(),
+        ":count": message_count(messages),
+        ":now": now.isoformat(),
+        ":exp": expiration_time,
+    }
+    title = conversation_title(messages)
+    if title:
+        update_expression += ", title = if_not_exists(title, :title)"
+        values[":title"] = title
+
+    try:
+        get_conversations_table().update_item(
+            Key={"userId": user_id, "conversationId": conversation_id},
+            UpdateExpression=update_expression,
+            ConditionExpression="attribute_not_exists(message_count) OR message_count < :count",
+            ExpressionAttributeValues=values,
+        )
+    except get_conversations_table().meta.client.exceptions.ConditionalCheckFailedException:
+        # Reintento de mensajes ya contabilizados: la cabecera ya está al día
+        pass
+
+
 def get_chat_history(user_id: str) -> List[Dict]:
     """
     Obtiene el historial de una conversación específica de un usuario.
     """
     try:
-        response = table.query(
+        response = get_table().query(
             KeyConditionExpression="userId = :user_id",
             ExpressionAttributeValues={
                 ":user_id": user_id,
             }
         )
-        return response.get("Items", [])
+        return [decode_message_item(item) for item in response.get("Items", [])]
     except Exception as e:
         print(f"❌ Error obteniendo historial de chat: {str(e)}")
         return []
     
 
-def get_conversations(user_id: str) -> List[Dict]:
+def get_conversation_messages(user_id: str, conversation_id: str, page_size: int = 100) -> List[Dict]:
     """
-    Obtiene los IDs únicos de las conversaciones de un usuario en DynamoDB.
+    Obtiene los mensajes de una conversación, ya ordenados, consultando el índice
+    CONVERSATION_INDEX: las unidades de lectura dependen solo del tamaño de esa conversación.
+    Pagina con LastEvaluatedKey hasta leerla entera. Los mensajes guardados antes de existir
+    conversationOrder se migran con dynamodb_setup.py (backfill_conversation_order).
+
+    :raises RuntimeError: Si hay mensajes comprimidos con zstd y zstandard no está instalado
     """
     try:
-        response = table.query(
-            KeyConditionExpression=Key("userId").eq(user_id),
-            ProjectionExpression="conversationId, conversation_date"
-        )
+        items = []
+        query_kwargs = conversation_query_kwargs(user_id, conversation_id, page_size)
+        while True:
+            response = get_table().query(**query_kwargs)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                break
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    except Exception as e:
+        print(f"❌ Error obteniendo mensajes de la conversación: {str(e)}")
+        return []
+    # Fuera del try: un mensaje que no se puede descomprimir es un error del servidor, no una conversación vacía
+    return [decode_message_item(item) for item in items]
+
+
+def conversation_query_kwargs(user_id: str, conversation_id: str, page_size: int = 100) -> Dict:
+    """Consulta al índice CONVERSATION_INDEX con los mensajes de una conversación"""
+    return {
+        "IndexName": CONVERSATION_INDEX,
+        "KeyConditionExpression": Key("userId").eq(user_id)
+        & Key("conversationOrder").begins_with(f"{conversation_id}#"),
+        "Limit": page_size,
+    }
+
 
-        # Extraer IDs únicos de las conversaciones
+def encode_cursor(last_evaluated_key: Optional[Dict]) -> Optional[str]:
+    """Cursor opaco para el cliente a partir de LastEvaluatedKey"""
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict]:
+    """
+    Inversa de encode_cursor.
+
+    :raises ValueError: Si el cursor no es un LastEvaluatedKey de la lista de conversaciones
+    """
+    if not cursor:
+        return None
+    key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    if not isinstance(key, dict) or not all(isinstance(key.get(field), str)
+                                            for field in ("last_activity", "conversationId")):
+        raise ValueError("Cursor no válido")
+    return key
+
+
+def format_conversation_date(iso_date: str) -> str:
+    return datetime.strptime(iso_date[:16], "%Y-%m-%dT%H:%M").strftime("%d/%m/%Y %H:%M")
+
+
+def list_conversations(user_id: str, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Lista las cabeceras de conversación de un usuario, de la más reciente a la más antigua.
+    Solo lee cabeceras, así que el coste no depende del número de mensajes guardados.
+
+    :return: (conversaciones de la página, cursor de la página siguiente o None)
+    """
+    query_kwargs = recent_conversations_query_kwargs(user_id, limit, cursor)
+    try:
+        response = get_conversations_table().query(**query_kwargs)
+    except get_dynamodb().meta.client.exceptions.ResourceNotFoundException:
+        # Tabla de cabeceras aún no creada (dynamodb_setup.py)
+        return get_conversations(user_id), None
+    # Las conversaciones anteriores a las cabeceras las crea dynamodb_setup.py (backfill_conversation_headers)
+    conversations = [format_conversation_header(header) for header in response.get("Items", [])]
+    return conversations, encode_cursor(response.get("LastEvaluatedKey"))
+
+
+def recent_conversations_query_kwargs(user_id: str, limit: int, cursor: Optional[str]) -> Dict:
+    """Consulta al índice RECENT_CONVERSATIONS_INDEX: una página de cabeceras, las recientes primero"""
+    query_kwargs = {
+        "IndexName": RECENT_CONVERSATIONS_INDEX,
+        "KeyConditionExpression": Key("userId").eq(user_id),
+        "ScanIndexForward": False,
+        "Limit": limit,
+    }
+    start_key = decode_cursor(cursor)
+    if start_key:
+        query_kwargs["ExclusiveStartKey"] = start_key
+    return query_kwargs
+
+
+def format_conversation_header(header: Dict) -> Dict:
+    return {
+        "conversationId": header["conversationId"],
+        "conversation_date": format_conversation_date(header["conversation_date"]),
+        "title": header.get("title", "Conversación"),
+        "message_count": int(header.get("message_count", 0)),
+        "last_activity": header.get("last_activity"),
+    }
+
+
+def get_conversations(user_id: str) -> List[Dict]:
+    """
+    Obtiene los IDs únicos de las conversaciones de un usuario en DynamoDB,
+    a partir de los mensajes (conversaciones guardadas antes de existir las cabeceras).
+    """
+    try:
+        # Extraer IDs únicos de las conversaciones, recorriendo todas las páginas
         unique_conversations = {}
-        
-        for conv in response.get("Items", []):
-            conv_id = conv["conversationId"]
-            if conv_id not in unique_conversations:
-                unique_conversations[conv_id] = datetime.strptime(conv["conversation_date"][:16], "%Y-%m-%dT%H:%M").strftime("%d/%m/%Y %H:%M")
-
-        # Convertimos a lista de diccionarios
-        conversations = [
-            {"conversationId": conv_id, "conversation_date": conv_date}
-            for conv_id, conv_date in unique_conversations.items()
-        ]
+        query_kwargs = {
+            "KeyConditionExpression": Key("userId").eq(user_id),
+            "ProjectionExpression": "conversationId, conversation_date",
+        }
+        while True:
+            response = get_table().query(**query_kwargs)
+            for conv in response.get("Items", []):
+                unique_conversations.setdefault(conv["conversationId"], conv["conversation_date"])
+            if "LastEvaluatedKey" not in response:
+                break
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
-        return conversations
+        # Convertimos a lista de diccionarios, de la más reciente a la más antigua
+        return [
+            {"conversationId": conv_id, "conversation_date": format_conversation_date(conv_date)}
+            for conv_id, conv_date in sorted(unique_conversations.items(), key=lambda c: c[1], reverse=True)
+        ]
 
     except Exception as e:
         print(f"❌ Error obteniendo historial de conversaciones: {str(e)}")
-        return []
\ No newline at end of file
+        return []
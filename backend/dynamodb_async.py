@@ -0,0 +1,85 @@
+import asyncio
+import importlib.util
+import os
+from contextlib import AsyncExitStack
+from typing import Dict, List, Optional, Tuple
+
+from botocore.config import Config
+
+from dynamodb import (TABLE_NAME, CONVERSATIONS_TABLE_NAME, connection_options, conversation_query_kwargs,
+                      decode_message_item, encode_cursor, format_conversation_header,
+                      get_conversations, recent_conversations_query_kwargs)
+
+# aioboto3 se importa en el primer uso (su importación cuesta más que la del resto del módulo).
+# Sin aioboto3, ChatStore ejecuta las lecturas síncronas en un hilo
+AIOBOTO3_AVAILABLE = importlib.util.find_spec("aioboto3") is not None
+
+
+class AsyncDynamoHistory:
+    """
+    Lecturas del historial con el cliente asíncrono de aioboto3, sin bloquear el event loop.
+    El recurso se abre en el primer uso y se reutiliza (con sus conexiones keep-alive)
+    hasta close(); las consultas son las mismas que las de dynamodb.py.
+    """
+
+    def __init__(self):
+        self._stack: Optional[AsyncExitStack] = None
+        self._resource = None
+        self._lock = asyncio.Lock()
+
+    async def _get_resource(self):
+        if self._resource is None:
+            async with self._lock:
+                if self._resource is None:
+                    import aioboto3
+
+                    stack = AsyncExitStack()
+                    # Conexiones HTTP abiertas a DynamoDB que comparten todas las peticiones del worker
+                    config = Config(max_pool_connections=int(os.getenv("AWS_DYNAMO_MAX_CONNECTIONS", "50")),
+                                    tcp_keepalive=True)
+                    self._resource = await stack.enter_async_context(
+                        aioboto3.Session().resource("dynamodb", config=config, **connection_options())
+                    )
+                    self._stack = stack
+        return self._resource
+
+    async def _query_all(self, table_name: str, query_kwargs: Dict) -> List[Dict]:
+        table = await (await self._get_resource()).Table(table_name)
+        items = []
+        while True:
+            response = await table.query(**query_kwargs)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    async def get_conversation_messages(self, user_id: str, conversation_id: str, page_size: int = 100) -> List[Dict]:
+        """Equivalente asíncrono de dynamodb.get_conversation_messages"""
+        try:
+            items = await self._query_all(TABLE_NAME, conversation_query_kwargs(user_id, conversation_id, page_size))
+        except Exception as e:
+            print(f"❌ Error obteniendo mensajes de la conversación: {str(e)}")
+            return []
+        return [decode_message_item(item) for item in items]
+
+    async def list_conversations(self, user_id: str, limit: int = 50,
+                                 cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Equivalente asíncrono de dynamodb.list_conversations"""
+        resource = await self._get_resource()
+        table = await resource.Table(CONVERSATIONS_TABLE_NAME)
+        try:
+            response = await table.query(**recent_conversations_query_kwargs(user_id, limit, cursor))
+        except resource.meta.client.exceptions.ResourceNotFoundException:
+            return await asyncio.to_thread(get_conversations, user_id), None
+        headers = response.get("Items", [])
+        return [format_conversation_header(header) for header in headers], encode_cursor(response.get("LastEvaluatedKey"))
+
+    async def open(self):
+        """Abre el recurso y su pool de conexiones antes de la primera petición"""
+        await self._get_resource()
+
+    async def close(self):
+        if self._stack is not None:
+            await self._stack.aclose()
+            self._stack = None
+            self._resource = None
@@ -0,0 +1,184 @@
+import logging
+
+from boto3.dynamodb.conditions import Attr
+from dotenv import load_dotenv
+
+from dynamodb import (get_dynamodb, get_table, get_conversations_table, conversation_order_key, conversation_title,
+                      decode_message_item, TABLE_NAME, CONVERSATION_INDEX, CONVERSATIONS_TABLE_NAME,
+                      RECENT_CONVERSATIONS_INDEX)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _throughput_options(description):
+    """Capacidad provisionada del índice igual a la de la tabla (nada si es bajo demanda)"""
+    if description.get("BillingModeSummary", {}).get("BillingMode") == "PAY_PER_REQUEST":
+        return {}
+    throughput = description["ProvisionedThroughput"]
+    return {"ProvisionedThroughput": {
+        "ReadCapacityUnits": throughput["ReadCapacityUnits"],
+        "WriteCapacityUnits": throughput["WriteCapacityUnits"],
+    }}
+
+
+def create_conversation_index():
+    """
+    Crea en chat_history el índice global (userId, conversationOrder), con proyección
+    completa, que usa get_conversation_messages para leer una conversación ordenada.
+    """
+    client = get_dynamodb().meta.client
+    description = client.describe_table(TableName=TABLE_NAME)["Table"]
+    existing = {index["IndexName"] for index in description.get("GlobalSecondaryIndexes", [])}
+    if CONVERSATION_INDEX in existing:
+        logger.info(f"El índice {CONVERSATION_INDEX} ya existe")
+        return
+
+    client.update_table(
+        TableName=TABLE_NAME,
+        AttributeDefinitions=[
+            {"AttributeName": "userId", "AttributeType": "S"},
+            {"AttributeName": "conversationOrder", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexUpdates=[{
+            "Create": {
+                "IndexName": CONVERSATION_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "userId", "KeyType": "HASH"},
+                    {"AttributeName": "conversationOrder", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+                **_throughput_options(description),
+            }
+        }],
+    )
+    logger.info(f"Índice {CONVERSATION_INDEX} en creación sobre {TABLE_NAME}")
+
+
+def create_conversations_table():
+    """
+    Crea la tabla de cabeceras de conversación (PK userId, SK conversationId), bajo demanda,
+    con el índice (userId, last_activity) para listar las recientes primero y TTL en expirationTime.
+    """
+    client = get_dynamodb().meta.client
+    if CONVERSATIONS_TABLE_NAME in client.list_tables()["TableNames"]:
+        logger.info(f"La tabla {CONVERSATIONS_TABLE_NAME} ya existe")
+        return
+
+    client.create_table(
+        TableName=CONVERSATIONS_TABLE_NAME,
+        BillingMode="PAY_PER_REQUEST",
+        AttributeDefinitions=[
+            {"AttributeName": "userId", "AttributeType": "S"},
+            {"AttributeName": "conversationId", "AttributeType": "S"},
+            {"AttributeName": "last_activity", "AttributeType": "S"},
+        ],
+        KeySchema=[
+            {"AttributeName": "userId", "KeyType": "HASH"},
+            {"AttributeName": "conversationId", "KeyType": "RANGE"},
+        ],
+        GlobalSecondaryIndexes=[{
+            "IndexName": RECENT_CONVERSATIONS_INDEX,
+            "KeySchema": [
+                {"AttributeName": "userId", "KeyType": "HASH"},
+                {"AttributeName": "last_activity", "KeyType": "RANGE"},
+            ],
+            "Projection": {"ProjectionType": "ALL"},
+        }],
+    )
+    client.get_waiter("table_exists").wait(TableName=CONVERSATIONS_TABLE_NAME)
+    client.update_time_to_live(
+        TableName=CONVERSATIONS_TABLE_NAME,
+        TimeToLiveSpecification={"Enabled": True, "AttributeName": "expirationTime"},
+    )
+    logger.info(f"Tabla {CONVERSATIONS_TABLE_NAME} creada")
+
+
+def _scan_all(table, **scan_kwargs):
+    """Recorre la tabla entera, página a página"""
+    while True:
+        response = table.scan(**scan_kwargs)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def backfill_conversation_order():
+    """
+    Añade conversationOrder a los mensajes guardados antes de existir, para que estén en
+    CONVERSATION_INDEX: get_conversation_messages ya no lee el historial completo del usuario.
+    Se puede repetir sin efecto sobre los mensajes ya migrados.
+    """
+    table = get_table()
+    updated = 0
+    for item in _scan_all(table, FilterExpression=Attr("conversationOrder").not_exists(),
+                          ProjectionExpression="userId, messageId, conversationId, #order",
+                          ExpressionAttributeNames={"#order": "order"}):
+        table.update_item(
+            Key={"userId": item["userId"], "messageId": item["messageId"]},
+            UpdateExpression="SET conversationOrder = :order_key",
+            ExpressionAttributeValues={
+                ":order_key": conversation_order_key(item["conversationId"], int(item["order"])),
+            },
+        )
+        updated += 1
+    logger.info(f"conversationOrder añadido a {updated} mensajes de {TABLE_NAME}")
+
+
+def backfill_conversation_headers():
+    """
+    Crea la cabecera de las conversaciones guardadas antes de existir chat_conversations, a
+    partir de sus mensajes, para que list_conversations las liste junto a las nuevas.
+    No modifica las cabeceras que ya existen, así que se puede repetir.
+    """
+    conversations = {}
+    for item in _scan_all(get_table()):
+        key = (item["userId"], item["conversationId"])
+        conversation = conversations.setdefault(key, {"first_date": item["conversation_date"],
+                                                      "last_date": item["conversation_date"],
+                                                      "count": 0, "expiration": 0, "first_user": None})
+        order = int(item["order"])
+        conversation["first_date"] = min(conversation["first_date"], item["conversation_date"])
+        conversation["last_date"] = max(conversation["last_date"], item["conversation_date"])
+        conversation["count"] = max(conversation["count"], order + 1)
+        conversation["expiration"] = max(conversation["expiration"], int(item.get("expirationTime", 0)))
+        # Para el título basta con el primer mensaje del usuario
+        if item.get("role") == "user" and (conversation["first_user"] is None or order < conversation["first_user"][0]):
+            conversation["first_user"] = (order, decode_message_item(item).get("message_content", ""))
+
+    table = get_conversations_table()
+    created = 0
+    for (user_id, conversation_id), conversation in conversations.items():
+        header = {
+            "userId": user_id,
+            "conversationId": conversation_id,
+            "conversation_date": conversation["first_date"],
+            "message_count": conversation["count"],
+            "last_activity": conversation["last_date"],
+        }
+        if conversation["expiration"]:
+            header["expirationTime"] = conversation["expiration"]
+        if conversation["first_user"]:
+            title = conversation_title([{"sender": "user", "text": conversation["first_user"][1]}])
+            if title:
+                header["title"] = title
+        try:
+            table.put_item(Item=header, ConditionExpression="attribute_not_exists(conversationId)")
+            created += 1
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+    logger.info(f"{created} cabeceras creadas en {CONVERSATIONS_TABLE_NAME} para {len(conversations)} conversaciones")
+
+
+def setup_dynamodb():
+    """Crea los índices y tablas que necesita el historial de chat y migra los mensajes anteriores"""
+    create_conversation_index()
+    create_conversations_table()
+    backfill_conversation_order()
+    backfill_conversation_headers()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_dynamodb()
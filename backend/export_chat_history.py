@@ -0,0 +1,272 @@
+"""
+Exporta chat_history a ficheros Parquet (zstd) particionados por fecha, para análisis.
+
+Recorre la tabla con un Scan segmentado en paralelo (un hilo por segmento) y escribe
+<salida>/conversation_date=AAAA-MM-DD/seg-SSSS-part-NNNNN.parquet. Cada segmento guarda
+en <salida>/_checkpoints su LastEvaluatedKey tras cada fichero escrito, de modo que una
+exportación interrumpida continúa donde se quedó al volver a lanzarla.
+
+    python export_chat_history.py --output chat_export --segments 8
+    python export_chat_history.py --endpoint-url http://localhost:8000   # DynamoDB Local / moto_server
+
+Requiere pyarrow, que no instala la API: pip install -r requirements-export.txt
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from boto3.dynamodb.types import Binary, TypeDeserializer
+from dotenv import load_dotenv
+
+from dynamodb import TABLE_NAME, connection_options, decompress_content
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+SCHEMA = pa.schema([
+    ("userId", pa.string()),
+    ("conversationId", pa.string()),
+    ("messageId", pa.string()),
+    ("conversation_date", pa.string()),
+    ("role", pa.string()),
+    ("message_content", pa.string()),
+    ("order", pa.int32()),
+    ("expirationTime", pa.int64()),
+])
+
+CHECKPOINT_DIR = "_checkpoints"
+CHECKPOINT_PATTERN = re.compile(r"^segment-(\d{4})-of-(\d{4})\.json$")
+DATE_COLUMN = "conversation_date"
+
+deserializer = TypeDeserializer()
+
+
+def item_to_row(raw_item: Dict) -> Dict:
+    """Ítem del cliente de bajo nivel (con tipos de DynamoDB) a fila plana, con el texto ya descomprimido"""
+    item = {key: deserializer.deserialize(value) for key, value in raw_item.items()}
+    content = item.get("message_content", "")
+    if item.get("content_encoding"):
+        content = decompress_content(content, item["content_encoding"])
+    elif isinstance(content, Binary):
+        content = content.value.decode("utf-8")
+    return {
+        "userId": item.get("userId"),
+        "conversationId": item.get("conversationId"),
+        "messageId": item.get("messageId"),
+        "conversation_date": item.get("conversation_date"),
+        "role": item.get("role"),
+        "message_content": content,
+        "order": int(item["order"]) if isinstance(item.get("order"), Decimal) else None,
+        "expirationTime": int(item["expirationTime"]) if isinstance(item.get("expirationTime"), Decimal) else None,
+    }
+
+
+def partition_of(row: Dict) -> str:
+    return (row.get(DATE_COLUMN) or "")[:10] or "unknown"
+
+
+class ExportProgress:
+    """Contadores compartidos por los segmentos, para informar del ritmo de exportación"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.items = 0
+        self.files = 0
+        self.start = time.perf_counter()
+
+    def add(self, items: int = 0, files: int = 0):
+        with self.lock:
+            self.items += items
+            self.files += files
+
+    def rate(self) -> float:
+        return self.items / max(time.perf_counter() - self.start, 1e-9)
+
+
+class SegmentExporter:
+    """Exporta un segmento del Scan. La memoria queda acotada a rows_per_file filas"""
+
+    def __init__(self, output: str, segment: int, total_segments: int, table: str,
+                 page_size: int, rows_per_file: int, progress: ExportProgress, endpoint_url: Optional[str]):
+        self.output = output
+        self.segment = segment
+        self.total_segments = total_segments
+        self.table = table
+        self.page_size = page_size
+        self.rows_per_file = rows_per_file
+        self.progress = progress
+        options = connection_options()
+        if endpoint_url:
+            options["endpoint_url"] = endpoint_url
+        # Los clientes de boto3 se pueden compartir entre hilos, pero cada segmento usa el suyo
+        self.client = boto3.session.Session().client("dynamodb", **options)
+        self.checkpoint_path = os.path.join(output, CHECKPOINT_DIR,
+                                            f"segment-{segment:04d}-of-{total_segments:04d}.json")
+
+    def load_checkpoint(self) -> Dict:
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                return json.load(f)
+        return {"last_evaluated_key": None, "part": 0, "items": 0, "done": False}
+
+    def save_checkpoint(self, checkpoint: Dict):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def write_files(self, rows: List[Dict], part: int) -> int:
+        """Escribe las filas en un fichero por partición de fecha; nombres deterministas para que reanudar sobrescriba"""
+        by_date = defaultdict(list)
+        for row in rows:
+            by_date[partition_of(row)].append(row)
+        for date, date_rows in by_date.items():
+            directory = os.path.join(self.output, f"{DATE_COLUMN}={date}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"seg-{self.segment:04d}-part-{part:05d}.parquet")
+            table = pa.Table.from_pylist(date_rows, schema=SCHEMA)
+            pq.write_table(table, f"{path}.tmp", compression="zstd")
+            os.replace(f"{path}.tmp", path)
+        return len(by_date)
+
+    def run(self) -> int:
+        checkpoint = self.load_checkpoint()
+        if checkpoint["done"]:
+            logger.info(f"Segmento {self.segment} ya exportado ({checkpoint['items']} ítems)")
+            return 0
+
+        scan_kwargs = {"TableName": self.table, "Segment": self.segment,
+                       "TotalSegments": self.total_segments, "Limit": self.page_size}
+        exported = 0
+        rows: List[Dict] = []
+        last_key = checkpoint["last_evaluated_key"]
+        while True:
+            if last_key:
+                scan_kwargs["ExclusiveStartKey"] = last_key
+            response = self.client.scan(**scan_kwargs)
+            rows.extend(item_to_row(item) for item in response.get("Items", []))
+            last_key = response.get("LastEvaluatedKey")
+
+            # Se escribe solo al final de una página, para que el checkpoint apunte justo tras lo escrito
+            if len(rows) >= self.rows_per_file or not last_key:
+                files = self.write_files(rows, checkpoint["part"]) if rows else 0
+                checkpoint.update(last_evaluated_key=last_key, part=checkpoint["part"] + 1,
+                                  items=checkpoint["items"] + len(rows), done=not last_key)
+                self.save_checkpoint(checkpoint)
+                self.progress.add(items=len(rows), files=files)
+                exported += len(rows)
+                rows = []
+            if not last_key:
+                return exported
+
+
+def report_progress(progress: ExportProgress, stop: Event, interval: float):
+    while not stop.wait(interval):
+        logger.info(f"{progress.items} ítems exportados ({progress.rate():.0f} ítems/s), {progress.files} ficheros")
+
+
+def check_layout(output: str, segments: int):
+    """
+    Comprueba que una exportación anterior en `output` se hizo con los mismos segmentos: los ficheros
+    seg-SSSS-part-NNNNN dependen del reparto del Scan, y reanudarla con otro dejaría filas duplicadas.
+
+    :raises ValueError: Si hay ficheros de una exportación con otro número de segmentos, o sin checkpoints
+    """
+    checkpoint_dir = os.path.join(output, CHECKPOINT_DIR)
+    names = os.listdir(checkpoint_dir) if os.path.isdir(checkpoint_dir) else []
+    layouts = {int(match.group(2)) for match in map(CHECKPOINT_PATTERN.match, names) if match}
+    if layouts and layouts != {segments}:
+        raise ValueError(f"{output} contiene una exportación con {', '.join(map(str, sorted(layouts)))} segmentos: "
+                         f"reanúdala con ese --segments o usa --restart para empezar de cero")
+    if not layouts and any(name.endswith(".parquet") for _, _, files in os.walk(output) for name in files):
+        raise ValueError(f"{output} contiene ficheros Parquet sin checkpoints: usa --restart o otro --output")
+
+
+def export_chat_history(output: str, segments: int = 8, workers: Optional[int] = None, table: str = TABLE_NAME,
+                        page_size: int = 1000, rows_per_file: int = 50000, endpoint_url: Optional[str] = None,
+                        restart: bool = False, report_interval: float = 10.0) -> Dict:
+    """
+    Exporta la tabla completa. Con restart=True se borran los ficheros y checkpoints de una exportación anterior.
+
+    :return: Ítems exportados en esta ejecución, ficheros, segundos e ítems/s
+    :raises ValueError: Si `output` tiene una exportación a medias con otro número de segmentos (ver check_layout)
+    """
+    checkpoint_dir = os.path.join(output, CHECKPOINT_DIR)
+    if not restart:
+        check_layout(output, segments)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    if restart:
+        for directory, _, names in os.walk(output):
+            for name in names:
+                if name.endswith(".parquet") or directory == checkpoint_dir:
+                    os.remove(os.path.join(directory, name))
+
+    progress = ExportProgress()
+    stop = Event()
+    reporter = Thread(target=report_progress, args=(progress, stop, report_interval), daemon=True)
+    reporter.start()
+
+    failed_segments = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers or segments) as executor:
+            futures = {
+                executor.submit(SegmentExporter(output, segment, segments, table, page_size,
+                                                rows_per_file, progress, endpoint_url).run): segment
+                for segment in range(segments)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed_segments.append(futures[future])
+                    logger.error(f"Error exportando el segmento {futures[future]}: {str(e)}")
+    finally:
+        stop.set()
+
+    elapsed = time.perf_counter() - progress.start
+    summary = {
+        "items": progress.items,
+        "files": progress.files,
+        "seconds": round(elapsed, 2),
+        "items_per_second": round(progress.items / elapsed, 1) if elapsed else 0.0,
+        "failed_segments": sorted(failed_segments),
+    }
+    logger.info(f"Exportación terminada: {summary}")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta chat_history a Parquet particionado por fecha")
+    parser.add_argument("--output", default="chat_export", help="Directorio de salida")
+    parser.add_argument("--segments", type=int, default=8, help="Segmentos del Scan paralelo")
+    parser.add_argument("--workers", type=int, default=None, help="Hilos (por defecto, uno por segmento)")
+    parser.add_argument("--table", default=TABLE_NAME)
+    parser.add_argument("--page-size", type=int, default=1000, help="Ítems por página del Scan")
+    parser.add_argument("--rows-per-file", type=int, default=50000, help="Filas en memoria por segmento antes de escribir")
+    parser.add_argument("--endpoint-url", default=None, help="Endpoint de DynamoDB (sustituto local)")
+    parser.add_argument("--restart", action="store_true", help="Ignora los checkpoints y exporta desde cero")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = parse_args()
+    try:
+        result = export_chat_history(args.output, segments=args.segments, workers=args.workers, table=args.table,
+                                     page_size=args.page_size, rows_per_file=args.rows_per_file,
+                                     endpoint_url=args.endpoint_url, restart=args.restart)
+    except ValueError as e:
+        sys.exit(str(e))
+    sys.exit(1 if result["failed_segments"] else 0)
@@ -0,0 +1,118 @@
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# Lower bounds of the budget bands used in cache keys. A query for a band returns
+# every grant at or above its lower bound; callers narrow it to the exact budget.
+BUDGET_BUCKETS = [0, 1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000,
+                  500_000, 1_000_000, 5_000_000, 10_000_000]
+
+
+def budget_bucket(amount: float) -> float:
+    """Return the lower bound of the budget band containing the amount"""
+    return BUDGET_BUCKETS[max(bisect_right(BUDGET_BUCKETS, amount) - 1, 0)]
+
+
+class GrantResultCache:
+    """
+    Thread-safe LRU cache of grant matching results, shared by all sessions of a worker.
+
+    Entries are tagged with the catalog version (row count and last update of the
+    grants table). The version is re-read at most every check_interval seconds and
+    the whole cache is dropped when it changes, i.e. after the ETL commits.
+    """
+
+    def __init__(self, max_entries: int = 256, check_interval: float = 30.0):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+        self._version = None
+        self._last_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._miss_seconds = 0.0
+
+    def _version_check_due(self) -> bool:
+        return time.monotonic() - self._last_check >= self.check_interval
+
+    def _apply_version(self, version: Any):
+        with self._lock:
+            self._last_check = time.monotonic()
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+    def _lookup(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+        return False, None
+
+    def _store(self, key: Hashable, value: Any, elapsed: float):
+        with self._lock:
+            self.misses += 1
+            self._miss_seconds += elapsed
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any],
+                    version_loader: Optional[Callable[[], Any]] = None) -> Any:
+        """Return the cached value for key, calling loader (and caching its result) on a miss"""
+        if version_loader and self._version_check_due():
+            self._apply_version(version_loader())
+
+        hit, value = self._lookup(key)
+        if hit:
+            return value
+
+        start = time.perf_counter()
+        value = loader()
+        self._store(key, value, time.perf_counter() - start)
+        return value
+
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                                version_loader: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """Coroutine counterpart of get_or_load, sharing the same entries and statistics"""
+        if version_loader and self._version_check_due():
+            self._apply_version(await version_loader())
+
+        hit, value = self._lookup(key)
+        if hit:
+            return value
+
+        start = time.perf_counter()
+        value = await loader()
+        self._store(key, value, time.perf_counter() - start)
+        return value
+
+    def invalidate(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit ratio and estimated DB time saved (hits x average miss latency)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_miss = self._miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "avg_db_ms": round(avg_miss * 1000, 2),
+                "saved_db_seconds": round(self.hits * avg_miss, 3),
+            }
@@ -0,0 +1,154 @@
+import json
+import math
+import os
+import re
+import unicodedata
+import zlib
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Read side of the grant vector index written by etl_fandit/embeddings.py.
+# HashingEmbedder.transform mirrors the ETL tokenisation; keep both in sync and
+# bump EMBEDDER_VERSION on both sides when it changes.
+
+EMBEDDER_VERSION = 1
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class HashingEmbedder:
+    """Query-side hashing TF-IDF projection, using the IDF weights stored with the index"""
+
+    def __init__(self, idf: np.ndarray, bigrams: bool = True):
+        self.idf = idf
+        self.dim = len(idf)
+        self.bigrams = bigrams
+
+    def transform(self, text: str) -> np.ndarray:
+        words = [w for w in _WORD_PATTERN.findall(_normalize(text)) if len(w) > 1]
+        tokens = list(words)
+        if self.bigrams:
+            tokens.extend(f"{a}_{b}" for a, b in zip(words, words[1:]))
+
+        counts: Dict[int, float] = {}
+        for token in tokens:
+            h = zlib.crc32(token.encode("utf-8"))
+            index = h % self.dim
+            counts[index] = counts.get(index, 0.0) + (1.0 if (h >> 31) & 1 else -1.0)
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for index, value in counts.items():
+            if value:
+                vector[index] = math.copysign(1 + math.log(abs(value)), value) * self.idf[index]
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class GrantVectorIndex:
+    """
+    Top-k cosine search over the memory-mapped grant embedding matrix.
+
+    Rows are L2-normalised, so cosine similarity is a single matrix-vector product.
+    When the ETL wrote an IVF partition, only the rows of the nprobe closest lists are scored.
+    """
+
+    def __init__(self, directory: str, nprobe: int = 16):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("embedder") != "hashing" or self.meta.get("version") != EMBEDDER_VERSION:
+            raise ValueError(f"Unsupported grant index embedder: {self.meta}")
+        # meta.json names the versioned subdirectory holding the files; older indexes kept them alongside
+        directory = os.path.join(directory, self.meta.get("ficheros", ""))
+
+        self.matrix = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "slugs.json"), encoding="utf-8") as f:
+            self.slugs: List[str] = json.load(f)
+        if len(self.slugs) != self.matrix.shape[0]:
+            raise ValueError("Grant index slugs and embeddings are out of sync")
+        self.positions = {slug: row for row, slug in enumerate(self.slugs)}
+
+        self.embedder = HashingEmbedder(
+            np.load(os.path.join(directory, "idf.npy")),
+            bigrams=self.meta.get("bigramas", True),
+        )
+
+        self.nprobe = nprobe
+        self.centroids = None
+        self.lists: List[np.ndarray] = []
+        if self.meta.get("ivf_listas"):
+            self.centroids = np.load(os.path.join(directory, "ivf_centroids.npy"))
+            assign = np.load(os.path.join(directory, "ivf_assign.npy"))
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+            self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+        probes = np.argsort(self.centroids @ query)[::-1][:self.nprobe]
+        return np.concatenate([self.lists[p] for p in probes])
+
+    def search(self, text: str, k: int = 15) -> List[Tuple[str, float]]:
+        """Return the k grants most similar to the text as (slug, cosine) pairs"""
+        query = self.embedder.transform(text)
+        rows = self._candidate_rows(query)
+        if rows is None:
+            scores = np.asarray(self.matrix @ query)
+        else:
+            rows = np.sort(rows)
+            scores = np.asarray(self.matrix[rows] @ query)
+
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ids = top if rows is None else rows[top]
+        return [(self.slugs[i], float(scores[j])) for i, j in zip(ids, top)]
+
+    def similarities(self, text: str, slugs: Iterable[str]) -> Dict[str, float]:
+        """Cosine similarity between the text and each given grant (0.0 if not indexed)"""
+        slugs = list(slugs)
+        rows = np.array(sorted({self.positions[s] for s in slugs if s in self.positions}), dtype=np.int64)
+        if not len(rows):
+            return {slug: 0.0 for slug in slugs}
+        scores = np.asarray(self.matrix[rows] @ self.embedder.transform(text))
+        by_row = dict(zip(rows.tolist(), scores.tolist()))
+        return {slug: by_row.get(self.positions.get(slug), 0.0) for slug in slugs}
+
+
+_index: Optional[GrantVectorIndex] = None
+_index_mtime: Optional[float] = None
+_index_lock = Lock()
+
+
+def get_vector_index() -> Optional[GrantVectorIndex]:
+    """
+    Shared index for the worker, reloaded when the ETL rewrites meta.json.
+    Returns None when no index has been generated yet.
+    """
+    global _index, _index_mtime
+    directory = os.getenv("GRANT_INDEX_DIR", "grant_index")
+    try:
+        mtime = os.path.getmtime(os.path.join(directory, "meta.json"))
+    except OSError:
+        return None
+
+    with _index_lock:
+        if _index is None or mtime != _index_mtime:
+            try:
+                _index = GrantVectorIndex(directory)
+                _index_mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not load grant vector index from '{directory}': {e}")
+                return _index
+        return _index
@@ -1,6 +1,6 @@
 # grants_bot.py
+from functools import lru_cache
 from typing import TypedDict, List, Dict, Optional
-from langgraph.graph import StateGraph, START, END
 from tools_aurora import find_optimal_grants, get_grant_detail
 from aws_connect import get_bedrock_response
 
@@ -14,6 +14,7 @@ class State(TypedDict):
     info_complete: bool
     find_grants: bool
     discuss_grant: bool
+    greeting_shown: bool
 
 class GrantsBot:
     def __init__(self):
@@ -21,36 +22,16 @@ class GrantsBot:
             ("Comunidad Autónoma", "Por favor, ¿podrías decirme en qué Comunidad Autónoma está el cliente ?"),
             ("Tipo de Empresa", "¿Cuál es el tipo de empresa? (Autónomo, PYME, Gran Empresa)"),
             ("Presupuesto del Proyecto", "¿Cuál es el presupuesto aproximado del proyecto?"),
+            ("Descripción del Proyecto", "Describe brevemente el proyecto (objetivo, sector, tipo de gasto) para priorizar las subvenciones más afines (opcional, responde \"no\" para omitirlo):"),
         ]
-        self.greeting_shown = False
+        # Fields the user can skip; a skipped field is stored empty and the search ignores it
+        self.OPTIONAL_FIELDS = {"Descripción del Proyecto"}
+        self.SKIP_ANSWERS = {"", "no", "-", "omitir", "ninguna", "n/a"}
 
-        self.graph_builder = StateGraph(State)
-        self.graph_builder.add_node("get_initial_info", self.get_initial_info)
-        self.graph_builder.add_node("find_best_grants", self.find_best_grants)
-        self.graph_builder.add_node("review_grant", self.review_grant)
-        self.graph_builder.add_node("end", lambda state: state)
-
-        self.graph_builder.add_edge(START, "get_initial_info")
-        
-        self.graph_builder.add_conditional_edges(
-            "get_initial_info",
-            self.should_find_grants,
-            {True: "find_best_grants", False: END}
-        )
-
-        self.graph_builder.add_conditional_edges(
-            "find_best_grants",
-            self.should_review_grant,
-            {True: "review_grant", False: END}
-        )
-
-        self.graph_builder.add_conditional_edges(
-            "review_grant",
-            lambda state: state.get("find_grants", False) and not state.get("discuss_grant", True),
-            {True: "find_best_grants", False: "review_grant"}
-        )
-
-        self.graph = self.graph_builder.compile()
+    @property
+    def graph(self):
+        """Compiled conversation graph, shared by every session (the nodes only use the state)"""
+        return get_compiled_graph()
 
     def validate_company_type(self, company_type: str) -> tuple[bool, str]:
         """
@@ -152,6 +133,9 @@ class GrantsBot:
                         })
                         return {"messages": messages, "user_info": user_info, "info_complete": False}
                 
+                elif field_name in self.OPTIONAL_FIELDS and user_input.lower().strip(" .") in self.SKIP_ANSWERS:
+                    user_input = ""
+                
                 # Store the valid input
                 user_info[field_name] = user_input
                 
@@ -225,15 +209,15 @@ class GrantsBot:
         messages = state["messages"]
         
         # First interaction - just show greeting
-        if not self.greeting_shown:
-            self.greeting_shown = True
+        if not state.get("greeting_shown", False):
+            state["greeting_shown"] = True
             messages.append({"role": "assistant", "content": "Por favor, introduce el slug de la subvención que quieres revisar en detalle:"})
             state["messages"] = messages
             return state
             
         
         # Only proceed if greeting has been shown
-        if self.greeting_shown:
+        if state.get("greeting_shown", False):
             grant_details = state.get("grant_details", None)
             last_message = messages[-1]
             
@@ -276,7 +260,7 @@ class GrantsBot:
             # Handle commands and dialogue after grant details are obtained
             
             if "volver" in last_message["content"].lower():
-                self.greeting_shown = False  # Reset greeting for potential future use
+                state["greeting_shown"] = False  # Reset greeting for potential future use
                 state["find_grants"] = True
                 state["discuss_grant"] = False
                 state["grant_details"] = {}
@@ -302,3 +286,41 @@ class GrantsBot:
             return {**state, "messages": messages}
         
         return state
+
+
+@lru_cache(maxsize=None)
+def get_compiled_graph():
+    """
+    Build and compile the conversation graph once per process. langgraph is
+    imported here so that importing this module stays cheap at startup.
+    """
+    from langgraph.graph import StateGraph, START, END
+
+    bot = GrantsBot()
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("get_initial_info", bot.get_initial_info)
+    graph_builder.add_node("find_best_grants", bot.find_best_grants)
+    graph_builder.add_node("review_grant", bot.review_grant)
+    graph_builder.add_node("end", lambda state: state)
+
+    graph_builder.add_edge(START, "get_initial_info")
+
+    graph_builder.add_conditional_edges(
+        "get_initial_info",
+        bot.should_find_grants,
+        {True: "find_best_grants", False: END}
+    )
+
+    graph_builder.add_conditional_edges(
+        "find_best_grants",
+        bot.should_review_grant,
+        {True: "review_grant", False: END}
+    )
+
+    graph_builder.add_conditional_edges(
+        "review_grant",
+        lambda state: state.get("find_grants", False) and not state.get("discuss_grant", True),
+        {True: "find_best_grants", False: "review_grant"}
+    )
+
+    return graph_builder.compile()
@@ -1,19 +1,43 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Dict, Optional, List
 import uuid
-from grants_bot import GrantsBot, State
+from grants_bot import GrantsBot, State, get_compiled_graph
+from tools_aurora import get_grant_cache, load_vector_index, warm_up_grants_db
 from concurrent.futures import ThreadPoolExecutor
 import asyncio
 from threading import Lock
 import queue
 from datetime import datetime, timedelta
 from typing import List, Dict
-from dynamodb import insert_chat_messages, get_chat_history, get_conversations, table
-from boto3.dynamodb.conditions import Key # Importamos `Key` para las consultas
-
-app = FastAPI(root_path="/api")
+from chat_writer import ChatWriteBehind
+from chat_store import get_chat_store
+from aws_connect import get_bedrock_client
+from warmup import WarmUp, WarmUpStep
+import os
+from dotenv import load_dotenv
+
+# Settings are read from the environment when each client is first used, not at import
+load_dotenv()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    cleanup_task = asyncio.create_task(cleanup_loop())
+    chat_writer.start()
+    # The worker answers /metrics and /ready while warming up; /ready returns 503 until it is done
+    warm_up_task = asyncio.create_task(warm_up.run())
+    yield
+    warm_up_task.cancel()
+    cleanup_task.cancel()
+    session_manager.end_all_sessions()
+    # Write any queued chat history before the worker exits
+    await asyncio.to_thread(chat_writer.shutdown)
+    await get_chat_store().aclose()
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -45,7 +69,8 @@ class UserSession:
             grant_details=None,
             info_complete=False,
             find_grants=False,
-            discuss_grant=False
+            discuss_grant=False,
+            greeting_shown=False
         )
         self.bot = GrantsBot()
         self.message_queue = queue.Queue()
@@ -176,6 +201,12 @@ class SessionManager:
                     return True
             return False  # Session didn't exist
 
+    def end_all_sessions(self):
+        """Stop every session thread (worker shutdown)"""
+        for user_id in list(self.sessions):
+            self.end_session(user_id)
+        self.executor.shutdown(wait=False)
+
     def cleanup_inactive_sessions(self):
         """Remove inactive sessions"""
         with self.lock:
@@ -195,10 +226,72 @@ class ChatMessage(BaseModel):
     
 class ChatHistoryRequest(BaseModel):
     messages: List[ChatMessage]
+    conversation_id: Optional[str] = None
+
+class SequencedChatMessage(BaseModel):
+    sequence: int
+    timestamp: str
+    role: str
+    message_content: str
+
+class AppendChatRequest(BaseModel):
+    userId: str
+    conversation_id: str
+    messages: List[SequencedChatMessage]
     
 # Initialize session manager
 session_manager = SessionManager()
 
+def valid_conversation_id(conversation_id: str) -> bool:
+    """'#' separates the conversation id from the message order in DynamoDB keys"""
+    return 0 < len(conversation_id) <= 64 and "#" not in conversation_id
+
+# Chat history is persisted in the background (see chat_writer.py)
+chat_writer = ChatWriteBehind()
+
+# Background task to clean up inactive sessions
+async def cleanup_loop():
+    while True:
+        try:
+            # Get current time once per cleanup cycle
+            current_time = datetime.now()
+            
+            # Create list of sessions to remove to avoid dict size changing during iteration
+            to_remove = []
+            
+            # Only acquire lock briefly to check sessions
+            with session_manager.lock:
+                for user_id, session in session_manager.sessions.items():
+                    if current_time - session.last_activity > timedelta(minutes=30):
+                        to_remove.append(user_id)
+            
+            # Remove sessions outside the lock
+            for user_id in to_remove:
+                try:
+                    session_manager.end_session(user_id)
+                except Exception as e:
+                    print(f"Error removing session {user_id}: {e}")
+                    continue
+                    
+        except Exception as e:
+            print(f"Cleanup error: {e}")
+        
+        # Sleep for 5 minutes between cleanup cycles
+        await asyncio.sleep(300)
+
+async def warm_up_chat_store():
+    await get_chat_store().warm_up()
+
+# Everything the first requests would otherwise pay for, done before /ready reports the worker as ready
+warm_up = WarmUp([
+    WarmUpStep("grants_db", lambda: warm_up_grants_db(int(os.getenv("WARMUP_DB_CONNECTIONS", "5")))),
+    WarmUpStep("graph", get_compiled_graph),
+    WarmUpStep("chat_store", warm_up_chat_store),
+    WarmUpStep("bedrock_client", get_bedrock_client, required=False),
+    WarmUpStep("vector_index", load_vector_index, required=False),
+])
+
+
 @app.post("/start_session")                                                 #Improved
 async def start_session(user_data: UserMessage) -> SessionResponse:
     """Start a new session with improved validation"""
@@ -278,6 +371,21 @@ async def get_session_state(user_id: str):
             "user_info": session.state["user_info"]
         }
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the warm-up has finished, 503 (with its progress) until then"""
+    status = warm_up.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime metrics of this worker"""
+    return {
+        "active_sessions": len(session_manager.sessions),
+        "grant_cache": get_grant_cache().stats(),
+        "chat_writer": chat_writer.stats(),
+    }
+
 @app.delete("/end_session/{user_id}")
 async def end_session(user_id: str):
     """End a user's session with graceful error handling"""
@@ -295,41 +403,6 @@ async def end_session(user_id: str):
             "status": "success"
         }
 
-# Background task to clean up inactive sessions
-@app.on_event("startup")
-async def start_cleanup_task():
-    async def cleanup_loop():
-        while True:
-            try:
-                # Get current time once per cleanup cycle
-                current_time = datetime.now()
-                
-                # Create list of sessions to remove to avoid dict size changing during iteration
-                to_remove = []
-                
-                # Only acquire lock briefly to check sessions
-                with session_manager.lock:
-                    for user_id, session in session_manager.sessions.items():
-                        if current_time - session.last_activity > timedelta(minutes=30):
-                            to_remove.append(user_id)
-                
-                # Remove sessions outside the lock
-                for user_id in to_remove:
-                    try:
-                        session_manager.end_session(user_id)
-                    except Exception as e:
-                        print(f"Error removing session {user_id}: {e}")
-                        continue
-                        
-            except Exception as e:
-                print(f"Cleanup error: {e}")
-            
-            # Sleep for 5 minutes between cleanup cycles
-            await asyncio.sleep(300)
-    
-    # Start the cleanup loop without waiting for it
-    asyncio.create_task(cleanup_loop())
-    
 @app.post("/save_chat")
 async def insert_messages(chat_data: ChatHistoryRequest):
     """
@@ -340,7 +413,10 @@ async def insert_messages(chat_data: ChatHistoryRequest):
 
     try:
         user_id = chat_data.messages[0].userId  # Tomamos el userId del primer mensaje
-        conversation_id = str(uuid.uuid4())  # Generamos un ID único para la conversación
+        # Con un conversation_id ya existente se reescriben los mismos ítems en lugar de duplicar la conversación
+        conversation_id = chat_data.conversation_id or str(uuid.uuid4())
+        if not valid_conversation_id(conversation_id):
+            raise HTTPException(status_code=400, detail="conversation_id no válido")
 
         # Convertimos los datos al formato esperado por `insert_chat_messages`
         messages = [
@@ -352,10 +428,51 @@ async def insert_messages(chat_data: ChatHistoryRequest):
             for msg in chat_data.messages
         ]
 
-        # Insertamos los mensajes en DynamoDB
-        insert_chat_messages(user_id, conversation_id, messages)
+        # Se encolan para guardarlos en DynamoDB en segundo plano; la respuesta no espera a la escritura
+        chat_writer.submit(user_id, conversation_id, messages)
 
-        return {"message": "Mensajes insertados exitosamente"}
+        return {"message": "Mensajes insertados exitosamente", "conversation_id": conversation_id}
+    except HTTPException:
+        raise
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="Cola de guardado llena, inténtalo de nuevo")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error guardando los mensajes: {str(e)}")
+
+@app.post("/append_chat_messages")
+async def append_messages(chat_data: AppendChatRequest):
+    """
+    Añade a una conversación solo los mensajes nuevos. El cliente mantiene el conversation_id
+    y numera cada mensaje con su posición (sequence, desde 0); la escritura es idempotente
+    por (conversación, sequence), así que reenviar un mensaje ya guardado no lo duplica.
+    """
+    if not chat_data.messages:
+        raise HTTPException(status_code=400, detail="Faltan datos en la petición")
+    if not valid_conversation_id(chat_data.conversation_id):
+        raise HTTPException(status_code=400, detail="conversation_id no válido")
+    sequences = [msg.sequence for msg in chat_data.messages]
+    if min(sequences) < 0 or len(set(sequences)) != len(sequences):
+        raise HTTPException(status_code=400, detail="Números de secuencia no válidos")
+
+    try:
+        messages = [
+            {
+                "sequence": msg.sequence,
+                "sender": msg.role,
+                "text": msg.message_content,
+                "timestamp": msg.timestamp
+            }
+            for msg in sorted(chat_data.messages, key=lambda m: m.sequence)
+        ]
+        chat_writer.submit(chat_data.userId, chat_data.conversation_id, messages)
+
+        return {
+            "message": "Mensajes añadidos exitosamente",
+            "conversation_id": chat_data.conversation_id,
+            "next_sequence": max(sequences) + 1,
+        }
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="Cola de guardado llena, inténtalo de nuevo")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error guardando los mensajes: {str(e)}")
 
@@ -365,31 +482,29 @@ async def get_chat_messages(user_id: str = Query(...), conversation_id: str = Qu
     Obtiene los mensajes de una conversación específica de un usuario.
     """
     try:
-        messages = get_chat_history(user_id)
-        # Filtrar mensajes por `conversation_id`
-        filtered_messages = [msg for msg in messages if msg["conversationId"] == conversation_id]
+        # Solo se leen los mensajes de esta conversación, ya ordenados por 'order'
+        messages = await get_chat_store().get_conversation_async(user_id, conversation_id)
 
-        if not filtered_messages:
+        if not messages:
             raise HTTPException(status_code=404, detail="No se encontraron mensajes para esta conversación")
 
-        # Ordenamos los mensajes por 'order'
-        sorted_messages = sorted(filtered_messages, key=lambda x: x["order"])
-
-        return {"messages": sorted_messages}
+        return {"messages": messages}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo mensajes: {str(e)}")
 
 @app.get("/get_user_conversations/{user_id}")
-async def get_user_conversations(user_id: str):
+async def get_user_conversations(user_id: str, limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
     """
-    Obtiene la lista de conversaciones guardadas para un usuario en DynamoDB.
+    Obtiene la lista de conversaciones guardadas para un usuario en DynamoDB,
+    de la más reciente a la más antigua. `next_cursor` da acceso a la página siguiente.
     """
     try:
-        messages = get_conversations(user_id)
-
-        # Ordenamos los mensajes por 'order'
-        sorted_messages = sorted(messages, key=lambda x: x["conversation_date"], reverse=True)
+        conversations, next_cursor = await get_chat_store().list_conversations_async(user_id, limit=limit, cursor=cursor)
 
-        return {"messages": sorted_messages}
+        return {"messages": conversations, "next_cursor": next_cursor}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor no válido")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo mensajes: {str(e)}")
@@ -1,10 +1,16 @@
 import json
-from aws_connect import *
-from sqlalchemy import create_engine, Column, String, Float, Text, or_
+import re
+from sqlalchemy import create_engine, Column, String, Float, Text, DateTime, or_, text, func
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import List, Dict, Any
+from sqlalchemy.pool import StaticPool
+from functools import lru_cache
+from threading import Lock
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 import os
+from grant_cache import GrantResultCache, budget_bucket
 
 
 
@@ -34,6 +40,53 @@ REGION_TO_SCOPE = {
     "País Vasco": "País Vasco"
 }
 
+# Company types with a dedicated applicants filter in matching_filters
+COMPANY_TYPES = ("pyme", "gran empresa", "autónomo")
+
+@lru_cache(maxsize=None)
+def get_grant_cache() -> GrantResultCache:
+    """Matching results shared by every session of this worker, created on first use"""
+    return GrantResultCache(
+        max_entries=int(os.getenv("GRANT_CACHE_SIZE", "256")),
+        check_interval=float(os.getenv("GRANT_CACHE_CHECK_SECONDS", "30")),
+    )
+
+# Number of grants passed to the LLM as recommendations
+MAX_RECOMMENDED_GRANTS = 15
+
+# Weight of the semantic similarity against the grant amount when a project description is given,
+# and how many SQL candidates per recommendation are re-ranked in that case
+SEMANTIC_WEIGHT = 0.7
+SEMANTIC_CANDIDATE_FACTOR = 4
+
+def parse_amount(value) -> float:
+    """
+    Parse a budget as typed by the user ("50.000 €", "1,5", 2000) into a float.
+    Follows GrantsBot.validate_budget, also reading "30.000" as thousands;
+    unparseable values count as 0.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    cleaned = str(value or "").replace('€', '').replace('$', '').replace(' ', '').strip()
+    if ',' in cleaned or re.fullmatch(r"\d{1,3}(\.\d{3})+", cleaned):
+        # European format: dots group thousands, comma separates decimals
+        cleaned = cleaned.replace('.', '').replace(',', '.')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return 0.0
+
+def normalize_profile(min_amount, region: str, tipo_empresa: Optional[str]):
+    """Normalise the user profile into (budget, database scope, company type or None)"""
+    scope = REGION_TO_SCOPE.get(region)
+    if not scope:
+        print(f"Warning: Unknown region '{region}'. Only searching for 'Estatal' grants.")
+        scope = "UNKNOWN"  # This ensures we'll still get Estatal grants
+    tipo = tipo_empresa.lower().strip() if tipo_empresa else None
+    if tipo not in COMPANY_TYPES:
+        tipo = None
+    return parse_amount(min_amount), scope, tipo
+
 class Grant(Base):
     __tablename__ = 'grants'
     
@@ -60,6 +113,9 @@ class Grant(Base):
     extra_limit = Column(Text)
     info_extra = Column(Text)
 
+    # Set by the database on every ETL write (etl_fandit/db_setup.py); part of the catalog version
+    updated_at = Column(DateTime)
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert Grant object to dictionary for JSON serialization"""
         return {
@@ -81,89 +137,136 @@ class Grant(Base):
             "info_extra": self.info_extra
         }
 
+# Columns passed to the LLM for each recommended grant, long text truncated in SQL
+SUMMARY_COLUMNS = [
+    Grant.slug.label("slug"),
+    Grant.formatted_title.label("title"),
+    func.coalesce(func.substr(Grant.scope, 1, 100), "").label("scope"),
+    Grant.request_amount.label("request_amount"),
+    func.coalesce(func.substr(Grant.applicants, 1, 150), "").label("applicants"),
+    func.coalesce(func.substr(Grant.line, 1, 150), "").label("line"),
+]
+
+CATALOG_VERSION_SQL = text("SELECT COUNT(*), MAX(updated_at) FROM grants")
+
+def grants_db_url() -> str:
+    """
+    Connection URL of the grants database: GRANTS_DB_URL when set (e.g.
+    sqlite:///grants_snapshot.db for the embedded snapshot produced by the ETL),
+    otherwise the Aurora cluster.
+    """
+    if os.getenv("GRANTS_DB_URL"):
+        return os.getenv("GRANTS_DB_URL")
+    db_user = "admin"
+    db_host = "bbddgrantsbot.cluster-cb88242ceu61.eu-south-2.rds.amazonaws.com"
+    db_name = "grants_db"
+    return f"mysql+pymysql://{db_user}:{os.getenv('DB_PASSWORD')}@{db_host}/{db_name}"
+
+_engines = {}
+_engines_lock = Lock()
+
+def get_engine(db_url: str):
+    """Sync engine (and connection pool) per URL, shared by every GrantQueries in the worker"""
+    with _engines_lock:
+        if db_url not in _engines:
+            if db_url.startswith("sqlite"):
+                # Embedded snapshot: read from any session thread; in-memory databases need a single connection
+                options = {"connect_args": {"check_same_thread": False}}
+                if db_url in ("sqlite://", "sqlite:///:memory:"):
+                    options["poolclass"] = StaticPool
+            else:
+                options = {"pool_recycle": 3600, "pool_pre_ping": True}
+            _engines[db_url] = create_engine(db_url, **options)
+        return _engines[db_url]
+
+def matching_filters(min_amount: float, scope: str, tipo: Optional[str]) -> list:
+    """SQL criteria shared by the matching queries (see GrantQueries.find_grant_summaries)"""
+    filters = [
+        Grant.request_amount >= min_amount,
+        or_(Grant.scope == 'Estatal', Grant.scope == scope),
+    ]
+
+    # Add company type filters
+    if tipo == "pyme":
+        # Look for "pyme" or "pequeña" in the applicants field
+        filters.append(or_(
+            Grant.applicants.ilike("%pyme%"),
+            Grant.applicants.ilike("%pequeña%")
+        ))
+    elif tipo == "gran empresa":
+        # Look for "gran" or "grandes" in the applicants field
+        filters.append(or_(
+            Grant.applicants.ilike("%gran%"),
+            Grant.applicants.ilike("%grandes%")
+        ))
+    elif tipo == "autónomo":
+        # Look for "autónomo" or "emprendedores" in the applicants field
+        filters.append(or_(
+            Grant.applicants.ilike("%autónomo%"),
+            Grant.applicants.ilike("%emprendedores%")
+        ))
+    return filters
+
 class GrantQueries:
-    def __init__(self):
+    def __init__(self, db_url: str = None):
         """
         Initialize connection to the existing database
-    
-        """
-        # Database connection configuration
-        self.DB_USER = "admin"
-        self.DB_HOST = "bbddgrantsbot.cluster-cb88242ceu61.eu-south-2.rds.amazonaws.com"
-        self.DB_NAME = "grants_db"
-        self.DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-        # Create the connection URL
-        self.db_url = f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}/{self.DB_NAME}"
-
-        self.engine = create_engine(self.db_url)
-        # Create the engine
 
+        Parameters:
+        db_url (str): SQLAlchemy URL of the grants database (defaults to grants_db_url())
+        """
+        self.db_url = db_url or grants_db_url()
+        self.engine = get_engine(self.db_url)
         self.Session = sessionmaker(bind=self.engine)
      
     
-    def find_adequate_grants(self, min_amount: float, region: str, tipo_empresa: str = None) -> List[Grant]:
+    def find_grant_summaries(self, min_amount: float, region: str, tipo_empresa: str = None,
+                             limit: int = MAX_RECOMMENDED_GRANTS) -> List[Dict[str, Any]]:
         """
-        Find all grants with a request_amount greater than or equal to the specified amount
-        AND with a scope that matches either 'Estatal' or the provided region's scope
-        AND filters based on company type 
+        Find the grants with a request_amount greater than or equal to the specified amount,
+        a scope of 'Estatal' or the region's scope and applicants matching the company type.
+        Only the columns shown to the LLM are selected, with the long text fields truncated
+        and the LIMIT applied by the database.
 
         Parameters:
         min_amount (float): Minimum request amount to search for
         region (str): Region (Comunidad Autónoma) to search for (will also include 'Estatal')
         tipo_empresa (str): Type of company (e.g., "Pyme", "gran empresa", "autónomo")
-        
+        limit (int): Maximum number of summaries
+
         Returns:
-        List[Grant]: List of Grant objects matching the criteria
+        List[Dict]: Up to `limit` grant summaries ordered by request_amount descending
         """
+        min_amount, scope, tipo = normalize_profile(min_amount, region, tipo_empresa)
+
+        # Grants at or above the exact budget are a prefix of the band's top `limit`
+        bucket = budget_bucket(min_amount)
+        summaries = get_grant_cache().get_or_load(
+            ("summaries", scope, tipo, bucket, limit),
+            lambda: self._query_grant_summaries(bucket, scope, tipo, limit),
+            version_loader=self.catalog_version,
+        )
+        return [summary for summary in summaries if summary["request_amount"] >= min_amount]
+
+    def _query_grant_summaries(self, min_amount: float, scope: str, tipo: Optional[str],
+                               limit: int) -> List[Dict[str, Any]]:
+        """Select the six summary columns, truncating text and limiting rows in SQL"""
         session = self.Session()
         try:
-            # Convert region to scope format
-            scope = REGION_TO_SCOPE.get(region)
-            if not scope:
-                print(f"Warning: Unknown region '{region}'. Only searching for 'Estatal' grants.")
-                scope = "UNKNOWN"  # This ensures we'll still get Estatal grants
-            
-            # Base query
-            query = session.query(Grant)\
-                        .filter(Grant.request_amount >= min_amount)\
-                        .filter(or_(Grant.scope == 'Estatal', Grant.scope == scope))
-            
-            # Add company type filters
-            if tipo_empresa:
-                tipo_lower = tipo_empresa.lower()
-                
-                if tipo_lower == "pyme":
-                    # Look for "pyme" or "pequeña" in the applicants field
-                    query = query.filter(
-                        or_(
-                            Grant.applicants.ilike("%pyme%"),
-                            Grant.applicants.ilike("%pequeña%")
-                        )
-                    )
-                elif tipo_lower == "gran empresa":
-                    # Look for "gran" or "grandes" in the applicants field
-                    query = query.filter(
-                        or_(
-                            Grant.applicants.ilike("%gran%"),
-                            Grant.applicants.ilike("%grandes%")
-                        )
-                    )
-                elif tipo_lower == "autónomo":
-                    # Look for "autónomo" or "emprendedores" in the applicants field
-                    query = query.filter(
-                        or_(
-                            Grant.applicants.ilike("%autónomo%"),
-                            Grant.applicants.ilike("%emprendedores%")
-                        )
-                    )
-            
-            # Execute query and return results
-            grants = query.order_by(Grant.request_amount.desc()).all()
-            return grants
+            rows = session.query(*SUMMARY_COLUMNS)\
+                .filter(*matching_filters(min_amount, scope, tipo))\
+                .order_by(Grant.request_amount.desc())\
+                .limit(limit)\
+                .all()
+            return [dict(row._mapping) for row in rows]
         finally:
             session.close()
 
+    def catalog_version(self):
+        """Row count and last update of the grants table; changes whenever the ETL commits"""
+        with self.engine.connect() as connection:
+            return tuple(connection.execute(CATALOG_VERSION_SQL).one())
+
     def find_unique_grant(self, partial_slug: str) -> Grant:
         """
         Find grants by partial slug match
@@ -184,6 +287,86 @@ class GrantQueries:
             session.close()
 
 
+def warm_up_grants_db(connections: int = 5):
+    """
+    Open `connections` pooled connections to the grants database and run the matching query
+    once, so the pool, the catalog version and the compiled SQL are ready for the first user
+    """
+    queries = GrantQueries()
+    opened = [queries.engine.connect() for _ in range(connections)]
+    for connection in opened:
+        connection.close()
+    queries.find_grant_summaries(0, next(iter(REGION_TO_SCOPE)), COMPANY_TYPES[0])
+
+def to_async_url(url: str) -> str:
+    """Swap the sync DBAPI driver of a SQLAlchemy URL for its asyncio counterpart"""
+    for sync_prefix, async_prefix in (("mysql+pymysql://", "mysql+aiomysql://"),
+                                      ("mysql://", "mysql+aiomysql://"),
+                                      ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+_async_engine = None
+
+def get_async_engine():
+    """Async engine (and connection pool) shared by every AsyncGrantQueries in the worker"""
+    global _async_engine
+    if _async_engine is None:
+        url = to_async_url(grants_db_url())
+        pool_options = {} if url.startswith("sqlite") else {
+            "pool_size": int(os.getenv("GRANTS_DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("GRANTS_DB_MAX_OVERFLOW", "20")),
+            "pool_recycle": 3600,
+            "pool_pre_ping": True,
+        }
+        _async_engine = create_async_engine(url, **pool_options)
+    return _async_engine
+
+class AsyncGrantQueries:
+    """asyncio counterpart of GrantQueries, for use from async handlers without blocking the loop"""
+
+    def __init__(self, engine=None):
+        self.engine = engine or get_async_engine()
+        self.Session = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def find_grant_summaries(self, min_amount: float, region: str, tipo_empresa: str = None,
+                                   limit: int = MAX_RECOMMENDED_GRANTS) -> List[Dict[str, Any]]:
+        """See GrantQueries.find_grant_summaries"""
+        min_amount, scope, tipo = normalize_profile(min_amount, region, tipo_empresa)
+        bucket = budget_bucket(min_amount)
+        summaries = await get_grant_cache().get_or_load_async(
+            ("summaries", scope, tipo, bucket, limit),
+            lambda: self._query_grant_summaries(bucket, scope, tipo, limit),
+            version_loader=self.catalog_version,
+        )
+        return [summary for summary in summaries if summary["request_amount"] >= min_amount]
+
+    async def _query_grant_summaries(self, min_amount: float, scope: str, tipo: Optional[str],
+                                     limit: int) -> List[Dict[str, Any]]:
+        async with self.Session() as session:
+            result = await session.execute(
+                select(*SUMMARY_COLUMNS)
+                .where(*matching_filters(min_amount, scope, tipo))
+                .order_by(Grant.request_amount.desc())
+                .limit(limit)
+            )
+            return [dict(row._mapping) for row in result]
+
+    async def catalog_version(self):
+        """See GrantQueries.catalog_version"""
+        async with self.engine.connect() as connection:
+            return tuple((await connection.execute(CATALOG_VERSION_SQL)).one())
+
+    async def find_unique_grant(self, partial_slug: str) -> Optional[Grant]:
+        """See GrantQueries.find_unique_grant"""
+        async with self.Session() as session:
+            result = await session.execute(
+                select(Grant).where(Grant.slug.like(f'%{partial_slug}%')).limit(1)
+            )
+            return result.scalars().first()
+
+
 def find_optimal_grants(user_info: dict) -> dict:
     """
     Find optimal grants by combining SQL filtering with LLM-based analysis of user fit.
@@ -193,40 +376,72 @@ def find_optimal_grants(user_info: dict) -> dict:
             - Comunidad Autónoma: Region name (must match REGION_TO_SCOPE keys)
             - Tipo de Empresa: Company type
             - Presupuesto del Proyecto: Project budget
+            - Descripción del Proyecto: Optional free-text description, used to rank
+              the SQL matches by similarity when the grant vector index is available
            
     Returns:
         dict: Dictionary containing:
             - 'recommended_grants': List of grants recommended 
     """
     query = GrantQueries()
-    
-    # Get grants matching basic criteria
-    found_grants = query.find_adequate_grants(
+
+    # With a description, fetch a wider candidate pool for the semantic re-ranking
+    description = user_info.get('Descripción del Proyecto')
+    index = load_vector_index() if description else None
+
+    # Get the minimized context for the LLM (essential fields only, truncated in SQL)
+    recommended_grants = query.find_grant_summaries(
         min_amount=user_info.get('Presupuesto del Proyecto', 0),
         region=user_info.get('Comunidad Autónoma'),
-        tipo_empresa=user_info.get('Tipo de Empresa')
+        tipo_empresa=user_info.get('Tipo de Empresa'),
+        limit=MAX_RECOMMENDED_GRANTS * (SEMANTIC_CANDIDATE_FACTOR if index else 1)
     )
-    
+    return _recommendations(recommended_grants, description, index)
+
+async def find_optimal_grants_async(user_info: dict) -> dict:
+    """Coroutine version of find_optimal_grants"""
+    description = user_info.get('Descripción del Proyecto')
+    index = load_vector_index() if description else None
+
+    recommended_grants = await AsyncGrantQueries().find_grant_summaries(
+        min_amount=user_info.get('Presupuesto del Proyecto', 0),
+        region=user_info.get('Comunidad Autónoma'),
+        tipo_empresa=user_info.get('Tipo de Empresa'),
+        limit=MAX_RECOMMENDED_GRANTS * (SEMANTIC_CANDIDATE_FACTOR if index else 1)
+    )
+    return _recommendations(recommended_grants, description, index)
+
+def load_vector_index():
+    """Grant vector index (numpy is only imported once a description needs it)"""
+    from grant_vectors import get_vector_index
+    return get_vector_index()
+
+def _recommendations(recommended_grants: List[Dict[str, Any]], description: Optional[str], index) -> dict:
     # If no adequate grants found, return empty dict
-    if not found_grants:
+    if not recommended_grants:
         return {}
 
-    # Prepare minimized context for the LLM - only essential fields
-    recommended_grants = [{
-        'slug': grant.slug,
-        'title': grant.formatted_title,
-        'scope': grant.scope[:100] if grant.scope else "",
-        'request_amount': grant.request_amount,
-        'applicants': grant.applicants[:150] if grant.applicants else "",
-        'line': grant.line[:150] if grant.line else ""
-    } for grant in found_grants[:15]]  # Limit to top 15 grants
-    
-    # Only return results if we found recommended grants
-    if recommended_grants:
-        return {
-            "recommended_grants": recommended_grants,
-        }
-    return {}
+    # Blend semantic similarity with the amount ranking of the SQL matches
+    if index:
+        recommended_grants = rank_by_description(recommended_grants, description, index)
+
+    return {
+        "recommended_grants": recommended_grants[:MAX_RECOMMENDED_GRANTS],
+    }
+
+def rank_by_description(grants: List[Dict[str, Any]], description: str, index) -> List[Dict[str, Any]]:
+    """
+    Re-rank grant summaries by a blend of cosine similarity to the project description
+    and request amount (relative to the largest amount among the candidates).
+    """
+    similarities = index.similarities(description, (grant["slug"] for grant in grants))
+    max_amount = max((grant["request_amount"] or 0 for grant in grants), default=0) or 1
+
+    def score(grant: Dict[str, Any]) -> float:
+        amount_score = (grant["request_amount"] or 0) / max_amount
+        return SEMANTIC_WEIGHT * similarities[grant["slug"]] + (1 - SEMANTIC_WEIGHT) * amount_score
+
+    return sorted(grants, key=score, reverse=True)
 
 def get_grant_detail(slug: str) -> dict:
     """
@@ -246,4 +461,7 @@ def get_grant_detail(slug: str) -> dict:
         return grant.to_dict()
     return {}
 
-
+async def get_grant_detail_async(slug: str) -> dict:
+    """Coroutine version of get_grant_detail"""
+    grant = await AsyncGrantQueries().find_unique_grant(slug)
+    return grant.to_dict() if grant else {}
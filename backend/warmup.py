@@ -0,0 +1,55 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, NamedTuple
+
+
+class WarmUpStep(NamedTuple):
+    name: str
+    run: Callable[[], Any]  # Blocking functions run in a worker thread; coroutine functions are awaited
+    required: bool = True
+
+
+class WarmUp:
+    """
+    Startup warm-up of a worker: creates clients and pools, compiles and loads what the
+    first requests would otherwise pay for. Steps run in order; a failing required step is
+    retried every retry_interval seconds, an optional one is only logged.
+    The worker is ready once every required step has succeeded (see /ready).
+    """
+
+    def __init__(self, steps: List[WarmUpStep], retry_interval: float = 10.0):
+        self.steps = steps
+        self.retry_interval = retry_interval
+        self.ready = False
+        self.results: Dict[str, Dict[str, Any]] = {step.name: {"status": "pending"} for step in steps}
+        self.seconds = None
+
+    async def _run_step(self, step: WarmUpStep):
+        if asyncio.iscoroutinefunction(step.run):
+            await step.run()
+        else:
+            await asyncio.to_thread(step.run)
+
+    async def run(self):
+        start = time.perf_counter()
+        for step in self.steps:
+            attempts = 0
+            while True:
+                attempts += 1
+                step_start = time.perf_counter()
+                try:
+                    await self._run_step(step)
+                    self.results[step.name] = {"status": "ok", "seconds": round(time.perf_counter() - step_start, 3)}
+                    break
+                except Exception as e:
+                    self.results[step.name] = {"status": "error", "error": str(e), "attempts": attempts}
+                    print(f"⚠️ Warm-up step '{step.name}' failed: {e}")
+                    if not step.required:
+                        break
+                    await asyncio.sleep(self.retry_interval)
+        self.seconds = round(time.perf_counter() - start, 3)
+        self.ready = True
+        print(f"✅ Worker warmed up in {self.seconds} s")
+
+    def status(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "warm_up_seconds": self.seconds, "steps": self.results}
@@ -1,22 +1,22 @@
 import asyncio
-import json
 import os
-from datetime import datetime
+import time
 
 import aiohttp
 from dotenv import load_dotenv
 
-#Script que descarga json con subvenciones de la API de Fandit y las guarda en un archivo JSON.
+#Script que descarga json con subvenciones de la API de Fandit y las guarda en un snapshot NDJSON comprimido.
 #Última version actualizada al 2025-02-20
 
 from clase_apifandit import FanditAPI
+from snapshots import MODO_ENRIQUECIDO, SnapshotNDJSON, aplicar_retencion, ruta_snapshot
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
 async def descargar_subvenciones(api, paginas_a_descargar=None):
     """
-    Descarga subvenciones de la API de Fandit y las guarda en un archivo JSON.
+    Descarga subvenciones de la API de Fandit.
     
     :param api: Instancia de FanditAPI
     :param paginas_a_descargar: Número de páginas a descargar (None para todas)
@@ -81,48 +81,117 @@ async def descargar_subvenciones(api, paginas_a_descargar=None):
     return todas_subvenciones
 
 
-async def obtener_detalles_subvenciones(api, subvenciones):
+async def obtener_detalle_con_reintentos(api, slug, reintentos):
+    """
+    Obtiene el detalle de una subvención, reintentándolo con espera creciente si falla.
+
+    :return: Detalle de la subvención, o None si se agotan los reintentos
+    """
+    for intento in range(1, reintentos + 1):
+        detalle = await api.obtener_detalle_subvencion(slug)
+        if detalle:
+            return detalle
+        if intento < reintentos:
+            await asyncio.sleep(0.5 * 2 ** (intento - 1))
+    return None
+
+
+async def enriquecer_subvenciones(api, subvenciones, trabajadores=None, reintentos=None, intervalo_progreso=10.0):
+    """
+    Añade a cada subvención su detalle, con un grupo de `trabajadores` corrutinas que piden
+    los detalles en paralelo. Genera las subvenciones completas según se obtienen (no en el
+    orden de entrada); las colas son acotadas, de modo que la memoria no crece con el catálogo
+    si el consumidor escribe los resultados a medida que llegan.
+
+    :param api: Instancia de FanditAPI
+    :param subvenciones: Iterable de subvenciones base (con 'slug')
+    :param trabajadores: Peticiones simultáneas (por defecto ETL_CONCURRENCIA_DETALLES o 20)
+    :param reintentos: Intentos por subvención (por defecto ETL_REINTENTOS_DETALLE o 3)
+    :param intervalo_progreso: Segundos entre informes de progreso
+    """
+    trabajadores = trabajadores or int(os.getenv('ETL_CONCURRENCIA_DETALLES', '20'))
+    reintentos = reintentos or int(os.getenv('ETL_REINTENTOS_DETALLE', '3'))
+    total = len(subvenciones) if hasattr(subvenciones, '__len__') else None
+    pendientes = asyncio.Queue(maxsize=trabajadores * 2)
+    completas = asyncio.Queue(maxsize=trabajadores * 2)
+    fallidas = []
+    inicio = time.perf_counter()
+    obtenidas = 0
+    ultimo_informe = inicio
+
+    async def productor():
+        for subvencion in subvenciones:
+            await pendientes.put(subvencion)
+        for _ in range(trabajadores):
+            await pendientes.put(None)
+
+    async def trabajador():
+        while (subvencion := await pendientes.get()) is not None:
+            try:
+                detalle = await obtener_detalle_con_reintentos(api, subvencion['slug'], reintentos)
+            except Exception as e:
+                print(f"Error al obtener detalle de {subvencion['slug']}: {e}")
+                detalle = None
+            if detalle is None:
+                fallidas.append(subvencion['slug'])
+            else:
+                # Combinar los datos base con los detalles
+                await completas.put({**subvencion, **detalle})
+        await completas.put(None)
+
+    tareas = [asyncio.create_task(productor())] + [asyncio.create_task(trabajador()) for _ in range(trabajadores)]
+    try:
+        activos = trabajadores
+        while activos:
+            subvencion_completa = await completas.get()
+            if subvencion_completa is None:
+                activos -= 1
+                continue
+            obtenidas += 1
+            yield subvencion_completa
+
+            ahora = time.perf_counter()
+            if ahora - ultimo_informe >= intervalo_progreso:
+                ultimo_informe = ahora
+                print(f"Detalles obtenidos: {obtenidas}{f' de {total}' if total else ''} "
+                      f"({obtenidas / (ahora - inicio):.1f}/s), fallidos: {len(fallidas)}")
+        await asyncio.gather(*tareas)
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+    duracion = time.perf_counter() - inicio
+    print(f"Detalles obtenidos: {obtenidas} en {duracion:.2f} s ({obtenidas / duracion if duracion else 0:.1f}/s)")
+    if fallidas:
+        print(f"No se pudo obtener el detalle de {len(fallidas)} subvenciones: {fallidas}")
+
+
+async def obtener_detalles_subvenciones(api, subvenciones, trabajadores=None):
     """
     Obtiene los detalles completos de cada subvención.
     
     :param api: Instancia de FanditAPI
     :param subvenciones: Lista de subvenciones base
+    :param trabajadores: Peticiones simultáneas (por defecto ETL_CONCURRENCIA_DETALLES o 20)
     :return: Lista de subvenciones con detalles completos
     """
-    subvenciones_con_detalles = []
-    
-    for subvencion in subvenciones:
-        try:
-            detalle = await api.obtener_detalle_subvencion(subvencion['slug'])
-            # Combinar los datos base con los detalles
-            subvencion_completa = {**subvencion, **detalle}
-            subvenciones_con_detalles.append(subvencion_completa)
-            print(f"Detalle obtenido para: {subvencion['slug']}")
-        except Exception as e:
-            print(f"Error al obtener detalle de {subvencion['slug']}: {e}")
-    
-    return subvenciones_con_detalles
+    return [subvencion async for subvencion in enriquecer_subvenciones(api, subvenciones, trabajadores)]
 
-def guardar_json(datos, nombre_archivo=None):
+async def guardar_snapshot_en_streaming(datos, ruta=None):
     """
-    Guarda los datos en un archivo JSON.
+    Guarda en un snapshot NDJSON comprimido (ver snapshots.py) los registros de un iterable
+    asíncrono según llegan, sin reunirlos antes en memoria.
     
-    :param datos: Datos a guardar
-    :param nombre_archivo: Nombre del archivo (si no se especifica, se usa la fecha actual)
+    :param datos: Iterable asíncrono de registros
+    :param ruta: Ruta del snapshot (por defecto output/subvenciones_enriquecido_<fecha>.ndjson.zst o .gz)
+    :return: Ruta del snapshot
     """
-    if not nombre_archivo:
-        # Crear nombre de archivo con fecha y hora actual
-        fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nombre_archivo = f"subvenciones_{fecha_actual}.json"
-    
-    # Crear directorio de salida si no existe
-    os.makedirs('output', exist_ok=True)
-    ruta_completa = os.path.join('output', nombre_archivo)
+    with SnapshotNDJSON(ruta or ruta_snapshot(modo=MODO_ENRIQUECIDO)) as snapshot:
+        async for registro in datos:
+            snapshot.escribir((registro,))
     
-    with open(ruta_completa, 'w', encoding='utf-8') as f:
-        json.dump(datos, f, ensure_ascii=False, indent=4)
-    
-    print(f"Datos guardados en {ruta_completa}")
+    print(f"{snapshot.registros} registros guardados en {snapshot.ruta}")
+    return snapshot.ruta
 
 async def main():
     # Obtener tokens y credenciales del archivo .env
@@ -158,17 +227,18 @@ async def main():
             print("No se descargaron subvenciones. Verificar credenciales y configuración.")
             return
         
-        # 2. Obtener detalles de cada subvención
-        subvenciones_completas = await obtener_detalles_subvenciones(api, subvenciones)
-        
-        # 3. Guardar en JSON
-        guardar_json(subvenciones_completas)
+        # 2. Obtener los detalles de cada subvención y 3. guardarlos en un snapshot según llegan
+        await guardar_snapshot_en_streaming(enriquecer_subvenciones(api, subvenciones))
+        aplicar_retencion()
         
     except Exception as e:
         print(f"Error en el proceso: {e}")
         # Imprimir información adicional de depuración
         import traceback
         traceback.print_exc()
+    finally:
+        print(f"Limitador de la API: {api.limitador.estado()}")
+        await api.cerrar()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
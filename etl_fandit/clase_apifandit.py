@@ -1,17 +1,98 @@
 import aiohttp
 import json
 import asyncio
+import importlib.util
+import os
+import statistics
+import time
+from collections import defaultdict
+
+from limitador import LimitadorAdaptativo
+
+# aiohttp solo descomprime brotli si está instalado el paquete Brotli
+ACCEPT_ENCODING = "gzip, deflate, br" if importlib.util.find_spec("brotli") else "gzip, deflate"
 
 class FanditAPI:
-    def __init__(self, token, expert_token, base_url="https://ayming.api.fandit.es/api/v2", email=None, password=None):
+    def __init__(self, token, expert_token, base_url="https://ayming.api.fandit.es/api/v2", email=None, password=None,
+                 limite_conexiones=None, timeout=60, limitador=None):
         """
         Inicializa la clase con los tokens necesarios y, opcionalmente, las credenciales para renovar el token (en este caso no es necesario 😉).
+
+        Todas las peticiones comparten una sesión HTTP (conexiones keep-alive y caché DNS), que se abre
+        en la primera petición. Usar la clase como gestor de contexto asíncrono (`async with FanditAPI(...) as api`)
+        o llamar a `cerrar()` al terminar.
+
+        :param limite_conexiones: Conexiones simultáneas máximas (por defecto FANDIT_LIMITE_CONEXIONES o 20)
+        :param timeout: Segundos máximos por petición
+        :param limitador: Limitador de peticiones simultáneas (por defecto, uno adaptativo de hasta limite_conexiones)
         """
         self.token = token
         self.expert_token = expert_token
         self.base_url = base_url
         self.email = email
         self.password = password
+        self.limite_conexiones = limite_conexiones or int(os.getenv('FANDIT_LIMITE_CONEXIONES', '20'))
+        self.timeout = timeout
+        self._session = None
+        self.limitador = limitador or LimitadorAdaptativo(maximo=self.limite_conexiones)
+        # Duración de cada petición por endpoint, para el resumen de tiempos
+        self.tiempos = defaultdict(list)
+        self.errores = defaultdict(int)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+
+    def _sesion(self):
+        """
+        Devuelve la sesión HTTP compartida, creándola si hace falta.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limite_conexiones,
+                keepalive_timeout=30,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Accept-Encoding": ACCEPT_ENCODING},
+            )
+        return self._session
+
+    async def cerrar(self):
+        """
+        Cierra la sesión HTTP y sus conexiones.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @staticmethod
+    def _nombre_endpoint(endpoint):
+        # /fund-details/<slug>/ se agrupa en /fund-details/
+        return "/" + endpoint.strip("/").split("/")[0] + "/"
+
+    def resumen_tiempos(self):
+        """
+        Resumen de la duración de las peticiones por endpoint.
+
+        :return: {endpoint: {peticiones, errores, media_ms, p50_ms, p95_ms, max_ms}}
+        """
+        resumen = {}
+        for endpoint, duraciones in self.tiempos.items():
+            ordenadas = sorted(duraciones)
+            resumen[endpoint] = {
+                "peticiones": len(ordenadas),
+                "errores": self.errores[endpoint],
+                "media_ms": round(statistics.fmean(ordenadas) * 1000, 1),
+                "p50_ms": round(statistics.median(ordenadas) * 1000, 1),
+                "p95_ms": round(ordenadas[int(len(ordenadas) * 0.95)] * 1000, 1),
+                "max_ms": round(ordenadas[-1] * 1000, 1),
+            }
+        return resumen
 
     def _headers(self, tipo="usuario"):
         """
@@ -30,21 +111,34 @@ class FanditAPI:
         """
         url = f"{self.base_url}{endpoint}"
         headers = self._headers(tipo=headers_tipo)
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.request(metodo, url, headers=headers, params=params, data=data, json=json_data) as response:
-                    if response.status == 401 and intento <= 1:
-                        print("Token expirado o inválido. Se intentará renovar el token...")
-                        if self.email and self.password:
-                            await self.refrescar_token()
-                            return await self._request(metodo, endpoint, headers_tipo, params, data, json_data, intento + 1)
-                        else:
-                            response.raise_for_status()
+        nombre_endpoint = self._nombre_endpoint(endpoint)
+        estado = retry_after = None
+        await self.limitador.adquirir()
+        inicio = time.perf_counter()
+        try:
+            async with self._sesion().request(metodo, url, headers=headers, params=params, data=data, json=json_data) as response:
+                estado = response.status
+                retry_after = response.headers.get("Retry-After")
+                if estado == 401 and intento <= 1 and self.email and self.password:
+                    datos = None
+                else:
                     response.raise_for_status()
-                    return await response.json()
-            except aiohttp.ClientError as e:
-                print(f"Error en la petición a {url}: {e}")
-                return None
+                    datos = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.errores[nombre_endpoint] += 1
+            print(f"Error en la petición a {url}: {e}")
+            return None
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.tiempos[nombre_endpoint].append(duracion)
+            await self.limitador.liberar(nombre_endpoint, duracion, estado, retry_after)
+
+        if estado == 401 and intento <= 1 and self.email and self.password:
+            # Se reintenta tras liberar el hueco del limitador
+            print("Token expirado o inválido. Se intentará renovar el token...")
+            await self.refrescar_token()
+            return await self._request(metodo, endpoint, headers_tipo, params, data, json_data, intento + 1)
+        return datos
 
     async def refrescar_token(self):
         """
@@ -53,17 +147,16 @@ class FanditAPI:
         """
         url_login = f"{self.base_url}/users/login/"
         payload = {"email": self.email, "password": self.password}
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url_login, json=payload) as response:
-                    response.raise_for_status()
-                    datos = await response.json()
-                    self.token = datos.get("token")
-                    print("Token actualizado correctamente.")
-                    return self.token
-            except aiohttp.ClientError as e:
-                print(f"Error al renovar token: {e}")
-                return None
+        try:
+            async with self._sesion().post(url_login, json=payload) as response:
+                response.raise_for_status()
+                datos = await response.json()
+                self.token = datos.get("token")
+                print("Token actualizado correctamente.")
+                return self.token
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error al renovar token: {e}")
+            return None
 
     async def obtener_lista_subvenciones(self, page=1, request_data=None):
         """
@@ -115,6 +208,11 @@ if __name__ == "__main__":
         expert_token=""
     )
 
+    async def ejecutar(peticion):
+        # Cada asyncio.run usa su propio event loop: la sesión se cierra al terminar cada prueba
+        async with api:
+            return await peticion
+
     # Prueba del endpoint /funds/ (Lista de Subvenciones)
     print("\n=== Prueba del endpoint /funds/ (Lista de Subvenciones) ===")
     filtros_subvenciones = {
@@ -132,7 +230,7 @@ if __name__ == "__main__":
         "region_types": [],
         "types": []
     }
-    subvenciones = asyncio.run(api.obtener_lista_subvenciones(page=1, request_data=filtros_subvenciones))
+    subvenciones = asyncio.run(ejecutar(api.obtener_lista_subvenciones(page=1, request_data=filtros_subvenciones)))
     print("Lista de subvenciones:", subvenciones)
 
     # Prueba del endpoint /funds/concessions/ (Lista de Concesiones)
@@ -152,7 +250,7 @@ if __name__ == "__main__":
         "region_types": [],
         "types": []
     }
-    concesiones = asyncio.run(api.obtener_lista_concesiones(page=1, request_data=filtros_concesiones))
+    concesiones = asyncio.run(ejecutar(api.obtener_lista_concesiones(page=1, request_data=filtros_concesiones)))
     print("Lista de concesiones:", concesiones)
 
     # Prueba del endpoint /funds/concessions/beneficiaries/ (Beneficiarios de Concesiones)
@@ -161,10 +259,10 @@ if __name__ == "__main__":
         "nif": "",
         "fund_slug": "ayudas-para-startups-tecnologicas-innovadoras-del-programa-neotec-ano-2024"
     }
-    beneficiarios = asyncio.run(api.obtener_lista_beneficiarios_concesiones(page=1, request_data=filtros_beneficiarios))
+    beneficiarios = asyncio.run(ejecutar(api.obtener_lista_beneficiarios_concesiones(page=1, request_data=filtros_beneficiarios)))
     print("Beneficiarios de concesiones:", beneficiarios)
 
     # Prueba del endpoint /fund-details/<fund-slug>/ (Detalle de Subvención)
     print("\n=== Prueba del endpoint /fund-details/<fund-slug>/ (Detalle de Subvención) ===")
-    detalle_subvencion = asyncio.run(api.obtener_detalle_subvencion("ayudas-para-startups-tecnologicas-innovadoras-del-programa-neotec-ano-2024"))
+    detalle_subvencion = asyncio.run(ejecutar(api.obtener_detalle_subvencion("ayudas-para-startups-tecnologicas-innovadoras-del-programa-neotec-ano-2024")))
     print("Detalle de la subvención:", detalle_subvencion)
\ No newline at end of file
@@ -1,8 +1,11 @@
-import json
 import mysql.connector
 import os
+import sys
+from itertools import islice
 from dotenv import load_dotenv
 import logging
+from escritura_grants import escribir_grants
+from snapshots import leer_snapshot, ultimo_snapshot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,64 +21,36 @@ def connect_db():
         database='grants_db'
     )
 
-def insert_grants(cursor, grants_data):
-    """Inserta los datos en la tabla grants"""
-    insert_query = """
-    INSERT INTO grants (
-        slug, formatted_title, status_text, entity, total_amount,
-        request_amount, goal_extra, scope, publisher, applicants,
-        term, help_type, expenses, fund_execution_period, line,
-        extra_limit, info_extra
-    ) VALUES (
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-    )
+def insert_grants(conn, grants_data, registros_por_bloque=5000):
     """
-    
-    for grant in grants_data:
-        values = (
-            grant['slug'],
-            grant['formatted_title'],
-            grant['status_text'],
-            grant['entity'],
-            grant['total_amount'],
-            grant['request_amount'],
-            grant['goal_extra'],
-            grant['scope'],
-            grant['publisher'],
-            grant['applicants'],
-            grant['term'],
-            grant['help_type'],
-            grant['expenses'],
-            grant['fund_execution_period'],
-            grant['line'],
-            grant['extra_limit'],
-            grant['info_extra']
-        )
-        
-        try:
-            cursor.execute(insert_query, values)
-            logger.info(f"Insertado registro con slug: {grant['slug']}")
-        except mysql.connector.Error as err:
-            logger.error(f"Error insertando registro {grant['slug']}: {err}")
+    Inserta los datos en la tabla grants, por lotes (ver escritura_grants.escribir_grants).
+    `grants_data` puede ser un iterable en streaming: solo se tiene en memoria un bloque de registros.
+    """
+    registros = iter(grants_data)
+    escritos, fallidos = 0, []
+    while bloque := list(islice(registros, registros_por_bloque)):
+        escritos_bloque, fallidos_bloque = escribir_grants(conn, bloque)
+        escritos += escritos_bloque
+        fallidos.extend(fallidos_bloque)
+    logger.info(f"Insertados {escritos} registros, {len(fallidos)} con error")
 
-def import_data():
-    """Importa los datos del archivo JSON a la base de datos"""
+def import_data(ruta=None):
+    """
+    Importa a la base de datos un snapshot de subvenciones (por defecto el completo más reciente de
+    output/, el único con todo el catálogo), leyéndolo en streaming. También acepta los respaldos .json anteriores.
+    """
     try:
-        # Leer el archivo JSON
-        with open('subvenciones_20250220_111707.json', 'r', encoding='utf-8') as file:
-            grants_data = json.load(file)
-            
-        logger.info(f"Leyendo {len(grants_data)} registros del archivo JSON")
+        ruta = ruta or ultimo_snapshot()
+        if not ruta:
+            logger.error("No hay snapshots completos en output/")
+            return
+        logger.info(f"Leyendo los registros de {ruta}")
         
         # Conectar a la base de datos
         conn = connect_db()
-        cursor = conn.cursor()
-        
-        # Insertar los datos
-        insert_grants(cursor, grants_data)
         
-        # Commit de los cambios
-        conn.commit()
+        # Insertar los datos (con un commit por lote)
+        insert_grants(conn, leer_snapshot(ruta))
         logger.info("Importación completada exitosamente")
         
     except mysql.connector.Error as err:
@@ -86,8 +61,7 @@ def import_data():
         logger.error(f"Error general: {e}")
     finally:
         if 'conn' in locals() and conn.is_connected():
-            cursor.close()
             conn.close()
 
 if __name__ == "__main__":
-    import_data()
\ No newline at end of file
+    import_data(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
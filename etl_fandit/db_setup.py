@@ -2,8 +2,8 @@ import mysql.connector
 import os
 from dotenv import load_dotenv
 import logging
+from estado_etl import crear_tabla_estado
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -43,6 +43,7 @@ def create_grants_table(cursor):
         line TEXT,
         extra_limit TEXT,
         info_extra TEXT,
+        content_hash CHAR(64),
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
     )
@@ -50,6 +51,22 @@ def create_grants_table(cursor):
     cursor.execute(create_table_sql)
     logger.info("Tabla grants creada exitosamente")
 
+def migrate_content_hash(cursor):
+    """
+    Añade la columna content_hash (SHA-256 de los campos que sigue el ETL) a una tabla
+    grants creada antes de que existiera. Las filas existentes quedan con NULL y el
+    ETL las reescribe, con su hash, en la siguiente ejecución.
+    """
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'grants' AND COLUMN_NAME = 'content_hash'
+    """)
+    fila = cursor.fetchone()
+    existe = list(fila.values())[0] if isinstance(fila, dict) else fila[0]
+    if not existe:
+        cursor.execute("ALTER TABLE grants ADD COLUMN content_hash CHAR(64) NULL AFTER info_extra")
+        logger.info("Columna content_hash añadida a la tabla grants")
+
 def setup_database():
     """Configura la base de datos y la tabla grants"""
     try:
@@ -61,6 +78,8 @@ def setup_database():
         
         # Crear la tabla grants
         create_grants_table(cursor)
+        migrate_content_hash(cursor)
+        crear_tabla_estado(conn)
 
         # Crear índices para mejorar el rendimiento
         cursor.execute("CREATE INDEX idx_formatted_title ON grants(formatted_title)")
@@ -79,4 +98,6 @@ def setup_database():
             conn.close()
 
 if __name__ == "__main__":
+    # Solo al ejecutarlo como script: el ETL importa migrate_content_hash y configura su propio logging
+    logging.basicConfig(level=logging.INFO)
     setup_database()
\ No newline at end of file
@@ -0,0 +1,231 @@
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import unicodedata
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import numpy as np
+
+from punto_control import escribir_atomico
+
+# Generación de embeddings de subvenciones para la búsqueda semántica del backend.
+# El formato del índice (embeddings.npy + slugs.json + idf.npy en un subdirectorio
+# versionado, y meta.json apuntando a él) lo lee backend/grant_vectors.py, que
+# reimplementa HashingEmbedder.transformar: cualquier cambio en la tokenización debe
+# hacerse en los dos ficheros y subir VERSION_EMBEDDER.
+
+logger = logging.getLogger("ETL_Fandit")
+
+VERSION_EMBEDDER = 1
+
+# Campos que describen la subvención y alimentan el embedding
+CAMPOS_TEXTO = ['formatted_title', 'goal_extra', 'line', 'applicants', 'help_type', 'expenses']
+
+_PATRON_PALABRA = re.compile(r"[a-z0-9]+")
+
+
+def normalizar_texto(texto):
+    """Pasa a minúsculas y elimina tildes para que 'Autónomo' y 'autonomo' coincidan."""
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def texto_subvencion(registro):
+    """Concatena los campos descriptivos de una subvención en un único texto."""
+    return ' '.join(str(registro.get(campo) or '') for campo in CAMPOS_TEXTO)
+
+
+class Embedder(ABC):
+    """
+    Interfaz mínima de un embedder de subvenciones.
+
+    ajustar() recibe una pasada por el corpus (para estadísticas tipo IDF) y
+    transformar() devuelve un vector float32 normalizado por texto.
+    """
+    nombre = None
+    dimension = None
+
+    def ajustar(self, textos):
+        pass
+
+    @abstractmethod
+    def transformar(self, texto):
+        """Vector float32 normalizado del texto"""
+
+    def metadatos(self):
+        return {"embedder": self.nombre, "dim": self.dimension, "version": VERSION_EMBEDDER}
+
+    def guardar(self, directorio):
+        pass
+
+
+class HashingEmbedder(Embedder):
+    """
+    Proyección TF-IDF por hashing de palabras y bigramas, sin dependencias externas.
+
+    Cada token se asigna a un bucket con crc32 (determinista entre procesos) y un
+    signo para compensar colisiones. El peso es (1 + log tf) * idf del bucket.
+    """
+    nombre = "hashing"
+
+    def __init__(self, dimension=512, bigramas=True):
+        self.dimension = dimension
+        self.bigramas = bigramas
+        self.idf = np.ones(dimension, dtype=np.float32)
+
+    def _tokens(self, texto):
+        palabras = [p for p in _PATRON_PALABRA.findall(normalizar_texto(texto)) if len(p) > 1]
+        tokens = list(palabras)
+        if self.bigramas:
+            tokens.extend(f"{a}_{b}" for a, b in zip(palabras, palabras[1:]))
+        return tokens
+
+    def _conteos(self, texto):
+        conteos = {}
+        for token in self._tokens(texto):
+            h = zlib.crc32(token.encode('utf-8'))
+            indice = h % self.dimension
+            signo = 1.0 if (h >> 31) & 1 else -1.0
+            conteos[indice] = conteos.get(indice, 0.0) + signo
+        return conteos
+
+    def ajustar(self, textos):
+        df = np.zeros(self.dimension, dtype=np.float64)
+        total = 0
+        for texto in textos:
+            total += 1
+            indices = [i for i, valor in self._conteos(texto).items() if valor != 0]
+            df[indices] += 1
+        self.idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+
+    def transformar(self, texto):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for indice, valor in self._conteos(texto).items():
+            if valor:
+                vector[indice] = math.copysign(1 + math.log(abs(valor)), valor) * self.idf[indice]
+        norma = np.linalg.norm(vector)
+        if norma > 0:
+            vector /= norma
+        return vector
+
+    def metadatos(self):
+        return {**super().metadatos(), "bigramas": self.bigramas}
+
+    def guardar(self, directorio):
+        np.save(os.path.join(directorio, 'idf.npy'), self.idf)
+
+
+EMBEDDERS = {
+    HashingEmbedder.nombre: HashingEmbedder,
+}
+
+
+def obtener_embedder(nombre=None, **kwargs):
+    """
+    Devuelve una instancia del embedder configurado (ETL_EMBEDDER, por defecto 'hashing').
+    Se pueden registrar embedders adicionales añadiéndolos a EMBEDDERS.
+    """
+    nombre = nombre or os.getenv('ETL_EMBEDDER', HashingEmbedder.nombre)
+    if nombre not in EMBEDDERS:
+        raise ValueError(f"Embedder desconocido: {nombre}")
+    return EMBEDDERS[nombre](**kwargs)
+
+
+def _kmeans_esferico(matriz, n_listas, iteraciones=10, tamano_bloque=8192, semilla=0):
+    """K-means sobre vectores normalizados (similitud coseno) procesando la matriz por bloques."""
+    rng = np.random.default_rng(semilla)
+    centroides = np.array(matriz[rng.choice(len(matriz), n_listas, replace=False)], dtype=np.float32)
+    asignacion = np.zeros(len(matriz), dtype=np.int32)
+    for _ in range(iteraciones):
+        sumas = np.zeros_like(centroides)
+        for inicio in range(0, len(matriz), tamano_bloque):
+            bloque = np.asarray(matriz[inicio:inicio + tamano_bloque])
+            etiquetas = np.argmax(bloque @ centroides.T, axis=1).astype(np.int32)
+            asignacion[inicio:inicio + len(bloque)] = etiquetas
+            np.add.at(sumas, etiquetas, bloque)
+        normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+        vacios = normas[:, 0] == 0
+        centroides[~vacios] = sumas[~vacios] / normas[~vacios]
+    return centroides, asignacion
+
+
+# Ficheros del formato anterior, escritos directamente en el directorio del índice
+_FICHEROS_SIN_VERSION = ['embeddings.npy', 'embeddings.npy.tmp', 'slugs.json', 'idf.npy',
+                         'ivf_centroids.npy', 'ivf_assign.npy']
+
+
+def _limpiar_versiones(directorio, conservar):
+    """Borra las versiones del índice que no están en `conservar` y los ficheros del formato anterior"""
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if nombre.startswith('v_') and os.path.isdir(ruta) and nombre not in conservar:
+            shutil.rmtree(ruta, ignore_errors=True)
+        elif nombre in _FICHEROS_SIN_VERSION:
+            os.remove(ruta)
+
+
+def construir_indice_vectorial(registros, directorio, embedder=None, ivf_min_filas=20000):
+    """
+    Calcula un embedding por subvención y escribe el índice en disco.
+
+    Los ficheros se escriben en un subdirectorio nuevo (v_<fecha>) y el cambio de versión es
+    la sustitución atómica de meta.json, que se escribe el último: el backend ve el índice
+    anterior completo o el nuevo completo, nunca una mezcla. Se conserva también la versión
+    anterior, por si algún proceso acaba de leer el meta.json antiguo.
+
+    :param registros: Iterable re-recorrible de subvenciones (se recorre dos veces: IDF y vectores)
+    :param directorio: Directorio destino del índice
+    :param embedder: Embedder a utilizar (por defecto obtener_embedder())
+    :param ivf_min_filas: A partir de este número de subvenciones se genera además una partición IVF
+    :return: Número de subvenciones indexadas
+    """
+    embedder = embedder or obtener_embedder()
+    os.makedirs(directorio, exist_ok=True)
+    version = f"v_{datetime.now():%Y%m%d_%H%M%S_%f}"
+    directorio_version = os.path.join(directorio, version)
+    os.makedirs(directorio_version)
+
+    try:
+        # Primera pasada: estadísticas del corpus y slugs
+        slugs = [registro['slug'] for registro in registros]
+        embedder.ajustar(texto_subvencion(registro) for registro in registros)
+
+        # Segunda pasada: vectores escritos fila a fila en un fichero mapeado en memoria
+        matriz = np.lib.format.open_memmap(os.path.join(directorio_version, 'embeddings.npy'), mode='w+',
+                                           dtype=np.float32, shape=(len(slugs), embedder.dimension))
+        for fila, registro in enumerate(registros):
+            matriz[fila] = embedder.transformar(texto_subvencion(registro))
+        matriz.flush()
+
+        meta = {**embedder.metadatos(), "filas": len(slugs), "ficheros": version}
+        if len(slugs) >= ivf_min_filas:
+            n_listas = int(math.sqrt(len(slugs)))
+            centroides, asignacion = _kmeans_esferico(matriz, n_listas)
+            np.save(os.path.join(directorio_version, 'ivf_centroids.npy'), centroides)
+            np.save(os.path.join(directorio_version, 'ivf_assign.npy'), asignacion)
+            meta["ivf_listas"] = n_listas
+        del matriz
+
+        embedder.guardar(directorio_version)
+        with open(os.path.join(directorio_version, 'slugs.json'), 'w', encoding='utf-8') as f:
+            json.dump(slugs, f, ensure_ascii=False)
+    except BaseException:
+        shutil.rmtree(directorio_version, ignore_errors=True)
+        raise
+
+    ruta_meta = os.path.join(directorio, 'meta.json')
+    try:
+        with open(ruta_meta, encoding='utf-8') as f:
+            version_anterior = json.load(f).get('ficheros')
+    except (OSError, ValueError):
+        version_anterior = None
+    escribir_atomico(ruta_meta, json.dumps(meta).encode('utf-8'))
+    _limpiar_versiones(directorio, {version, version_anterior})
+
+    logger.info(f"Índice vectorial generado en {directorio_version}: {len(slugs)} subvenciones, dimensión {embedder.dimension}")
+    return len(slugs)
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+# Escritura en bloque de la tabla grants: INSERT ... ON DUPLICATE KEY UPDATE (MySQL/Aurora)
+# o ON CONFLICT (SQLite) con executemany, por lotes y con un commit por lote.
+
+logger = logging.getLogger("ETL_Fandit")
+
+# Columnas que escribe el ETL; created_at y updated_at las rellena la base de datos
+CAMPOS_GRANT = [
+    'slug', 'formatted_title', 'status_text', 'entity', 'total_amount',
+    'request_amount', 'goal_extra', 'scope', 'publisher', 'applicants',
+    'term', 'help_type', 'expenses', 'fund_execution_period', 'line',
+    'extra_limit', 'info_extra'
+]
+
+CAMPOS_NUMERICOS = {'total_amount', 'request_amount'}
+
+# Campos cuyo cambio implica actualizar la fila; content_hash resume sus valores
+CAMPOS_SEGUIDOS = [campo for campo in CAMPOS_GRANT if campo != 'slug']
+
+COLUMNAS_ESCRITURA = CAMPOS_GRANT + ['content_hash']
+
+
+def valores_grant(grant):
+    """Tupla de valores de una subvención en el orden de CAMPOS_GRANT"""
+    return tuple(grant.get(campo, 0 if campo in CAMPOS_NUMERICOS else '') for campo in CAMPOS_GRANT)
+
+
+def _normalizar(campo, valor):
+    if campo in CAMPOS_NUMERICOS:
+        try:
+            return repr(round(float(valor or 0), 2))
+        except (TypeError, ValueError):
+            return str(valor)
+    if valor is None:
+        return ''
+    if isinstance(valor, (list, dict)):
+        return json.dumps(valor, ensure_ascii=False, sort_keys=True)
+    return str(valor).strip()
+
+
+def hash_contenido(grant):
+    """
+    SHA-256 (hex) de los campos seguidos normalizados: dos versiones de una subvención
+    tienen el mismo hash si y solo si no cambia ninguno de esos campos.
+    """
+    normalizados = (_normalizar(campo, grant.get(campo)) for campo in CAMPOS_SEGUIDOS)
+    # Separador de unidad (U+001F): no aparece en los textos de la API
+    return hashlib.sha256('\x1f'.join(normalizados).encode('utf-8')).hexdigest()
+
+
+def valores_fila(grant):
+    """Valores de COLUMNAS_ESCRITURA; usa el content_hash calculado en la descarga si lo hay"""
+    return valores_grant(grant) + (grant.get('content_hash') or hash_contenido(grant),)
+
+
+def es_sqlite(conn):
+    return isinstance(conn, sqlite3.Connection)
+
+
+def sentencia_upsert(conn):
+    """
+    INSERT que actualiza la fila si el slug ya existe, en el dialecto de la conexión.
+    mysql-connector convierte el executemany de esta sentencia en INSERTs de varias filas.
+    """
+    columnas = ", ".join(COLUMNAS_ESCRITURA)
+    actualizables = [campo for campo in COLUMNAS_ESCRITURA if campo != 'slug']
+    if es_sqlite(conn):
+        asignaciones = ", ".join(f"{campo} = excluded.{campo}" for campo in actualizables)
+        return (f"INSERT INTO grants ({columnas}) VALUES ({', '.join('?' for _ in COLUMNAS_ESCRITURA)}) "
+                f"ON CONFLICT(slug) DO UPDATE SET {asignaciones}, updated_at = CURRENT_TIMESTAMP")
+    asignaciones = ", ".join(f"{campo} = VALUES({campo})" for campo in actualizables)
+    return (f"INSERT INTO grants ({columnas}) VALUES ({', '.join('%s' for _ in COLUMNAS_ESCRITURA)}) "
+            f"ON DUPLICATE KEY UPDATE {asignaciones}")
+
+
+def escribir_grants(conn, grants, tamano_lote=None):
+    """
+    Inserta o actualiza las subvenciones por lotes, con un commit por lote: los bloqueos
+    duran lo que un lote y un error solo afecta al suyo. Si un lote falla se reintenta
+    fila a fila para aislar los registros que dan error.
+
+    :param conn: Conexión a la base de datos (mysql.connector o sqlite3)
+    :param grants: Lista de subvenciones
+    :param tamano_lote: Filas por lote (por defecto ETL_TAMANO_LOTE o 500)
+    :return: Tupla (filas escritas, slugs con error)
+    """
+    tamano_lote = tamano_lote or int(os.getenv('ETL_TAMANO_LOTE', '500'))
+    if not grants:
+        return 0, []
+
+    sentencia = sentencia_upsert(conn)
+    escritas = 0
+    fallidos = []
+    inicio = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        for desde in range(0, len(grants), tamano_lote):
+            lote = grants[desde:desde + tamano_lote]
+            try:
+                cursor.executemany(sentencia, [valores_fila(grant) for grant in lote])
+                conn.commit()
+                escritas += len(lote)
+            except Exception as e:
+                conn.rollback()
+                logger.warning(f"Error en el lote de las filas {desde}-{desde + len(lote) - 1}: {e}. "
+                               f"Se reintenta fila a fila")
+                for grant in lote:
+                    try:
+                        cursor.execute(sentencia, valores_fila(grant))
+                        conn.commit()
+                        escritas += 1
+                    except Exception as e:
+                        conn.rollback()
+                        fallidos.append(grant.get('slug'))
+                        logger.error(f"Error escribiendo el registro {grant.get('slug')}: {e}")
+    finally:
+        cursor.close()
+
+    duracion = time.perf_counter() - inicio
+    logger.info(f"Escritas {escritas} filas en {duracion:.2f} s ({escritas / duracion if duracion else 0:.0f} filas/s, "
+                f"lotes de {tamano_lote})")
+    if fallidos:
+        logger.error(f"{len(fallidos)} registros no se pudieron escribir: {fallidos}")
+    return escritas, fallidos
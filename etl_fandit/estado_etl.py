@@ -0,0 +1,149 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from escritura_grants import es_sqlite
+
+# Estado de la sincronización del ETL en la tabla etl_state: marca de agua de la última
+# sincronización correcta, fecha de la última reconciliación completa y cifras de la
+# última ejecución. Con ella el ETL decide si descarga todo el catálogo o solo lo reciente.
+
+logger = logging.getLogger("ETL_Fandit")
+
+SINCRONIZACION_GRANTS = 'grants'
+
+MODO_COMPLETO = 'completo'
+MODO_INCREMENTAL = 'incremental'
+
+COLUMNAS_ESTADO = ['name', 'last_sync_at', 'last_full_sync_at', 'last_mode', 'last_records',
+                   'last_api_calls', 'last_duration_s', 'updated_at']
+
+# Válido en MySQL y en SQLite; updated_at lo escribe guardar_estado
+ESQUEMA_ESTADO = """
+CREATE TABLE IF NOT EXISTS etl_state (
+    name VARCHAR(64) PRIMARY KEY,
+    last_sync_at DATETIME,
+    last_full_sync_at DATETIME,
+    last_mode VARCHAR(16),
+    last_records INT,
+    last_api_calls INT,
+    last_duration_s FLOAT,
+    updated_at DATETIME
+)
+"""
+
+
+def crear_tabla_estado(conn):
+    """Crea la tabla etl_state si no existe"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ESQUEMA_ESTADO)
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def _fecha(valor):
+    # mysql-connector devuelve datetime; sqlite3, el texto ISO con el que se guardó
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    return datetime.fromisoformat(str(valor))
+
+
+def leer_estado(conn, nombre=SINCRONIZACION_GRANTS):
+    """
+    :return: Diccionario con las columnas de etl_state, o None si nunca ha terminado una sincronización
+    """
+    marcador = '?' if es_sqlite(conn) else '%s'
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(COLUMNAS_ESTADO)} FROM etl_state WHERE name = {marcador}", (nombre,))
+        fila = cursor.fetchone()
+    finally:
+        cursor.close()
+    if fila is None:
+        return None
+    estado = dict(zip(COLUMNAS_ESTADO, fila))
+    for columna in ('last_sync_at', 'last_full_sync_at', 'updated_at'):
+        estado[columna] = _fecha(estado[columna])
+    return estado
+
+
+def decidir_modo(estado, ahora=None, dias_reconciliacion=None, modo_forzado=None):
+    """
+    Elige entre una sincronización completa y una incremental.
+
+    Es completa si se fuerza (ETL_MODO=completo), si no hay estado guardado o si la última
+    completa tiene más de `dias_reconciliacion` días: la incremental solo ve las subvenciones
+    publicadas desde la marca de agua, y la completa recoge los cambios en las anteriores.
+
+    :param estado: Resultado de leer_estado
+    :param ahora: Fecha de referencia (por defecto datetime.now())
+    :param dias_reconciliacion: Días entre sincronizaciones completas (por defecto ETL_DIAS_RECONCILIACION o 7)
+    :param modo_forzado: 'completo' o 'incremental' (por defecto ETL_MODO; vacío para decidir automáticamente)
+    :return: Tupla (modo, motivo)
+    """
+    ahora = ahora or datetime.now()
+    dias_reconciliacion = dias_reconciliacion or int(os.getenv('ETL_DIAS_RECONCILIACION', '7'))
+    modo_forzado = modo_forzado if modo_forzado is not None else os.getenv('ETL_MODO', '')
+    if modo_forzado == MODO_COMPLETO:
+        return MODO_COMPLETO, "forzada con ETL_MODO"
+    if not estado or not estado['last_sync_at']:
+        return MODO_COMPLETO, "no hay ninguna sincronización anterior"
+    if modo_forzado == MODO_INCREMENTAL:
+        return MODO_INCREMENTAL, "forzada con ETL_MODO"
+    ultima_completa = estado['last_full_sync_at']
+    if not ultima_completa or ahora - ultima_completa >= timedelta(days=dias_reconciliacion):
+        return MODO_COMPLETO, f"reconciliación periódica (cada {dias_reconciliacion} días)"
+    return MODO_INCREMENTAL, f"desde la sincronización del {estado['last_sync_at']:%Y-%m-%d %H:%M}"
+
+
+def fecha_desde(estado, margen_dias=None):
+    """
+    Fecha (AAAA-MM-DD) a partir de la que pide subvenciones una sincronización incremental:
+    la marca de agua menos un margen, para no perder las publicadas con retraso o en otra zona horaria.
+
+    :param margen_dias: Días de margen (por defecto ETL_MARGEN_INCREMENTAL_DIAS o 1)
+    """
+    margen_dias = margen_dias if margen_dias is not None else int(os.getenv('ETL_MARGEN_INCREMENTAL_DIAS', '1'))
+    return (estado['last_sync_at'] - timedelta(days=margen_dias)).date().isoformat()
+
+
+def guardar_estado(conn, modo, inicio, registros, peticiones, segundos, nombre=SINCRONIZACION_GRANTS):
+    """
+    Guarda la marca de agua tras una sincronización correcta. La marca es el inicio de la
+    ejecución: lo publicado mientras se descargaba entra en la siguiente.
+
+    :param modo: 'completo' o 'incremental' (solo la completa actualiza last_full_sync_at)
+    :param inicio: Fecha de inicio de la ejecución
+    :param registros: Subvenciones descargadas
+    :param peticiones: Peticiones hechas a la API
+    :param segundos: Duración de la ejecución
+    """
+    ultima_completa = inicio if modo == MODO_COMPLETO else None
+    valores = (nombre, inicio, ultima_completa, modo, registros, peticiones, round(segundos, 2), datetime.now())
+    actualizables = [columna for columna in COLUMNAS_ESTADO if columna != 'name']
+    if es_sqlite(conn):
+        valores = tuple(valor.isoformat(sep=' ') if isinstance(valor, datetime) else valor for valor in valores)
+        asignaciones = ", ".join(
+            "last_full_sync_at = COALESCE(excluded.last_full_sync_at, last_full_sync_at)"
+            if columna == 'last_full_sync_at' else f"{columna} = excluded.{columna}"
+            for columna in actualizables)
+        sentencia = (f"INSERT INTO etl_state ({', '.join(COLUMNAS_ESTADO)}) "
+                     f"VALUES ({', '.join('?' for _ in COLUMNAS_ESTADO)}) "
+                     f"ON CONFLICT(name) DO UPDATE SET {asignaciones}")
+    else:
+        asignaciones = ", ".join(
+            "last_full_sync_at = COALESCE(VALUES(last_full_sync_at), last_full_sync_at)"
+            if columna == 'last_full_sync_at' else f"{columna} = VALUES({columna})"
+            for columna in actualizables)
+        sentencia = (f"INSERT INTO etl_state ({', '.join(COLUMNAS_ESTADO)}) "
+                     f"VALUES ({', '.join('%s' for _ in COLUMNAS_ESTADO)}) "
+                     f"ON DUPLICATE KEY UPDATE {asignaciones}")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sentencia, valores)
+        conn.commit()
+    finally:
+        cursor.close()
+    logger.info(f"Marca de agua de {nombre} guardada: {inicio:%Y-%m-%d %H:%M:%S} (sincronización {modo})")
@@ -1,11 +1,18 @@
 import asyncio
-import json
 import os
 import logging
+import time
 from datetime import datetime
 import mysql.connector
 from dotenv import load_dotenv
 from clase_apifandit import FanditAPI
+from embeddings import CAMPOS_TEXTO, construir_indice_vectorial
+from db_setup import migrate_content_hash
+from escritura_grants import escribir_grants, hash_contenido
+from estado_etl import MODO_COMPLETO, crear_tabla_estado, decidir_modo, fecha_desde, guardar_estado, leer_estado
+from punto_control import PuntoControl
+from snapshot_sqlite import exportar_snapshot_sqlite
+from snapshots import RegistrosSnapshot, SnapshotNDJSON, aplicar_retencion, ruta_snapshot
 
 # Configuración de logging
 logging.basicConfig(
@@ -36,153 +43,245 @@ def connect_db():
         logger.error(f"Error al conectar a la base de datos: {err}")
         raise
 
-def get_existing_grants(cursor):
+def get_existing_hashes(cursor):
     """
-    Obtiene todos los grants existentes en la base de datos
-    Retorna un diccionario {slug: {datos completos}}
+    Obtiene el content_hash de todos los grants existentes en la base de datos
+    Retorna un diccionario {slug: content_hash} (None si la fila aún no tiene hash)
     """
-    # Obtener todos los grants
-    query = "SELECT * FROM grants"
-    cursor.execute(query)
+    cursor.execute("SELECT slug, content_hash FROM grants")
     
-    # Obtener nombres de columnas
-    column_names = [column[0] for column in cursor.description]
-    
-    # Crear diccionario de grants existentes
-    existing_grants = {}
+    existing_hashes = {}
     for row in cursor.fetchall():
-        # Convertir la fila a un diccionario
-        grant_dict = dict(zip(column_names, row))
-        existing_grants[grant_dict['slug']] = grant_dict
+        slug, content_hash = (row['slug'], row['content_hash']) if isinstance(row, dict) else row
+        existing_hashes[slug] = content_hash
     
-    logger.info(f"Se encontraron {len(existing_grants)} grants existentes en la base de datos")
-    return existing_grants
+    logger.info(f"Se encontraron {len(existing_hashes)} grants existentes en la base de datos")
+    return existing_hashes
+
+def anadir_hashes(subvenciones):
+    """Calcula el content_hash de cada subvención descargada (ver escritura_grants.hash_contenido)"""
+    for subvencion in subvenciones:
+        subvencion['content_hash'] = hash_contenido(subvencion)
+    return subvenciones
+
+async def descargar_pagina(api, pagina, filtros, semaforo, reintentos=None):
+    """
+    Descarga una página de /funds/, reintentándola con espera creciente si falla.
+    El semáforo limita las peticiones simultáneas; no se retiene durante la espera.
+
+    :return: Lista de subvenciones de la página, o None si se agotan los reintentos
+    """
+    reintentos = reintentos if reintentos is not None else int(os.getenv('ETL_REINTENTOS_PAGINA', '3'))
+    for intento in range(1, reintentos + 1):
+        async with semaforo:
+            respuesta = await api.obtener_lista_subvenciones(page=pagina, request_data=filtros)
+        if respuesta and 'results' in respuesta:
+            return respuesta['results']
+        if intento < reintentos:
+            logger.warning(f"Fallo descargando la página {pagina} (intento {intento} de {reintentos}), se reintenta")
+            await asyncio.sleep(0.5 * 2 ** (intento - 1))
+    logger.error(f"No se pudo descargar la página {pagina} tras {reintentos} intentos")
+    return None
+
+# Filtros de /funds/ de una descarga completa de las subvenciones abiertas
+FILTROS_BASE = {
+    "is_open": True,
+    "start_date": None,
+    "end_date": None,
+    "final_period_start_date": None,
+    "final_period_end_date": None,
+    "provinces": [],
+    "applicants": [],
+    "communities": [],
+    "action_items": [],
+    "origins": [],
+    "activities": [],
+    "region_types": [],
+    "types": []
+}
+
+def filtros_incrementales(desde):
+    """Filtros de /funds/ para las subvenciones con fecha de inicio a partir de `desde` (AAAA-MM-DD)"""
+    return {**FILTROS_BASE, "start_date": desde}
 
-async def descargar_subvenciones(api, paginas_a_descargar=None):
+async def generar_paginas(api, filtros=None, paginas_a_descargar=None, concurrencia=None, punto_control=None):
     """
-    Descarga subvenciones de la API de Fandit.
+    Descarga las páginas de /funds/ y las genera en orden, según van llegando.
+    La primera página indica el total; el resto se piden en paralelo (hasta `concurrencia`
+    peticiones a la vez) con una ventana de como mucho 2 × concurrencia páginas por delante
+    de la que espera el consumidor, de modo que la memoria no depende del total de páginas.
+    Con un punto de control, las páginas que ya tiene se leen del disco en lugar de pedirlas.
     
     :param api: Instancia de FanditAPI
+    :param filtros: Filtros de la petición (por defecto FILTROS_BASE)
     :param paginas_a_descargar: Número de páginas a descargar (None para todas)
-    :return: Lista completa de subvenciones
+    :param concurrencia: Peticiones simultáneas (por defecto ETL_CONCURRENCIA_PAGINAS o 20; el limitador de la API ajusta las que se envían)
+    :param punto_control: PuntoControl de la sincronización, si se puede reanudar
+    :return: Genera tuplas (página, subvenciones); subvenciones es None si la página no se pudo descargar
     """
-    todas_subvenciones = []
-    
-    filtros_base = {
-        "is_open": True,
-        "start_date": None,
-        "end_date": None,
-        "final_period_start_date": None,
-        "final_period_end_date": None,
-        "provinces": [],
-        "applicants": [],
-        "communities": [],
-        "action_items": [],
-        "origins": [],
-        "activities": [],
-        "region_types": [],
-        "types": []
-    }
+    filtros = filtros or FILTROS_BASE
+    concurrencia = concurrencia or int(os.getenv('ETL_CONCURRENCIA_PAGINAS', '20'))
+    inicio = time.perf_counter()
+    guardadas = punto_control.paginas_guardadas if punto_control else set()
     
-    # Obtener primera página para ver el total
-    primera_respuesta = await api.obtener_lista_subvenciones(page=1, request_data=filtros_base)
-    if not primera_respuesta:
-        logger.error("No se pudo obtener la primera página")
-        return []
-        
-    total_registros = primera_respuesta.get('count', 0)
-    registros_por_pagina = len(primera_respuesta.get('results', []))
+    if punto_control and punto_control.total_registros is not None:
+        # Reanudación: el total ya se conoce
+        total_registros = punto_control.total_registros
+        registros_por_pagina = punto_control.registros_por_pagina
+        primera_pagina = None
+    else:
+        # Obtener primera página para ver el total
+        primera_respuesta = await api.obtener_lista_subvenciones(page=1, request_data=filtros)
+        if not primera_respuesta:
+            logger.error("No se pudo obtener la primera página")
+            yield 1, None
+            return
+        total_registros = primera_respuesta.get('count', 0)
+        registros_por_pagina = len(primera_respuesta.get('results', []))
+        if not registros_por_pagina:
+            logger.info("La API no devolvió subvenciones")
+            return
+        if punto_control:
+            punto_control.fijar_total(total_registros, registros_por_pagina)
+        primera_pagina = primera_respuesta.get('results', [])
     total_paginas = -(-total_registros // registros_por_pagina)  # Redondeo hacia arriba
     
     logger.info(f"Total de registros disponibles: {total_registros}")
     logger.info(f"Registros por página: {registros_por_pagina}")
     logger.info(f"Total de páginas: {total_paginas}")
+    desde = 1
+    if primera_pagina is not None:
+        yield 1, primera_pagina
+        desde = 2
     
-    # Añadir resultados de la primera página
-    todas_subvenciones.extend(primera_respuesta.get('results', []))
+    # Descargar el resto de páginas en paralelo
+    max_paginas = min(paginas_a_descargar, total_paginas) if paginas_a_descargar else total_paginas
+    en_disco = len(guardadas.intersection(range(desde, max_paginas + 1)))
+    logger.info(f"Descargando páginas {desde} a {max_paginas} con {concurrencia} peticiones simultáneas"
+                f"{f' ({en_disco} ya descargadas en el punto de control)' if en_disco else ''}...")
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def obtener_pagina(pagina):
+        if pagina in guardadas:
+            return await asyncio.to_thread(punto_control.leer_pagina, pagina)
+        return await descargar_pagina(api, pagina, filtros, semaforo)
+
+    ventana = 2 * concurrencia
+    tareas = {}
+    siguiente = desde
+    paginas_fallidas = []
+    try:
+        for pagina in range(desde, max_paginas + 1):
+            while siguiente <= max_paginas and siguiente < pagina + ventana:
+                tareas[siguiente] = asyncio.create_task(obtener_pagina(siguiente))
+                siguiente += 1
+            subvenciones_pagina = await tareas.pop(pagina)
+            if subvenciones_pagina is None:
+                paginas_fallidas.append(pagina)
+            yield pagina, subvenciones_pagina
+    finally:
+        for tarea in tareas.values():
+            tarea.cancel()
     
-    # Descargar el resto de páginas
-    max_paginas = paginas_a_descargar if paginas_a_descargar else total_paginas
-    for pagina in range(2, max_paginas + 1):
-        logger.info(f"Descargando página {pagina} de {max_paginas}...")
-        
-        respuesta = await api.obtener_lista_subvenciones(page=pagina, request_data=filtros_base)
-        if respuesta and 'results' in respuesta:
-            subvenciones_pagina = respuesta['results']
-            todas_subvenciones.extend(subvenciones_pagina)
-            
-            if not respuesta.get('next'):
-                logger.info("No hay más páginas disponibles")
-                break
-        else:
-            logger.warning(f"No se encontraron resultados en la página {pagina}")
-            break
-            
-        # Pequeña pausa para no sobrecargar la API
-        await asyncio.sleep(0.5)
+    duracion = time.perf_counter() - inicio
+    paginas_descargadas = max_paginas - len(paginas_fallidas)
+    logger.info(f"Descargadas {paginas_descargadas} páginas en {duracion:.2f} s "
+                f"({paginas_descargadas / duracion:.1f} páginas/s)")
+    if paginas_fallidas:
+        logger.error(f"Páginas sin descargar: {paginas_fallidas}")
+
+async def descargar_subvenciones(api, paginas_a_descargar=None, concurrencia=None):
+    """
+    Descarga subvenciones de la API de Fandit (todas en memoria; el ETL usa ejecutar_pipeline).
     
+    :param api: Instancia de FanditAPI
+    :param paginas_a_descargar: Número de páginas a descargar (None para todas)
+    :param concurrencia: Peticiones simultáneas (ver generar_paginas)
+    :return: Lista completa de subvenciones, en orden de página
+    """
+    todas_subvenciones = []
+    async for _, subvenciones_pagina in generar_paginas(api, FILTROS_BASE, paginas_a_descargar, concurrencia):
+        todas_subvenciones.extend(anadir_hashes(subvenciones_pagina or []))
     logger.info(f"Total de subvenciones descargadas: {len(todas_subvenciones)}")
     return todas_subvenciones
 
-def guardar_json_backup(datos, nombre_archivo=None):
+class RegistrosBD:
     """
-    Guarda los datos en un archivo JSON como respaldo.
-    
-    :param datos: Datos a guardar
-    :param nombre_archivo: Nombre del archivo (si no se especifica, se usa la fecha actual)
+    Iterable que se puede recorrer varias veces leyendo de la tabla grants por bloques: en una
+    sincronización incremental el snapshot solo tiene lo reciente y el índice necesita todo el catálogo.
     """
-    if not nombre_archivo:
-        # Crear nombre de archivo con fecha y hora actual
-        fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nombre_archivo = f"subvenciones_{fecha_actual}.json"
-    
-    # Crear directorio de salida si no existe
-    os.makedirs('output', exist_ok=True)
-    ruta_completa = os.path.join('output', nombre_archivo)
-    
-    with open(ruta_completa, 'w', encoding='utf-8') as f:
-        json.dump(datos, f, ensure_ascii=False, indent=4)
-    
-    logger.info(f"Datos guardados como respaldo en {ruta_completa}")
 
-def identificar_cambios(subvenciones_api, existing_grants):
+    def __init__(self, conn, tamano_bloque=1000):
+        self.conn = conn
+        self.tamano_bloque = tamano_bloque
+
+    def __iter__(self):
+        cursor = self.conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT slug, {', '.join(CAMPOS_TEXTO)} FROM grants ORDER BY slug")
+            while filas := cursor.fetchmany(self.tamano_bloque):
+                yield from filas
+        finally:
+            cursor.close()
+
+def generar_indice_vectorial(subvenciones, directorio=None):
     """
-    Identifica registros nuevos y actualizados comparando con los existentes en la BD.
+    Genera el índice de embeddings que usa el backend para la búsqueda semántica.
+    Un fallo aquí no debe impedir la carga en la base de datos.
+
+    :param subvenciones: Subvenciones; se recorren dos veces (lista, RegistrosSnapshot o RegistrosBD)
+    :param directorio: Directorio del índice (por defecto ETL_DIRECTORIO_INDICE u output/grant_index)
+    """
+    directorio = directorio or os.getenv('ETL_DIRECTORIO_INDICE', os.path.join('output', 'grant_index'))
+    try:
+        construir_indice_vectorial(subvenciones, directorio)
+    except Exception as e:
+        logger.error(f"Error generando el índice vectorial: {e}")
+
+def generar_snapshot_sqlite(conn, solo_si_falta=False):
+    """
+    Exporta la tabla grants a SQLite para el modo embebido del backend, si
+    ETL_SNAPSHOT_SQLITE indica la ruta del fichero. Un fallo aquí no invalida la carga.
+
+    :param conn: Conexión a la base de datos
+    :param solo_si_falta: Generarlo únicamente si todavía no existe
+    """
+    ruta = os.getenv('ETL_SNAPSHOT_SQLITE')
+    if not ruta or (solo_si_falta and os.path.exists(ruta)):
+        return
+    try:
+        exportar_snapshot_sqlite(conn, ruta)
+    except Exception as e:
+        logger.error(f"Error generando el snapshot SQLite: {e}")
+
+def clasificar_cambio(subvencion, existing_hashes):
+    """
+    :return: 'nuevo', 'actualizado' o None (sin cambios) según el content_hash de la BD
+    """
+    content_hash = subvencion.get('content_hash') or hash_contenido(subvencion)
+    if subvencion['slug'] not in existing_hashes:
+        return 'nuevo'
+    if existing_hashes[subvencion['slug']] != content_hash:
+        return 'actualizado'
+    return None
+
+def identificar_cambios(subvenciones_api, existing_hashes):
+    """
+    Identifica registros nuevos y actualizados comparando su content_hash con el de la BD.
     
     :param subvenciones_api: Lista de subvenciones obtenidas de la API
-    :param existing_grants: Diccionario de subvenciones existentes en la BD
+    :param existing_hashes: Diccionario {slug: content_hash} de las subvenciones existentes en la BD
     :return: Tupla (nuevos, actualizados)
     """
     nuevos = []
     actualizados = []
     sin_cambios = 0
     
-    # Campos a comparar para detectar cambios
-    campos_comparacion = [
-        'formatted_title', 'status_text', 'entity', 'total_amount',
-        'request_amount', 'goal_extra', 'scope', 'publisher', 'applicants',
-        'term', 'help_type', 'expenses', 'fund_execution_period', 'line',
-        'extra_limit', 'info_extra'
-    ]
-    
     for subvencion in subvenciones_api:
-        slug = subvencion['slug']
-        
-        # Verificar si es un registro nuevo
-        if slug not in existing_grants:
+        cambio = clasificar_cambio(subvencion, existing_hashes)
+        if cambio == 'nuevo':
             nuevos.append(subvencion)
-            continue
-        
-        # Verificar si hay cambios en los campos relevantes
-        cambio_detectado = False
-        existing_grant = existing_grants[slug]
-        
-        for campo in campos_comparacion:
-            if campo in subvencion and str(subvencion.get(campo, '')) != str(existing_grant.get(campo, '')):
-                cambio_detectado = True
-                break
-        
-        if cambio_detectado:
+        elif cambio == 'actualizado':
             actualizados.append(subvencion)
         else:
             sin_cambios += 1
@@ -191,121 +290,115 @@ def identificar_cambios(subvenciones_api, existing_grants):
     logger.info(f"Registros sin cambios: {sin_cambios}")
     return nuevos, actualizados
 
-def insertar_nuevos_grants(cursor, grants_nuevos):
+def preparar_pagina(pagina, subvenciones_pagina, backup, punto_control=None):
     """
-    Inserta los nuevos grants en la base de datos
-    
-    :param cursor: Cursor de la conexión a la BD
-    :param grants_nuevos: Lista de grants nuevos a insertar
+    Añade el content_hash a las subvenciones de una página, la guarda en el punto de control
+    (si no venía de él) y la añade al respaldo
     """
-    if not grants_nuevos:
-        logger.info("No hay registros nuevos para insertar")
-        return 0
-    
-    insert_query = """
-    INSERT INTO grants (
-        slug, formatted_title, status_text, entity, total_amount,
-        request_amount, goal_extra, scope, publisher, applicants,
-        term, help_type, expenses, fund_execution_period, line,
-        extra_limit, info_extra, created_at, updated_at
-    ) VALUES (
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW()
-    )
-    """
-    
-    insertados = 0
-    for grant in grants_nuevos:
-        values = (
-            grant.get('slug', ''),
-            grant.get('formatted_title', ''),
-            grant.get('status_text', ''),
-            grant.get('entity', ''),
-            grant.get('total_amount', 0),
-            grant.get('request_amount', 0),
-            grant.get('goal_extra', ''),
-            grant.get('scope', ''),
-            grant.get('publisher', ''),
-            grant.get('applicants', ''),
-            grant.get('term', ''),
-            grant.get('help_type', ''),
-            grant.get('expenses', ''),
-            grant.get('fund_execution_period', ''),
-            grant.get('line', ''),
-            grant.get('extra_limit', ''),
-            grant.get('info_extra', '')
-        )
-        
-        try:
-            cursor.execute(insert_query, values)
-            insertados += 1
-            logger.info(f"Insertado nuevo registro con slug: {grant['slug']}")
-        except mysql.connector.Error as err:
-            logger.error(f"Error insertando registro {grant['slug']}: {err}")
-    
-    return insertados
+    if not punto_control or pagina not in punto_control.paginas_guardadas:
+        anadir_hashes(subvenciones_pagina)
+        if punto_control:
+            punto_control.guardar_pagina(pagina, subvenciones_pagina)
+    backup.escribir(subvenciones_pagina)
 
-def actualizar_grants_modificados(cursor, grants_actualizados):
-    """
-    Actualiza los grants modificados en la base de datos
-    
-    :param cursor: Cursor de la conexión a la BD
-    :param grants_actualizados: Lista de grants actualizados
+
+async def ejecutar_pipeline(api, conn, existing_hashes, backup, filtros=None, paginas_a_descargar=None,
+                            tamano_lote=None, paginas_en_cola=None, punto_control=None):
     """
-    if not grants_actualizados:
-        logger.info("No hay registros para actualizar")
-        return 0
+    Descarga y carga por etapas que se solapan, unidas por colas acotadas:
+    descarga de páginas → normalización y hash → diff con la BD y respaldo → escritura por lotes.
+    Mientras se escribe un lote se siguen descargando páginas, y en memoria solo hay unas pocas
+    páginas y un lote, sea cual sea el tamaño del catálogo (más el diccionario slug → hash).
+
+    Con un punto de control, cada página se guarda en disco antes de pasar a la escritura y se
+    marca como confirmada cuando el lote con sus últimos cambios está escrito. Al reanudar, las
+    páginas guardadas no se piden de nuevo y las confirmadas solo se añaden al respaldo.
     
-    update_query = """
-    UPDATE grants SET
-        formatted_title = %s,
-        status_text = %s,
-        entity = %s,
-        total_amount = %s,
-        request_amount = %s,
-        goal_extra = %s,
-        scope = %s,
-        publisher = %s,
-        applicants = %s,
-        term = %s,
-        help_type = %s,
-        expenses = %s,
-        fund_execution_period = %s,
-        line = %s,
-        extra_limit = %s,
-        info_extra = %s
-    WHERE slug = %s
+    :param api: Instancia de FanditAPI
+    :param conn: Conexión a la base de datos (la escritura se hace en un hilo, una llamada cada vez)
+    :param existing_hashes: Diccionario {slug: content_hash} de la BD
+    :param backup: SnapshotNDJSON al que se añaden las páginas descargadas
+    :param filtros: Filtros de /funds/ (por defecto FILTROS_BASE)
+    :param paginas_a_descargar: Número de páginas a descargar (None para todas)
+    :param tamano_lote: Filas por lote de escritura (por defecto ETL_TAMANO_LOTE o 500)
+    :param paginas_en_cola: Páginas descargadas a la espera de procesarse (por defecto ETL_PAGINAS_EN_COLA o 10)
+    :param punto_control: PuntoControl de la sincronización (None para no guardar ni reanudar)
+    :return: Diccionario con las páginas, registros, nuevos, actualizados, escritos y fallidos
     """
-    
-    actualizados = 0
-    for grant in grants_actualizados:
-        values = (
-            grant.get('formatted_title', ''),
-            grant.get('status_text', ''),
-            grant.get('entity', ''),
-            grant.get('total_amount', 0),
-            grant.get('request_amount', 0),
-            grant.get('goal_extra', ''),
-            grant.get('scope', ''),
-            grant.get('publisher', ''),
-            grant.get('applicants', ''),
-            grant.get('term', ''),
-            grant.get('help_type', ''),
-            grant.get('expenses', ''),
-            grant.get('fund_execution_period', ''),
-            grant.get('line', ''),
-            grant.get('extra_limit', ''),
-            grant.get('info_extra', ''),
-            grant.get('slug', '')  # WHERE condition
-        )
-        
+    tamano_lote = tamano_lote or int(os.getenv('ETL_TAMANO_LOTE', '500'))
+    paginas_en_cola = paginas_en_cola or int(os.getenv('ETL_PAGINAS_EN_COLA', '10'))
+    cola_paginas = asyncio.Queue(maxsize=paginas_en_cola)
+    cola_lotes = asyncio.Queue(maxsize=2)
+    inicio = time.perf_counter()
+    resultado = {"paginas": 0, "paginas_fallidas": [], "paginas_reanudadas": 0, "registros": 0, "nuevos": 0,
+                 "actualizados": 0, "escritos": 0, "fallidos": [], "primer_lote_s": None}
+
+    async def descargar():
         try:
-            cursor.execute(update_query, values)
-            actualizados += 1
-            logger.info(f"Actualizado registro con slug: {grant['slug']}")
-        except mysql.connector.Error as err:
-            logger.error(f"Error actualizando registro {grant['slug']}: {err}")
-    
-    return actualizados
+            async for pagina, subvenciones_pagina in generar_paginas(api, filtros, paginas_a_descargar,
+                                                                     punto_control=punto_control):
+                await cola_paginas.put((pagina, subvenciones_pagina))
+        finally:
+            await cola_paginas.put(None)
+
+    async def procesar():
+        lote = []
+        # Páginas con todos sus cambios en este lote o en los anteriores
+        paginas_cerradas = []
+        try:
+            while (elemento := await cola_paginas.get()) is not None:
+                pagina, subvenciones_pagina = elemento
+                if subvenciones_pagina is None:
+                    resultado["paginas_fallidas"].append(pagina)
+                    continue
+                resultado["paginas"] += 1
+                resultado["registros"] += len(subvenciones_pagina)
+                # Hash y respaldo en un hilo: no retrasan las respuestas que espera el event loop
+                await asyncio.to_thread(preparar_pagina, pagina, subvenciones_pagina, backup, punto_control)
+                if punto_control and pagina in punto_control.paginas_confirmadas:
+                    resultado["paginas_reanudadas"] += 1
+                    continue
+                for subvencion in subvenciones_pagina:
+                    cambio = clasificar_cambio(subvencion, existing_hashes)
+                    if cambio:
+                        resultado["nuevos" if cambio == 'nuevo' else "actualizados"] += 1
+                        lote.append(subvencion)
+                paginas_cerradas.append(pagina)
+                if len(lote) >= tamano_lote:
+                    await cola_lotes.put((lote, paginas_cerradas))
+                    lote, paginas_cerradas = [], []
+            if lote or paginas_cerradas:
+                await cola_lotes.put((lote, paginas_cerradas))
+        finally:
+            await cola_lotes.put(None)
+
+    async def escribir():
+        while (elemento := await cola_lotes.get()) is not None:
+            lote, paginas_cerradas = elemento
+            escritos, fallidos = await asyncio.to_thread(escribir_grants, conn, lote, len(lote)) if lote else (0, [])
+            resultado["escritos"] += escritos
+            resultado["fallidos"].extend(fallidos)
+            if lote and resultado["primer_lote_s"] is None:
+                resultado["primer_lote_s"] = round(time.perf_counter() - inicio, 2)
+            # Con filas sin escribir, sus páginas se vuelven a procesar al reanudar
+            if punto_control and not fallidos:
+                await asyncio.to_thread(punto_control.confirmar_paginas, paginas_cerradas)
+
+    tareas = [asyncio.create_task(etapa()) for etapa in (descargar, procesar, escribir)]
+    try:
+        await asyncio.gather(*tareas)
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+    resultado["segundos"] = round(time.perf_counter() - inicio, 2)
+    if resultado["paginas_reanudadas"]:
+        logger.info(f"{resultado['paginas_reanudadas']} páginas ya estaban confirmadas en el punto de control")
+    logger.info(f"Pipeline: {resultado['registros']} subvenciones en {resultado['paginas']} páginas, "
+                f"{resultado['nuevos']} nuevas y {resultado['actualizados']} actualizadas, "
+                f"{resultado['escritos']} escritas en {resultado['segundos']} s "
+                f"(primer lote escrito a los {resultado['primer_lote_s']} s)")
+    return resultado
 
 # Función eliminada - Ya no registramos en tabla aparte
 
@@ -337,52 +430,87 @@ async def main():
         conn = connect_db()
         cursor = conn.cursor(dictionary=True)
         
-        # Obtener grants existentes
-        existing_grants = get_existing_grants(cursor)
+        # Obtener el content_hash de los grants existentes (añadiendo la columna si falta)
+        migrate_content_hash(cursor)
+        existing_hashes = get_existing_hashes(cursor)
+        
+        # Sincronización completa o incremental según la marca de agua de etl_state, salvo que
+        # haya una interrumpida que reanudar: entonces se continúa con su modo y sus filtros
+        crear_tabla_estado(conn)
+        estado = leer_estado(conn)
+        directorio_checkpoint = os.getenv('ETL_DIRECTORIO_CHECKPOINT', os.path.join('output', 'checkpoint'))
+        punto_control = PuntoControl.reanudar(directorio_checkpoint)
+        reanudada = punto_control is not None
+        if reanudada:
+            modo, filtros = punto_control.modo, punto_control.filtros
+            logger.info(f"Reanudando la sincronización {modo} del {punto_control.inicio:%Y-%m-%d %H:%M}: "
+                        f"{len(punto_control.paginas_guardadas)} páginas descargadas, "
+                        f"{len(punto_control.paginas_confirmadas)} confirmadas")
+        else:
+            modo, motivo = decidir_modo(estado, start_time)
+            filtros = FILTROS_BASE if modo == MODO_COMPLETO else filtros_incrementales(fecha_desde(estado))
+            punto_control = PuntoControl.nuevo(directorio_checkpoint, modo, filtros, start_time)
+            logger.info(f"Sincronización {modo}: {motivo}")
         
         # Intentar renovar el token primero
         if email and password:
             await api.refrescar_token()
         
-        # 1. Descargar lista de subvenciones (todas las páginas)
-        subvenciones = await descargar_subvenciones(api, paginas_a_descargar=None)
-        logger.info(f"Total de subvenciones base descargadas: {len(subvenciones)}")
+        # 1-5. Descargar las páginas, guardar el snapshot NDJSON de respaldo, identificar los registros nuevos
+        # y actualizados y escribirlos por lotes, todo por etapas que se solapan
+        with SnapshotNDJSON(ruta_snapshot(modo=modo)) as backup:
+            resultado = await ejecutar_pipeline(api, conn, existing_hashes, backup, filtros=filtros,
+                                                punto_control=punto_control)
+        logger.info(f"Total de subvenciones base descargadas: {resultado['registros']}")
         
-        # Verificar si se descargaron subvenciones
-        if not subvenciones:
-            logger.error("No se descargaron subvenciones. Verificar credenciales y configuración.")
+        # Verificar si se descargaron subvenciones (una incremental puede no traer ninguna)
+        if resultado['paginas_fallidas'] or (modo == MODO_COMPLETO and not resultado['registros']):
+            logger.error("No se descargaron todas las páginas. Verificar credenciales y configuración; "
+                         "la marca de agua no se actualiza y la siguiente ejecución continuará desde el punto de control.")
             return
         
-        # 2. Guardar una copia de los datos como respaldo
-        guardar_json_backup(subvenciones)
+        # Lo que escribió la ejecución interrumpida también cuenta como cambio
+        hay_cambios = resultado['nuevos'] or resultado['actualizados'] or reanudada
         
-        # 3. Identificar registros nuevos y actualizados
-        nuevos, actualizados = identificar_cambios(subvenciones, existing_grants)
+        # 2b. Regenerar el índice vectorial para la búsqueda semántica: en una completa, leyendo el
+        # respaldo en streaming; en una incremental, desde la base de datos y solo si algo cambió
+        directorio_indice = os.getenv('ETL_DIRECTORIO_INDICE', os.path.join('output', 'grant_index'))
+        if modo == MODO_COMPLETO:
+            generar_indice_vectorial(RegistrosSnapshot(backup.ruta), directorio_indice)
+        elif hay_cambios or not os.path.exists(os.path.join(directorio_indice, 'meta.json')):
+            generar_indice_vectorial(RegistrosBD(conn), directorio_indice)
         
-        # Si no hay cambios, finalizar
-        if not nuevos and not actualizados:
+        # 6. Snapshot SQLite para despliegues con base de datos embebida
+        if hay_cambios:
+            logger.info("Cambios confirmados en la base de datos")
+            generar_snapshot_sqlite(conn)
+        else:
             logger.info("No se detectaron cambios en los datos, no es necesario actualizar la base de datos")
-            end_time = datetime.now()
-            duration = end_time - start_time
-            logger.info(f"Proceso ETL completado sin cambios. Duración: {duration}")
-            return
-            
-        # 4. Insertar nuevos registros
-        nuevos_insertados = insertar_nuevos_grants(cursor, nuevos)
-        
-        # 5. Actualizar registros modificados
-        registros_actualizados = actualizar_grants_modificados(cursor, actualizados)
+            generar_snapshot_sqlite(conn, solo_si_falta=True)
         
-        # Commit de los cambios
-        conn.commit()
-        logger.info("Cambios confirmados en la base de datos")
+        # Retención de los snapshots de respaldo (ETL_SNAPSHOTS_CONSERVAR, ETL_SNAPSHOTS_DIAS)
+        aplicar_retencion(os.path.dirname(backup.ruta))
         
+        # Marca de agua: solo si se descargaron todas las páginas y se escribieron todos los cambios.
+        # Es el inicio de la sincronización original si esta se ha reanudado
         end_time = datetime.now()
         duration = end_time - start_time
-        logger.info(f"Proceso ETL completado. Duración: {duration}")
-        logger.info(f"Total registros procesados: {len(subvenciones)}")
-        logger.info(f"Registros nuevos insertados: {nuevos_insertados}")
-        logger.info(f"Registros actualizados: {registros_actualizados}")
+        peticiones = sum(tiempos['peticiones'] for tiempos in api.resumen_tiempos().values())
+        if resultado['fallidos']:
+            logger.error("Hay registros sin escribir; la marca de agua no se actualiza y la siguiente "
+                         "ejecución los reintentará desde el punto de control")
+        else:
+            guardar_estado(conn, modo, punto_control.inicio, resultado['registros'], peticiones,
+                           duration.total_seconds())
+            punto_control.terminar()
+        
+        logger.info(f"Proceso ETL completado ({modo}). Duración: {duration}, peticiones a la API: {peticiones}")
+        logger.info(f"Total registros procesados: {resultado['registros']}")
+        logger.info(f"Registros nuevos: {resultado['nuevos']}, actualizados: {resultado['actualizados']}")
+        logger.info(f"Registros escritos: {resultado['escritos']}, con error: {len(resultado['fallidos'])}")
+        if estado and estado['last_mode']:
+            logger.info(f"Ejecución anterior ({estado['last_mode']}): {estado['last_api_calls']} peticiones, "
+                        f"{estado['last_duration_s']} s")
         
     except Exception as e:
         logger.error(f"Error en el proceso ETL: {e}")
@@ -392,7 +520,15 @@ async def main():
         if 'conn' in locals() and conn.is_connected():
             conn.rollback()
             logger.info("Se ha realizado rollback de las transacciones")
+        if 'punto_control' in locals():
+            logger.info(f"Los lotes ya escritos se conservan; la siguiente ejecución continuará desde el "
+                        f"punto de control ({len(punto_control.paginas_confirmadas)} páginas confirmadas)")
     finally:
+        # Tiempos de la API y cierre de su sesión HTTP
+        for endpoint, tiempos in api.resumen_tiempos().items():
+            logger.info(f"API {endpoint}: {tiempos}")
+        logger.info(f"Limitador de la API: {api.limitador.estado()}")
+        await api.cerrar()
         # Cerrar cursor y conexión
         if 'cursor' in locals() and cursor:
             cursor.close()
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+def segundos_retry_after(valor):
+    """
+    Interpreta la cabecera Retry-After (segundos o fecha HTTP).
+
+    :return: Segundos de espera, o None si no hay cabecera o no se entiende
+    """
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return max((fecha - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class LimitadorAdaptativo:
+    """
+    Limita las peticiones simultáneas a la API con AIMD (aumento aditivo, reducción multiplicativa).
+
+    Cada respuesta correcta suma 1/límite al límite (≈ +1 por cada ronda de peticiones) mientras
+    la latencia se mantiene estable. Un 429, un 5xx, un error de red o una latencia media por
+    encima de `tolerancia_latencia` veces la base multiplican el límite por `factor_reduccion`,
+    como mucho una vez por ronda. La base es la mejor media de los últimos `ventana_base` segundos:
+    baja en cuanto la media mejora y, si la API se vuelve más lenta de forma sostenida, sube con
+    ella en lugar de provocar una reducción tras otra. Con Retry-After no se envía ninguna
+    petición hasta que pase ese tiempo.
+    """
+
+    def __init__(self, inicial=4, minimo=1, maximo=20, factor_reduccion=0.5, tolerancia_latencia=1.5,
+                 muestras_minimas=10, alfa=0.2, ventana_base=60.0):
+        self.limite = float(inicial)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.factor_reduccion = factor_reduccion
+        self.tolerancia_latencia = tolerancia_latencia
+        self.muestras_minimas = muestras_minimas
+        self.alfa = alfa
+        self.ventana_base = ventana_base
+        self.en_vuelo = 0
+        self.pausa_hasta = 0.0
+        self.ultima_reduccion = 0.0
+        # Latencia media (EWMA) y latencia base de referencia, por endpoint
+        self.latencia_media = {}
+        self.latencia_base = {}
+        self.muestras = {}
+        # Media de las latencias sin los reinicios de _reducir, y (instante, media) candidatos
+        # a mínimo de la ventana, con medias crecientes
+        self._media_continua = {}
+        self._minimos = {}
+        self.reducciones = 0
+        self.pausas = 0
+        self.limite_maximo_alcanzado = self.limite
+        self._condicion = None
+        self._loop = None
+
+    def _condicion_del_loop(self):
+        # Las primitivas de asyncio pertenecen a un event loop; cada asyncio.run crea uno nuevo
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._condicion = asyncio.Condition()
+            self._loop = loop
+            # Las peticiones del loop anterior no se liberarán en este
+            self.en_vuelo = 0
+        return self._condicion
+
+    async def adquirir(self):
+        """
+        Espera a que haya hueco (y a que termine una pausa por Retry-After) y reserva una petición.
+        """
+        condicion = self._condicion_del_loop()
+        async with condicion:
+            while True:
+                espera = self.pausa_hasta - time.monotonic()
+                if espera > 0:
+                    try:
+                        await asyncio.wait_for(condicion.wait(), espera)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.en_vuelo < int(self.limite):
+                    self.en_vuelo += 1
+                    return
+                await condicion.wait()
+
+    async def liberar(self, endpoint, latencia, estado=None, retry_after=None):
+        """
+        Registra el resultado de una petición y ajusta el límite.
+
+        :param endpoint: Endpoint de la petición (la latencia se compara por endpoint)
+        :param latencia: Segundos que tardó la petición
+        :param estado: Código HTTP, o None si hubo un error de red
+        :param retry_after: Valor de la cabecera Retry-After, si la hubo
+        """
+        condicion = self._condicion_del_loop()
+        async with condicion:
+            self.en_vuelo -= 1
+            ahora = time.monotonic()
+            espera = segundos_retry_after(retry_after)
+            if espera:
+                self.pausa_hasta = max(self.pausa_hasta, ahora + espera)
+                self.pausas += 1
+                print(f"Limitador: la API pide esperar {espera:.1f} s (Retry-After)")
+
+            if estado is None or estado == 429 or estado >= 500:
+                self._reducir(ahora, "error de red" if estado is None else f"respuesta {estado}")
+            elif estado < 400:
+                media = self._registrar_latencia(endpoint, latencia, ahora)
+                base = self.latencia_base[endpoint]
+                if self.muestras[endpoint] >= self.muestras_minimas and media > self.tolerancia_latencia * base:
+                    self._reducir(ahora, f"latencia {media * 1000:.0f} ms (base {base * 1000:.0f} ms)")
+                else:
+                    self.limite = min(self.limite + 1 / self.limite, self.maximo)
+                    self.limite_maximo_alcanzado = max(self.limite_maximo_alcanzado, self.limite)
+            condicion.notify_all()
+
+    def _registrar_latencia(self, endpoint, latencia, ahora):
+        media = self.latencia_media.get(endpoint, latencia)
+        media = (1 - self.alfa) * media + self.alfa * latencia
+        self.latencia_media[endpoint] = media
+        self.muestras[endpoint] = self.muestras.get(endpoint, 0) + 1
+        continua = (1 - self.alfa) * self._media_continua.get(endpoint, latencia) + self.alfa * latencia
+        self._media_continua[endpoint] = continua
+        if self.muestras[endpoint] >= self.muestras_minimas:
+            # Mínimo en ventana deslizante: un mínimo histórico nunca subiría si la API se vuelve más lenta
+            minimos = self._minimos.setdefault(endpoint, deque())
+            while minimos and minimos[-1][1] >= continua:
+                minimos.pop()
+            minimos.append((ahora, continua))
+            while minimos[0][0] < ahora - self.ventana_base:
+                minimos.popleft()
+            self.latencia_base[endpoint] = minimos[0][1]
+        else:
+            self.latencia_base.setdefault(endpoint, media)
+        return media
+
+    def _reducir(self, ahora, motivo):
+        # Las respuestas de una misma ronda reflejan la misma congestión: una sola reducción por ronda
+        ronda = max(self.latencia_media.values(), default=0.0)
+        if ahora - self.ultima_reduccion < ronda:
+            return
+        anterior = self.limite
+        self.limite = max(self.limite * self.factor_reduccion, self.minimo)
+        self.ultima_reduccion = ahora
+        # Tras reducir, la media vuelve a partir de la base para no reducir de nuevo por la misma cola
+        self.latencia_media = dict(self.latencia_base)
+        if self.limite == anterior:
+            return
+        self.reducciones += 1
+        print(f"Limitador: {motivo}, límite {anterior:.1f} -> {self.limite:.1f} peticiones simultáneas")
+
+    def estado(self):
+        """
+        Estado del limitador, para el log del ETL.
+        """
+        return {
+            "limite": round(self.limite, 1),
+            "limite_maximo_alcanzado": round(self.limite_maximo_alcanzado, 1),
+            "en_vuelo": self.en_vuelo,
+            "reducciones": self.reducciones,
+            "pausas_retry_after": self.pausas,
+            "latencia_media_ms": {endpoint: round(media * 1000, 1) for endpoint, media in self.latencia_media.items()},
+        }
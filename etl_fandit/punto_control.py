@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+# Punto de control de una sincronización en curso, para reanudarla si se interrumpe.
+# En el directorio hay un estado.json (modo, filtros, total de la descarga y páginas
+# con todos sus cambios confirmados en la BD) y un fichero por página descargada, con
+# sus subvenciones ya hasheadas. Todo se escribe en un temporal, con fsync, y se
+# renombra: tras una caída solo puede faltar la última página, nunca quedar a medias.
+
+logger = logging.getLogger("ETL_Fandit")
+
+
+def escribir_atomico(ruta, contenido):
+    """Escribe `contenido` (bytes) en `ruta` de forma que tras una caída esté el fichero anterior o el nuevo"""
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(contenido)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+    # El renombrado es duradero cuando lo es la entrada del directorio
+    descriptor = os.open(os.path.dirname(ruta) or '.', os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class PuntoControl:
+    """
+    Páginas descargadas y confirmadas de una sincronización.
+
+    Una página está guardada cuando su fichero existe (no se vuelve a pedir a la API) y
+    confirmada cuando todos sus registros nuevos o modificados están escritos en la BD
+    (no se vuelve a comparar ni a escribir). El punto de control caduca a las
+    `vigencia_horas`: más tarde la paginación de la API puede haber cambiado.
+    """
+
+    def __init__(self, directorio, modo, filtros, inicio, total_registros=None, registros_por_pagina=None,
+                 paginas_confirmadas=()):
+        self.directorio = directorio
+        self.modo = modo
+        self.filtros = filtros
+        self.inicio = inicio
+        self.total_registros = total_registros
+        self.registros_por_pagina = registros_por_pagina
+        self.paginas_confirmadas = set(paginas_confirmadas)
+        self.paginas_guardadas = set()
+        self._cerrojo = threading.Lock()
+        os.makedirs(self._directorio_paginas, exist_ok=True)
+
+    @property
+    def _ruta_estado(self):
+        return os.path.join(self.directorio, 'estado.json')
+
+    @property
+    def _directorio_paginas(self):
+        return os.path.join(self.directorio, 'paginas')
+
+    def _ruta_pagina(self, pagina):
+        return os.path.join(self._directorio_paginas, f"pagina_{pagina:05d}.json")
+
+    @classmethod
+    def nuevo(cls, directorio, modo, filtros, inicio):
+        """Empieza un punto de control vacío, descartando el que hubiera"""
+        shutil.rmtree(directorio, ignore_errors=True)
+        punto_control = cls(directorio, modo, filtros, inicio)
+        punto_control._guardar_estado()
+        return punto_control
+
+    @classmethod
+    def reanudar(cls, directorio, vigencia_horas=None, ahora=None):
+        """
+        :param vigencia_horas: Horas durante las que se puede reanudar (por defecto ETL_CHECKPOINT_HORAS o 24)
+        :return: El punto de control de una sincronización interrumpida, o None si no hay o ha caducado
+        """
+        vigencia_horas = vigencia_horas or float(os.getenv('ETL_CHECKPOINT_HORAS', '24'))
+        ruta = os.path.join(directorio, 'estado.json')
+        if not os.path.exists(ruta):
+            return None
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                estado = json.load(f)
+            inicio = datetime.fromisoformat(estado['inicio'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Punto de control ilegible en {directorio}, se descarta: {e}")
+            shutil.rmtree(directorio, ignore_errors=True)
+            return None
+        if (ahora or datetime.now()) - inicio > timedelta(hours=vigencia_horas):
+            logger.info(f"El punto de control del {inicio:%Y-%m-%d %H:%M} ha caducado, se descarta")
+            shutil.rmtree(directorio, ignore_errors=True)
+            return None
+        punto_control = cls(directorio, estado['modo'], estado['filtros'], inicio, estado['total_registros'],
+                            estado['registros_por_pagina'], estado['paginas_confirmadas'])
+        for nombre in os.listdir(punto_control._directorio_paginas):
+            if nombre.startswith('pagina_') and nombre.endswith('.json'):
+                punto_control.paginas_guardadas.add(int(nombre[len('pagina_'):-len('.json')]))
+        return punto_control
+
+    def _guardar_estado(self):
+        # confirmar_paginas y fijar_total pueden llegar desde hilos distintos
+        with self._cerrojo:
+            estado = {
+                "modo": self.modo,
+                "filtros": self.filtros,
+                "inicio": self.inicio.isoformat(),
+                "total_registros": self.total_registros,
+                "registros_por_pagina": self.registros_por_pagina,
+                "paginas_confirmadas": sorted(self.paginas_confirmadas),
+            }
+            escribir_atomico(self._ruta_estado, json.dumps(estado, ensure_ascii=False).encode('utf-8'))
+
+    def fijar_total(self, total_registros, registros_por_pagina):
+        """Guarda el total de la primera página: al reanudar no hace falta volver a pedirla"""
+        self.total_registros = total_registros
+        self.registros_por_pagina = registros_por_pagina
+        self._guardar_estado()
+
+    def guardar_pagina(self, pagina, subvenciones):
+        escribir_atomico(self._ruta_pagina(pagina), json.dumps(subvenciones, ensure_ascii=False).encode('utf-8'))
+        self.paginas_guardadas.add(pagina)
+
+    def leer_pagina(self, pagina):
+        with open(self._ruta_pagina(pagina), encoding='utf-8') as f:
+            return json.load(f)
+
+    def confirmar_paginas(self, paginas):
+        """Marca como confirmadas las páginas cuyos cambios ya están escritos en la BD"""
+        if not paginas:
+            return
+        self.paginas_confirmadas.update(paginas)
+        self._guardar_estado()
+
+    def terminar(self):
+        """Borra el punto de control al acabar la sincronización sin errores"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
@@ -0,0 +1,125 @@
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from decimal import Decimal
+
+from dotenv import load_dotenv
+
+# Exporta la tabla grants de Aurora a un fichero SQLite autocontenido.
+# El backend puede usarlo como base de datos embebida con
+# GRANTS_DB_URL=sqlite:///ruta/grants_snapshot.db (demos, despliegues edge y benchmarks de CI).
+
+logger = logging.getLogger("ETL_Fandit")
+
+load_dotenv()
+
+COLUMNAS_GRANTS = [
+    'slug', 'formatted_title', 'status_text', 'entity', 'total_amount',
+    'request_amount', 'goal_extra', 'scope', 'publisher', 'applicants',
+    'term', 'help_type', 'expenses', 'fund_execution_period', 'line',
+    'extra_limit', 'info_extra', 'content_hash', 'created_at', 'updated_at'
+]
+
+# Mismo esquema que db_setup.create_grants_table, con los tipos equivalentes de SQLite
+ESQUEMA_SQLITE = """
+CREATE TABLE grants (
+    slug VARCHAR(255) PRIMARY KEY,
+    formatted_title VARCHAR(255),
+    status_text VARCHAR(255),
+    entity VARCHAR(100),
+    total_amount FLOAT,
+    request_amount FLOAT,
+    goal_extra TEXT,
+    scope VARCHAR(50),
+    publisher VARCHAR(255),
+    applicants TEXT,
+    term TEXT,
+    help_type TEXT,
+    expenses TEXT,
+    fund_execution_period TEXT,
+    line TEXT,
+    extra_limit TEXT,
+    info_extra TEXT,
+    content_hash CHAR(64),
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP
+)
+"""
+
+INDICES_SQLITE = [
+    "CREATE INDEX idx_formatted_title ON grants(formatted_title)",
+    "CREATE INDEX idx_entity ON grants(entity)",
+    "CREATE INDEX idx_status_text ON grants(status_text)",
+    # Filtros del matching del backend (scope + request_amount ordenado)
+    "CREATE INDEX idx_scope_request_amount ON grants(scope, request_amount)",
+]
+
+
+def _valor_sqlite(valor):
+    """Convierte fechas y decimales de MySQL a tipos que SQLite almacena tal cual."""
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ')
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def exportar_snapshot_sqlite(conn, ruta, tamano_lote=1000):
+    """
+    Copia la tabla grants de la conexión MySQL a un fichero SQLite.
+    Se escribe en un fichero temporal y se sustituye al final, de modo que un
+    backend que esté leyendo el snapshot anterior nunca ve uno a medias.
+
+    :param conn: Conexión mysql.connector a grants_db
+    :param ruta: Ruta del fichero SQLite destino
+    :param tamano_lote: Filas leídas y escritas por lote
+    :return: Número de subvenciones exportadas
+    """
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    ruta_tmp = f"{ruta}.tmp"
+    if os.path.exists(ruta_tmp):
+        os.remove(ruta_tmp)
+
+    destino = sqlite3.connect(ruta_tmp)
+    cursor = conn.cursor()
+    try:
+        destino.execute(ESQUEMA_SQLITE)
+        cursor.execute(f"SELECT {', '.join(COLUMNAS_GRANTS)} FROM grants")
+        insert = f"INSERT INTO grants ({', '.join(COLUMNAS_GRANTS)}) VALUES ({', '.join('?' * len(COLUMNAS_GRANTS))})"
+
+        total = 0
+        while True:
+            filas = cursor.fetchmany(tamano_lote)
+            if not filas:
+                break
+            if isinstance(filas[0], dict):
+                filas = [[fila[columna] for columna in COLUMNAS_GRANTS] for fila in filas]
+            destino.executemany(insert, [[_valor_sqlite(v) for v in fila] for fila in filas])
+            total += len(filas)
+
+        for indice in INDICES_SQLITE:
+            destino.execute(indice)
+        destino.commit()
+        destino.execute("VACUUM")
+    finally:
+        cursor.close()
+        destino.close()
+
+    os.replace(ruta_tmp, ruta)
+    logger.info(f"Snapshot SQLite generado en {ruta} con {total} subvenciones")
+    return total
+
+
+if __name__ == "__main__":
+    from etl_fandit import connect_db
+
+    ruta_destino = sys.argv[1] if len(sys.argv) > 1 else os.path.join('output', 'grants_snapshot.db')
+    conexion = connect_db()
+    try:
+        exportar_snapshot_sqlite(conexion, ruta_destino)
+    finally:
+        conexion.close()
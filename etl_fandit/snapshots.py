@@ -0,0 +1,332 @@
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from punto_control import escribir_atomico
+
+# Snapshots de subvenciones en NDJSON comprimido (un registro JSON por línea), escritos
+# según llegan los registros. Junto a cada uno hay un manifiesto (<snapshot>.manifest.json)
+# con el número de registros y los SHA-256 del fichero y de su contenido sin comprimir.
+# Se comprimen con zstd si está instalado zstandard y, si no, con gzip. El nombre lleva el
+# modo de la descarga: solo los completos tienen todo el catálogo.
+
+logger = logging.getLogger("ETL_Fandit")
+
+ZSTD_DISPONIBLE = importlib.util.find_spec("zstandard") is not None
+
+EXTENSIONES = {'zstd': '.ndjson.zst', 'gzip': '.ndjson.gz'}
+
+SUFIJO_MANIFIESTO = '.manifest.json'
+
+# Modos de snapshot: sincronización completa o incremental de etl_fandit.py (ver estado_etl),
+# y descarga con detalle de api_to_json.py
+MODO_COMPLETO = 'completo'
+MODO_INCREMENTAL = 'incremental'
+MODO_ENRIQUECIDO = 'enriquecido'
+MODOS = (MODO_COMPLETO, MODO_INCREMENTAL, MODO_ENRIQUECIDO)
+
+# Temporales de más de estas horas sin modificar son de escrituras interrumpidas
+HORAS_TEMPORALES_HUERFANOS = 1
+
+
+def compresion_por_defecto():
+    """ETL_SNAPSHOT_COMPRESION (zstd o gzip); por defecto zstd si está disponible"""
+    compresion = os.getenv('ETL_SNAPSHOT_COMPRESION') or ('zstd' if ZSTD_DISPONIBLE else 'gzip')
+    if compresion not in EXTENSIONES:
+        raise ValueError(f"Compresión de snapshot no soportada: {compresion}")
+    if compresion == 'zstd' and not ZSTD_DISPONIBLE:
+        raise ValueError("ETL_SNAPSHOT_COMPRESION=zstd requiere el paquete zstandard")
+    return compresion
+
+
+def ruta_snapshot(prefijo='subvenciones', directorio='output', compresion=None, modo=MODO_COMPLETO):
+    """Ruta de un snapshot nuevo en `directorio`, con el modo y la fecha y hora actuales en el nombre"""
+    if modo not in MODOS:
+        raise ValueError(f"Modo de snapshot no soportado: {modo}")
+    os.makedirs(directorio, exist_ok=True)
+    fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
+    extension = EXTENSIONES[compresion or compresion_por_defecto()]
+    return os.path.join(directorio, f"{prefijo}_{modo}_{fecha_actual}{extension}")
+
+
+_PATRON_MODO = re.compile(rf"_({'|'.join(MODOS)})_\d{{8}}_\d{{6}}")
+
+
+def _modo_de(nombre):
+    # <prefijo>_<modo>_<fecha>; los anteriores, sin modo en el nombre, eran descargas completas
+    coincidencia = _PATRON_MODO.search(nombre)
+    return coincidencia.group(1) if coincidencia else MODO_COMPLETO
+
+
+def _compresion_de(ruta):
+    for compresion, extension in EXTENSIONES.items():
+        if ruta.endswith(extension):
+            return compresion
+    return None
+
+
+class SnapshotNDJSON:
+    """
+    Escribe un snapshot de forma incremental: cada llamada a escribir() comprime y añade sus
+    registros. Se escribe en <ruta>.tmp y al cerrar se renombra y se genera el manifiesto,
+    así que un snapshot con manifiesto siempre está completo. Si el bloque `with` termina
+    con una excepción, el temporal se descarta.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.compresion = _compresion_de(ruta)
+        if self.compresion is None:
+            raise ValueError(f"Extensión de snapshot no reconocida: {ruta} (se esperaba {list(EXTENSIONES.values())})")
+        self.modo = _modo_de(os.path.basename(ruta))
+        self.registros = 0
+        self.bytes_sin_comprimir = 0
+        self._hash_contenido = hashlib.sha256()
+        self._inicio = time.perf_counter()
+        self._temporal = f"{ruta}.tmp"
+        self._fichero = open(self._temporal, 'wb')
+        if self.compresion == 'zstd':
+            import zstandard
+            self._compresor = zstandard.ZstdCompressor(level=3).stream_writer(self._fichero, closefd=False)
+        else:
+            self._compresor = gzip.GzipFile(fileobj=self._fichero, mode='wb', compresslevel=6)
+
+    def escribir(self, registros):
+        lineas = ''.join(json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n'
+                         for registro in registros).encode('utf-8')
+        if not lineas:
+            return
+        self._hash_contenido.update(lineas)
+        self._compresor.write(lineas)
+        self.bytes_sin_comprimir += len(lineas)
+        self.registros += lineas.count(b'\n')
+
+    def cerrar(self):
+        if self._fichero.closed:
+            return
+        self._compresor.close()
+        self._fichero.flush()
+        os.fsync(self._fichero.fileno())
+        self._fichero.close()
+        os.replace(self._temporal, self.ruta)
+
+        hash_fichero = hashlib.sha256()
+        with open(self.ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1 << 20), b''):
+                hash_fichero.update(bloque)
+        manifiesto = {
+            "fichero": os.path.basename(self.ruta),
+            "formato": "ndjson",
+            "compresion": self.compresion,
+            "modo": self.modo,
+            "registros": self.registros,
+            "bytes": os.path.getsize(self.ruta),
+            "bytes_sin_comprimir": self.bytes_sin_comprimir,
+            "sha256": hash_fichero.hexdigest(),
+            "sha256_contenido": self._hash_contenido.hexdigest(),
+            "creado": datetime.now().isoformat(timespec='seconds'),
+        }
+        escribir_atomico(self.ruta + SUFIJO_MANIFIESTO, json.dumps(manifiesto, indent=2).encode('utf-8'))
+        duracion = time.perf_counter() - self._inicio
+        logger.info(f"{self.registros} subvenciones guardadas en {self.ruta} ({manifiesto['bytes'] / 1e6:.1f} MB, "
+                    f"{self.bytes_sin_comprimir / 1e6:.1f} MB sin comprimir, {duracion:.2f} s)")
+
+    def descartar(self):
+        if not self._fichero.closed:
+            self._compresor.close()
+            self._fichero.close()
+        if os.path.exists(self._temporal):
+            os.remove(self._temporal)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_excepcion, *exc):
+        if tipo_excepcion is None:
+            self.cerrar()
+        else:
+            self.descartar()
+
+
+def guardar_snapshot(datos, ruta=None, registros_por_bloque=1000):
+    """
+    Guarda una lista (o iterable) de registros como snapshot, por bloques.
+
+    :param ruta: Ruta del snapshot (por defecto ruta_snapshot())
+    :return: Ruta del snapshot
+    """
+    registros = iter(datos)
+    with SnapshotNDJSON(ruta or ruta_snapshot()) as snapshot:
+        while bloque := list(islice(registros, registros_por_bloque)):
+            snapshot.escribir(bloque)
+    return snapshot.ruta
+
+
+def leer_manifiesto(ruta):
+    """:return: Manifiesto del snapshot, o None si no tiene"""
+    try:
+        with open(ruta + SUFIJO_MANIFIESTO, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _abrir_binario(ruta, compresion):
+    fichero = open(ruta, 'rb')
+    if compresion == 'zstd':
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fichero, closefd=True), 1 << 16)
+    return gzip.GzipFile(fileobj=fichero, mode='rb')
+
+
+def _leer_lista_json(ruta, tamano_bloque=1 << 16):
+    # Respaldos anteriores: una lista JSON (con indent=4) en un único fichero sin comprimir
+    decodificador = json.JSONDecoder()
+    separadores = re.compile(r'[\s,]*')
+    with open(ruta, encoding='utf-8') as f:
+        buffer = f.read(tamano_bloque).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{ruta} no contiene una lista JSON")
+        posicion = 1
+        while True:
+            posicion = separadores.match(buffer, posicion).end()
+            if buffer.startswith(']', posicion):
+                return
+            try:
+                registro, posicion_fin = decodificador.raw_decode(buffer, posicion)
+            except json.JSONDecodeError:
+                # Registro incompleto: se añade el siguiente bloque, descartando lo ya leído
+                bloque = f.read(tamano_bloque)
+                if not bloque:
+                    raise
+                buffer = buffer[posicion:] + bloque
+                posicion = 0
+                continue
+            yield registro
+            posicion = posicion_fin
+
+
+def leer_snapshot(ruta, verificar=True):
+    """
+    Genera los registros de un snapshot uno a uno, sin cargarlo entero en memoria.
+    También lee los respaldos .json anteriores (una lista JSON).
+
+    :param verificar: Comprobar al final el número de registros y el SHA-256 del contenido con el manifiesto
+    :raises ValueError: Si el snapshot no coincide con su manifiesto
+    """
+    compresion = _compresion_de(ruta)
+    if compresion is None:
+        yield from _leer_lista_json(ruta)
+        return
+
+    manifiesto = leer_manifiesto(ruta) if verificar else None
+    hash_contenido = hashlib.sha256()
+    registros = 0
+    with _abrir_binario(ruta, compresion) as f:
+        # Se decodifican bloques de líneas con un solo json.loads: mucho menos coste por registro
+        while lineas := list(islice(f, 1000)):
+            bloque = b','.join(linea.rstrip(b'\n') for linea in lineas)
+            if manifiesto:
+                hash_contenido.update(b''.join(lineas))
+            registros += len(lineas)
+            yield from json.loads(b'[' + bloque + b']')
+    if manifiesto and (registros != manifiesto['registros']
+                       or hash_contenido.hexdigest() != manifiesto['sha256_contenido']):
+        raise ValueError(f"{ruta} no coincide con su manifiesto: {registros} registros leídos, "
+                         f"{manifiesto['registros']} esperados, o el contenido ha cambiado")
+
+
+class RegistrosSnapshot:
+    """Iterable que se puede recorrer varias veces leyendo el snapshot en streaming (para el índice vectorial)"""
+
+    def __init__(self, ruta, verificar=True):
+        self.ruta = ruta
+        self.verificar = verificar
+
+    def __iter__(self):
+        return leer_snapshot(self.ruta, self.verificar)
+
+
+def _snapshots(directorio, prefijo, modo=None):
+    patron = re.compile(rf"^{re.escape(prefijo)}_.*(\.ndjson\.(gz|zst)|\.json)$")
+    rutas = [os.path.join(directorio, nombre) for nombre in os.listdir(directorio)
+             if patron.match(nombre) and not nombre.endswith(SUFIJO_MANIFIESTO)
+             and (modo is None or _modo_de(nombre) == modo)]
+    return sorted(rutas, key=os.path.getmtime, reverse=True)
+
+
+def ultimo_snapshot(directorio='output', prefijo='subvenciones', modo=MODO_COMPLETO):
+    """
+    :param modo: Modo del snapshot (por defecto el completo, el único con todo el catálogo; None para cualquiera)
+    :return: Ruta del snapshot más reciente de `directorio` con ese modo, o None si no hay ninguno
+    """
+    if not os.path.isdir(directorio):
+        return None
+    rutas = _snapshots(directorio, prefijo, modo)
+    return rutas[0] if rutas else None
+
+
+def _borrar_temporales_huerfanos(directorio, prefijo, horas):
+    # Snapshots y manifiestos de escrituras interrumpidas; los recientes pueden estar escribiéndose
+    limite = time.time() - horas * 3600
+    borrados = []
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if nombre.startswith(f"{prefijo}_") and nombre.endswith('.tmp') and os.path.getmtime(ruta) < limite:
+            os.remove(ruta)
+            borrados.append(ruta)
+    return borrados
+
+
+def aplicar_retencion(directorio='output', prefijo='subvenciones', conservar=None, dias=None):
+    """
+    Borra los snapshots antiguos (y sus manifiestos), incluidos los respaldos .json anteriores,
+    y los temporales de escrituras interrumpidas. De cada modo se conservan los `conservar` más
+    recientes, y de ellos se borran los de más de `dias` días, salvo el último. El último
+    snapshot completo no se borra nunca: es el único que permite recargar todo el catálogo.
+
+    :param conservar: Snapshots de cada modo que se conservan (por defecto ETL_SNAPSHOTS_CONSERVAR o 7)
+    :param dias: Antigüedad máxima en días (por defecto ETL_SNAPSHOTS_DIAS o 30; 0 sin límite)
+    :return: Rutas borradas
+    """
+    conservar = conservar or int(os.getenv('ETL_SNAPSHOTS_CONSERVAR', '7'))
+    dias = dias if dias is not None else int(os.getenv('ETL_SNAPSHOTS_DIAS', '30'))
+    limite = (datetime.now() - timedelta(days=dias)).timestamp() if dias else None
+    borradas = []
+    conservadas = 0
+    for modo in MODOS:
+        rutas = _snapshots(directorio, prefijo, modo)
+        for posicion, ruta in enumerate(rutas):
+            if posicion >= conservar or (posicion > 0 and limite and os.path.getmtime(ruta) < limite):
+                borradas.append(ruta)
+            else:
+                conservadas += 1
+    for ruta in borradas:
+        os.remove(ruta)
+        if os.path.exists(ruta + SUFIJO_MANIFIESTO):
+            os.remove(ruta + SUFIJO_MANIFIESTO)
+    temporales = _borrar_temporales_huerfanos(directorio, prefijo, HORAS_TEMPORALES_HUERFANOS)
+    if borradas or temporales:
+        logger.info(f"Retención de snapshots: {len(borradas)} borrados y {len(temporales)} temporales huérfanos, "
+                    f"se conservan {conservadas}")
+    return borradas + temporales
+
+
+if __name__ == "__main__":
+    # Verifica un snapshot contra su manifiesto: python snapshots.py [ruta]
+    logging.basicConfig(level=logging.INFO)
+    ruta = sys.argv[1] if len(sys.argv) > 1 else ultimo_snapshot()
+    if not ruta:
+        sys.exit("No hay snapshots en output/")
+    inicio = time.perf_counter()
+    total = sum(1 for _ in leer_snapshot(ruta))
+    print(f"{ruta}: {total} registros correctos ({time.perf_counter() - inicio:.2f} s)")
@@ -0,0 +1,53 @@
+"""
+Descarga completa de /funds/ contra el sustituto local de la API: secuencial
+(concurrencia 1) frente a páginas en paralelo. Con latencia L por petición, la
+descarga debería durar unas ⌈N/concurrencia⌉ rondas de L tras la primera página.
+También comprueba que las subvenciones llegan en orden de página y que las
+páginas con fallos se reintentan.
+
+    python tests/bench_descarga_paginas.py [páginas] [latencia_s] [concurrencia]
+"""
+import asyncio
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clase_apifandit import FanditAPI
+from etl_fandit import descargar_subvenciones
+from servidor_fandit_local import ServidorFanditLocal
+
+POR_PAGINA = 10
+
+
+async def ejecutar(paginas, latencia, concurrencia, fallos_por_pagina=None):
+    async with ServidorFanditLocal(paginas * POR_PAGINA, POR_PAGINA, latencia, fallos_por_pagina) as servidor:
+        async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url) as api:
+            inicio = time.perf_counter()
+            subvenciones = await descargar_subvenciones(api, concurrencia=concurrencia)
+            duracion = time.perf_counter() - inicio
+
+    esperadas = [servidor.subvencion(indice)["slug"] for indice in range(paginas * POR_PAGINA)]
+    assert [s["slug"] for s in subvenciones] == esperadas, "Subvenciones incompletas o fuera de orden"
+    rondas = 1 + math.ceil((paginas - 1) / concurrencia)
+    print(f"concurrencia={concurrencia:3d}  {duracion:6.2f} s  {paginas / duracion:7.1f} páginas/s  "
+          f"rondas={duracion / latencia:5.1f} (ideal {rondas})  peticiones={servidor.total_peticiones}  "
+          f"simultáneas máx={servidor.max_simultaneas}")
+
+
+async def main(paginas, latencia, concurrencia):
+    print(f"{paginas} páginas de {POR_PAGINA}, latencia {latencia * 1000:.0f} ms por petición")
+    await ejecutar(paginas, latencia, 1)
+    await ejecutar(paginas, latencia, concurrencia)
+    print("Con fallos en las páginas 3 y 7 (se reintentan):")
+    await ejecutar(paginas, latencia, concurrencia, fallos_por_pagina={3: 1, 7: 2})
+
+
+if __name__ == "__main__":
+    paginas = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latencia = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    concurrencia = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    asyncio.run(main(paginas, latencia, concurrencia))
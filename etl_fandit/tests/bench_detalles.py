@@ -0,0 +1,54 @@
+"""
+Enriquecimiento con /fund-details/ contra el sustituto local de la API: un trabajador
+(equivalente a la versión secuencial) frente al grupo de trabajadores de
+api_to_json.enriquecer_subvenciones, guardando en streaming. Comprueba que cada
+subvención aparece una sola vez con su detalle y que los slugs con fallos se reintentan.
+
+    python tests/bench_detalles.py [subvenciones] [latencia_s] [trabajadores]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api_to_json import enriquecer_subvenciones, guardar_snapshot_en_streaming
+from clase_apifandit import FanditAPI
+from servidor_fandit_local import ServidorFanditLocal
+from snapshots import leer_snapshot
+
+
+async def ejecutar(total, latencia, trabajadores, fallos_por_detalle=None):
+    async with ServidorFanditLocal(total, latencia=latencia, fallos_por_detalle=fallos_por_detalle) as servidor:
+        subvenciones = [servidor.subvencion(indice) for indice in range(total)]
+        async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url) as api:
+            inicio = time.perf_counter()
+            ruta = await guardar_snapshot_en_streaming(enriquecer_subvenciones(api, subvenciones, trabajadores))
+            duracion = time.perf_counter() - inicio
+
+    guardadas = list(leer_snapshot(ruta))
+    assert sorted(s["slug"] for s in guardadas) == [s["slug"] for s in subvenciones], "Faltan o sobran subvenciones"
+    assert all(s["info_extra"] == f"Detalle de {s['slug']}" for s in guardadas), "Detalle sin combinar"
+    print(f"trabajadores={trabajadores:3d}  {duracion:6.2f} s  {total / duracion:7.1f} subvenciones/s  "
+          f"peticiones={servidor.total_peticiones}  simultáneas máx={servidor.max_simultaneas}")
+
+
+async def main(total, latencia, trabajadores):
+    print(f"{total} subvenciones, latencia {latencia * 1000:.0f} ms por petición")
+    await ejecutar(total, latencia, 1)
+    await ejecutar(total, latencia, trabajadores)
+    print("Con fallos en dos detalles (se reintentan):")
+    await ejecutar(total, latencia, trabajadores,
+                   fallos_por_detalle={"subvencion-000003": 1, "subvencion-000042": 2})
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latencia = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    trabajadores = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        asyncio.run(main(total, latencia, trabajadores))
@@ -0,0 +1,75 @@
+"""
+Detección de cambios del ETL: antes, SELECT * de grants (columnas TEXT incluidas) y
+comparación con str() de 16 campos por registro; ahora, SELECT slug, content_hash y una
+búsqueda en un diccionario por registro. Mide tiempo y bytes leídos de la base de datos
+con una tabla SQLite de N subvenciones, de las que un 1 % cambia y un 1 % es nuevo.
+
+    python tests/bench_deteccion_cambios.py [subvenciones]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_escritura_grants import grants_sinteticos
+from escritura_grants import CAMPOS_SEGUIDOS, escribir_grants
+from etl_fandit import anadir_hashes, get_existing_hashes, identificar_cambios
+from snapshot_sqlite import ESQUEMA_SQLITE
+
+
+def bytes_leidos(filas):
+    return sum(len(str(valor).encode("utf-8")) for fila in filas for valor in fila)
+
+
+def deteccion_anterior(conn, subvenciones):
+    """Réplica de get_existing_grants + identificar_cambios del ETL anterior"""
+    cursor = conn.execute("SELECT * FROM grants")
+    columnas = [columna[0] for columna in cursor.description]
+    filas = cursor.fetchall()
+    existentes = {fila[0]: dict(zip(columnas, fila)) for fila in filas}
+    nuevos, actualizados = [], []
+    for subvencion in subvenciones:
+        existente = existentes.get(subvencion["slug"])
+        if existente is None:
+            nuevos.append(subvencion)
+        elif any(campo in subvencion and str(subvencion.get(campo, "")) != str(existente.get(campo, ""))
+                 for campo in CAMPOS_SEGUIDOS):
+            actualizados.append(subvencion)
+    return nuevos, actualizados, bytes_leidos(filas)
+
+
+def deteccion_por_hash(conn, subvenciones):
+    cursor = conn.cursor()
+    hashes = get_existing_hashes(cursor)
+    nuevos, actualizados = identificar_cambios(subvenciones, hashes)
+    return nuevos, actualizados, bytes_leidos(hashes.items())
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as directorio:
+        conn = sqlite3.connect(os.path.join(directorio, "grants.db"))
+        conn.execute(ESQUEMA_SQLITE)
+        escribir_grants(conn, grants_sinteticos(total))
+
+        # Descarga siguiente: un 1 % modificado y un 1 % nuevo; el hash se calcula al descargar
+        descarga = grants_sinteticos(total + total // 100)
+        for subvencion in descarga[: total // 100]:
+            subvencion["info_extra"] += " (modificada)"
+        inicio = time.perf_counter()
+        anadir_hashes(descarga)
+        hash_descarga = time.perf_counter() - inicio
+
+        for nombre, deteccion in [("SELECT * + str()", deteccion_anterior), ("content_hash", deteccion_por_hash)]:
+            inicio = time.perf_counter()
+            nuevos, actualizados, leidos = deteccion(conn, descarga)
+            duracion = time.perf_counter() - inicio
+            assert (len(nuevos), len(actualizados)) == (total // 100, total // 100), (len(nuevos), len(actualizados))
+            print(f"{nombre:>18}: {duracion:6.3f} s  {leidos / 1e6:8.2f} MB leídos de la BD  "
+                  f"({leidos / total:6.0f} bytes por subvención)")
+        print(f"Hash de la descarga (durante la descarga): {hash_descarga:.3f} s")
+        conn.close()
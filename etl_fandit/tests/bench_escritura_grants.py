@@ -0,0 +1,103 @@
+"""
+Escritura de la tabla grants: fila a fila con un INFO por fila y un único commit
+(como el ETL anterior) frente a escritura_grants.escribir_grants (executemany con
+upsert, lotes y commit por lote), con 1k, 10k y 100k filas nuevas y después las
+mismas filas modificadas.
+
+El sustituto local es SQLite (mismo esquema que snapshot_sqlite.py). Contra Aurora
+la diferencia es mayor: fila a fila, cada registro es además un viaje de red.
+
+    python tests/bench_escritura_grants.py [filas ...]
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from escritura_grants import CAMPOS_GRANT, escribir_grants, hash_contenido, valores_grant
+from snapshot_sqlite import ESQUEMA_SQLITE
+
+logger = logging.getLogger("ETL_Fandit")
+
+
+def grants_sinteticos(total, version=0):
+    return [{
+        "slug": f"subvencion-{indice:07d}",
+        "formatted_title": f"Subvención {indice} v{version}",
+        "status_text": "Abierta",
+        "entity": "Entidad de prueba",
+        "total_amount": 1000.0 * indice,
+        "request_amount": 100.0 * indice + version,
+        "goal_extra": "Objetivo " * 20,
+        "scope": "Nacional",
+        "publisher": "Publicador",
+        "applicants": "PYME, Autónomo",
+        "term": "Hasta el 31 de diciembre",
+        "help_type": "Subvención",
+        "expenses": "Gastos elegibles " * 10,
+        "fund_execution_period": "2025",
+        "line": "Línea 1",
+        "extra_limit": "",
+        "info_extra": f"Información adicional {version} " * 30,
+    } for indice in range(total)]
+
+
+def escribir_fila_a_fila(conn, nuevos, actualizados):
+    """Réplica de insertar_nuevos_grants + actualizar_grants_modificados del ETL anterior"""
+    cursor = conn.cursor()
+    insertar = f"INSERT INTO grants ({', '.join(CAMPOS_GRANT)}) VALUES ({', '.join('?' for _ in CAMPOS_GRANT)})"
+    actualizar = (f"UPDATE grants SET {', '.join(f'{campo} = ?' for campo in CAMPOS_GRANT[1:])} WHERE slug = ?")
+    for grant in nuevos:
+        cursor.execute(insertar, valores_grant(grant))
+        logger.info(f"Insertado nuevo registro con slug: {grant['slug']}")
+    for grant in actualizados:
+        valores = valores_grant(grant)
+        cursor.execute(actualizar, valores[1:] + valores[:1])
+        logger.info(f"Actualizado registro con slug: {grant['slug']}")
+    conn.commit()
+    cursor.close()
+
+
+def medir(directorio, modo, total):
+    ruta = os.path.join(directorio, f"{modo}-{total}.db")
+    conn = sqlite3.connect(ruta)
+    conn.execute(ESQUEMA_SQLITE)
+    resultados = []
+    for fase, version in [("nuevas", 0), ("modificadas", 1)]:
+        grants = grants_sinteticos(total, version)
+        # En el ETL el content_hash se calcula durante la descarga, no al escribir
+        for grant in grants:
+            grant["content_hash"] = hash_contenido(grant)
+        inicio = time.perf_counter()
+        if modo == "fila a fila":
+            escribir_fila_a_fila(conn, grants if version == 0 else [], grants if version else [])
+        else:
+            escritas, fallidos = escribir_grants(conn, grants)
+            assert escritas == total and not fallidos
+        resultados.append((fase, total / (time.perf_counter() - inicio)))
+    assert conn.execute("SELECT COUNT(*), MIN(request_amount - 100.0 * CAST(SUBSTR(slug, 12) AS INTEGER)) "
+                        "FROM grants").fetchone() == (total, 1.0), "La tabla no tiene las filas modificadas"
+    conn.close()
+    return resultados
+
+
+if __name__ == "__main__":
+    tamanos = [int(valor) for valor in sys.argv[1:]] or [1000, 10000, 100000]
+    with tempfile.TemporaryDirectory() as directorio:
+        # Como en el ETL, el log va a un fichero
+        manejador = logging.FileHandler(os.path.join(directorio, "etl_fandit.log"))
+        manejador.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        logger.addHandler(manejador)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+        for total in tamanos:
+            fila_a_fila = medir(directorio, "fila a fila", total)
+            en_bloque = medir(directorio, "en bloque", total)
+            for (fase, antes), (_, despues) in zip(fila_a_fila, en_bloque):
+                print(f"{total:>7} filas {fase:<11}  fila a fila {antes:9.0f} filas/s  "
+                      f"en bloque {despues:9.0f} filas/s  x{despues / antes:.1f}")
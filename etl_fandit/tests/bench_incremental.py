@@ -0,0 +1,83 @@
+"""
+Sincronización completa frente a incremental con la marca de agua de etl_state, contra el
+sustituto local de la API y una base de datos SQLite. El catálogo tiene `días` días de
+subvenciones; tras la primera sincronización (completa, no hay estado) se publican nuevas
+y se repite: la incremental solo pide las páginas desde la marca de agua menos un día de
+margen. Al pasar los días de reconciliación vuelve a ser completa. Informa de las peticiones
+a la API y la duración de cada una.
+
+    python tests/bench_incremental.py [subvenciones] [días]
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clase_apifandit import FanditAPI
+from estado_etl import MODO_COMPLETO, crear_tabla_estado, decidir_modo, fecha_desde, guardar_estado, leer_estado
+from etl_fandit import FILTROS_BASE, ejecutar_pipeline, filtros_incrementales, get_existing_hashes
+from servidor_fandit_local import ServidorFanditLocal
+from snapshot_sqlite import ESQUEMA_SQLITE
+from snapshots import SnapshotNDJSON, ruta_snapshot
+
+POR_PAGINA = 50
+NUEVAS = 300
+
+
+async def sincronizar(servidor, conn, ahora):
+    """Lo que hace main(): decidir el modo, ejecutar el pipeline con sus filtros y guardar la marca de agua"""
+    estado = leer_estado(conn)
+    modo, motivo = decidir_modo(estado, ahora, dias_reconciliacion=7, modo_forzado='')
+    filtros = FILTROS_BASE if modo == MODO_COMPLETO else filtros_incrementales(fecha_desde(estado, 1))
+    async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url) as api:
+        inicio = time.perf_counter()
+        with SnapshotNDJSON(ruta_snapshot(prefijo=f"incremental_{ahora:%Y%m%d}", modo=modo)) as backup:
+            resultado = await ejecutar_pipeline(api, conn, get_existing_hashes(conn.cursor()), backup, filtros=filtros)
+        duracion = time.perf_counter() - inicio
+        peticiones = sum(tiempos['peticiones'] for tiempos in api.resumen_tiempos().values())
+    assert not resultado['paginas_fallidas'] and not resultado['fallidos']
+    guardar_estado(conn, modo, ahora, resultado['registros'], peticiones, duracion)
+    print(f"{ahora:%Y-%m-%d}  {modo:<11} {peticiones:5d} peticiones  {duracion:6.2f} s  "
+          f"{resultado['registros']:6d} descargadas  {resultado['nuevos']:5d} nuevas  ({motivo})")
+    return modo, peticiones
+
+
+async def main(total, dias):
+    por_dia = total // dias
+    hoy = date.today()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        conn = sqlite3.connect(os.path.join(directorio, "grants.db"), check_same_thread=False)
+        conn.execute(ESQUEMA_SQLITE)
+        crear_tabla_estado(conn)
+        # El catálogo acaba el día anterior a la primera sincronización
+        async with ServidorFanditLocal(total, POR_PAGINA, latencia=0.01, fecha_inicial=hoy - timedelta(days=dias),
+                                       por_dia=por_dia) as servidor:
+            print(f"{total} subvenciones en {dias} días, páginas de {POR_PAGINA}; reconciliación cada 7 días")
+            ahora = datetime.combine(hoy, datetime.min.time()) + timedelta(hours=6)
+            resultados = [await sincronizar(servidor, conn, ahora)]
+            for dia in range(1, 9):
+                # Cada día se publican subvenciones con la start_date de ese día
+                servidor.total_subvenciones += min(NUEVAS, por_dia)
+                resultados.append(await sincronizar(servidor, conn, ahora + timedelta(days=dia)))
+            filas = conn.execute("SELECT COUNT(*) FROM grants").fetchone()[0]
+        conn.close()
+    assert filas == servidor.total_subvenciones, (filas, servidor.total_subvenciones)
+    completas = [peticiones for modo, peticiones in resultados if modo == MODO_COMPLETO]
+    incrementales = [peticiones for modo, peticiones in resultados if modo != MODO_COMPLETO]
+    print(f"Media de peticiones: completa {sum(completas) / len(completas):.0f}, "
+          f"incremental {sum(incrementales) / len(incrementales):.0f}")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.getLogger("ETL_Fandit").setLevel(logging.WARNING)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    dias = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    asyncio.run(main(total, dias))
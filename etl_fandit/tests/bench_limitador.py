@@ -0,0 +1,56 @@
+"""
+Limitador adaptativo (AIMD) frente a concurrencias fijas, pidiendo detalles a un
+sustituto local de la API que se degrada con la carga: por encima de `capacidad`
+peticiones simultáneas la latencia crece y por encima de `limite_429` responde 429
+con Retry-After. Una concurrencia fija baja desaprovecha la API, una alta acumula
+429 y pausas; el limitador debería acercarse a la capacidad sin que le limiten.
+
+    python tests/bench_limitador.py [subvenciones] [capacidad]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api_to_json import obtener_detalles_subvenciones
+from clase_apifandit import FanditAPI
+from limitador import LimitadorAdaptativo
+from servidor_fandit_local import ServidorFanditLocal
+
+LATENCIA = 0.02
+TRABAJADORES = 40
+
+
+async def ejecutar(nombre, limitador, total, capacidad):
+    async with ServidorFanditLocal(total, latencia=LATENCIA, capacidad=capacidad, limite_429=2 * capacidad) as servidor:
+        subvenciones = [servidor.subvencion(indice) for indice in range(total)]
+        async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url,
+                             limite_conexiones=TRABAJADORES, limitador=limitador) as api:
+            inicio = time.perf_counter()
+            completas = await obtener_detalles_subvenciones(api, subvenciones, trabajadores=TRABAJADORES)
+            duracion = time.perf_counter() - inicio
+    estado = limitador.estado()
+    return (f"{nombre:>14}: {duracion:6.2f} s  {total / duracion:7.1f} subvenciones/s  "
+            f"429={servidor.respuestas_429:4d}  simultáneas máx={servidor.max_simultaneas:3d}  "
+            f"límite final={estado['limite']}  reducciones={estado['reducciones']}  sin detalle={total - len(completas)}")
+
+
+async def main(total, capacidad):
+    resultados = []
+    for nombre, limitador in [
+        ("fija 4", LimitadorAdaptativo(inicial=4, minimo=4, maximo=4)),
+        (f"fija {TRABAJADORES}", LimitadorAdaptativo(inicial=TRABAJADORES, minimo=TRABAJADORES, maximo=TRABAJADORES)),
+        ("adaptativa", LimitadorAdaptativo(maximo=TRABAJADORES)),
+    ]:
+        resultados.append(await ejecutar(nombre, limitador, total, capacidad))
+    print(f"\n{total} detalles, latencia {LATENCIA * 1000:.0f} ms, capacidad {capacidad}, 429 por encima de {2 * capacidad}")
+    print("\n".join(resultados))
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    capacidad = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(main(total, capacidad))
@@ -0,0 +1,85 @@
+"""
+ETL por fases (descargar todo, respaldo, diff y escritura) frente a ejecutar_pipeline
+(etapas solapadas con colas acotadas), contra el sustituto local de la API y una base
+de datos SQLite que ya contiene la mitad del catálogo. Mide la duración, cuándo se
+escribe el primer lote y el pico de memoria de Python (tracemalloc), que en el pipeline
+no debería crecer con el catálogo. El servidor local comparte CPU y event loop con el
+ETL, así que la duración es una cota pesimista para ambos.
+
+    python tests/bench_pipeline.py [subvenciones ...]
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clase_apifandit import FanditAPI
+from escritura_grants import escribir_grants
+from etl_fandit import descargar_subvenciones, ejecutar_pipeline, get_existing_hashes, identificar_cambios
+from servidor_fandit_local import ServidorFanditLocal
+from snapshot_sqlite import ESQUEMA_SQLITE
+from snapshots import RegistrosSnapshot, SnapshotNDJSON, guardar_snapshot, ruta_snapshot
+
+POR_PAGINA = 50
+BYTES_TEXTO = 2000
+
+
+def base_de_datos(directorio, servidor, total):
+    conn = sqlite3.connect(os.path.join(directorio, f"grants-{time.perf_counter_ns()}.db"), check_same_thread=False)
+    conn.execute(ESQUEMA_SQLITE)
+    escribir_grants(conn, [servidor.subvencion(indice) for indice in range(0, total, 2)])
+    return conn
+
+
+async def por_fases(api, conn):
+    inicio = time.perf_counter()
+    subvenciones = await descargar_subvenciones(api)
+    guardar_snapshot(subvenciones)
+    nuevos, actualizados = identificar_cambios(subvenciones, get_existing_hashes(conn.cursor()))
+    escribir_grants(conn, nuevos + actualizados)
+    return len(subvenciones), time.perf_counter() - inicio
+
+
+async def en_pipeline(api, conn):
+    with SnapshotNDJSON(ruta_snapshot(prefijo="pipeline")) as backup:
+        resultado = await ejecutar_pipeline(api, conn, get_existing_hashes(conn.cursor()), backup)
+    assert sum(1 for _ in RegistrosSnapshot(backup.ruta)) == resultado["registros"]
+    return resultado["registros"], resultado["primer_lote_s"]
+
+
+async def medir(nombre, etapa, directorio, total):
+    async with ServidorFanditLocal(total, POR_PAGINA, latencia=0.01, bytes_texto=BYTES_TEXTO) as servidor:
+        conn = base_de_datos(directorio, servidor, total)
+        async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url) as api:
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            registros, primer_lote = await etapa(api, conn)
+            duracion = time.perf_counter() - inicio
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            reducciones = api.limitador.reducciones
+        filas = conn.execute("SELECT COUNT(*) FROM grants WHERE content_hash IS NOT NULL").fetchone()[0]
+        conn.close()
+    assert registros == total and filas == total, (registros, filas)
+    print(f"{total:>7} subvenciones  {nombre:<9} {duracion:6.2f} s  primer lote escrito a los {primer_lote:5.2f} s  "
+          f"pico de memoria {pico / 1e6:7.1f} MB  reducciones del limitador {reducciones}")
+
+
+async def main(tamanos):
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        for total in tamanos:
+            await medir("por fases", por_fases, directorio, total)
+            await medir("pipeline", en_pipeline, directorio, total)
+
+
+if __name__ == "__main__":
+    import logging
+    logging.getLogger("ETL_Fandit").setLevel(logging.WARNING)
+    asyncio.run(main([int(valor) for valor in sys.argv[1:]] or [5000, 20000]))
@@ -0,0 +1,98 @@
+"""
+Reanudación de una sincronización interrumpida con el punto de control (punto_control.py),
+contra el sustituto local de la API y una base de datos SQLite vacía. Se corta la
+primera ejecución al llegar a la página `corte` de `páginas` y se repite de dos formas:
+desde cero (sin punto de control, como antes) y reanudando. Compara las peticiones a
+la API, las filas escritas (content_hash evita reescribir las que ya estaban) y la
+duración de la segunda ejecución, y comprueba que la
+base de datos y el respaldo acaban completos.
+
+    python tests/bench_reanudacion.py [páginas] [corte]
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clase_apifandit import FanditAPI
+from estado_etl import MODO_COMPLETO
+from etl_fandit import FILTROS_BASE, ejecutar_pipeline, get_existing_hashes
+from punto_control import PuntoControl
+from servidor_fandit_local import ServidorFanditLocal
+from snapshot_sqlite import ESQUEMA_SQLITE
+from snapshots import RegistrosSnapshot, SnapshotNDJSON
+
+POR_PAGINA = 50
+
+
+async def ejecucion(servidor, ruta_db, ruta_backup, punto_control=None, corte=None):
+    """Una ejecución del pipeline; con `corte`, se cancela al tener esa página descargada (como una caída)"""
+    conn = sqlite3.connect(ruta_db, check_same_thread=False)
+    peticiones_antes = servidor.total_peticiones
+    inicio = time.perf_counter()
+    async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url) as api:
+        with SnapshotNDJSON(ruta_backup) as backup:
+            tarea = asyncio.create_task(ejecutar_pipeline(api, conn, get_existing_hashes(conn.cursor()), backup,
+                                                          filtros=FILTROS_BASE, punto_control=punto_control))
+            while corte and not tarea.done() and servidor.peticiones[("funds", corte)] == 0:
+                await asyncio.sleep(0.001)
+            if corte:
+                tarea.cancel()
+            try:
+                resultado = await tarea
+            except asyncio.CancelledError:
+                resultado = None
+                # Los lotes y páginas que estaban escribiéndose en su hilo terminan por su cuenta
+                await asyncio.sleep(0.5)
+    conn.close()
+    return resultado, servidor.total_peticiones - peticiones_antes, time.perf_counter() - inicio
+
+
+async def escenario(directorio, paginas, corte, reanudar):
+    ruta_db = os.path.join(directorio, f"grants-{reanudar}.db")
+    with sqlite3.connect(ruta_db) as conn:
+        conn.execute(ESQUEMA_SQLITE)
+    ruta_checkpoint = os.path.join(directorio, f"checkpoint-{reanudar}")
+    async with ServidorFanditLocal(paginas * POR_PAGINA, POR_PAGINA, latencia=0.01) as servidor:
+        punto_control = PuntoControl.nuevo(ruta_checkpoint, MODO_COMPLETO, FILTROS_BASE, datetime.now())
+        await ejecucion(servidor, ruta_db, os.path.join(directorio, "interrumpida.ndjson.gz"),
+                        punto_control if reanudar else None, corte)
+        with sqlite3.connect(ruta_db) as conn:
+            filas_corte = conn.execute("SELECT COUNT(*) FROM grants").fetchone()[0]
+        if reanudar:
+            punto_control = PuntoControl.reanudar(ruta_checkpoint)
+            guardadas, confirmadas = len(punto_control.paginas_guardadas), len(punto_control.paginas_confirmadas)
+        ruta_backup = os.path.join(directorio, f"respaldo-{reanudar}.ndjson.gz")
+        resultado, peticiones, duracion = await ejecucion(servidor, ruta_db, ruta_backup,
+                                                          punto_control if reanudar else None)
+    with sqlite3.connect(ruta_db) as conn:
+        filas = conn.execute("SELECT COUNT(*) FROM grants").fetchone()[0]
+    respaldadas = sum(1 for _ in RegistrosSnapshot(ruta_backup))
+    assert filas == respaldadas == paginas * POR_PAGINA, (filas, respaldadas)
+    nombre = "reanudando" if reanudar else "desde cero"
+    detalle = f"  (punto de control: {guardadas} guardadas, {confirmadas} confirmadas)" if reanudar else ""
+    print(f"{nombre:<11} {peticiones:4d} peticiones  {filas_corte:6d} filas en la BD tras el corte, "
+          f"{resultado['escritos']:5d} escritas después  "
+          f"{duracion:5.2f} s{detalle}")
+
+
+async def main(paginas, corte):
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        print(f"{paginas} páginas de {POR_PAGINA}; la primera ejecución se corta en la página {corte}")
+        await escenario(directorio, paginas, corte, reanudar=False)
+        await escenario(directorio, paginas, corte, reanudar=True)
+
+
+if __name__ == "__main__":
+    import logging
+    logging.getLogger("ETL_Fandit").setLevel(logging.WARNING)
+    paginas = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    corte = int(sys.argv[2]) if len(sys.argv) > 2 else 180
+    asyncio.run(main(paginas, corte))
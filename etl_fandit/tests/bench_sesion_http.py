@@ -0,0 +1,55 @@
+"""
+Coste de abrir una sesión HTTP por petición frente a reutilizar la sesión de FanditAPI.
+Pide los detalles de N subvenciones al sustituto local de la API, primero cerrando la
+sesión tras cada petición (como hacía antes el cliente) y después con la sesión compartida,
+e indica las conexiones TCP abiertas y el resumen de tiempos del cliente.
+Contra la API real la diferencia es mayor: cada conexión nueva paga también DNS y TLS.
+
+    python tests/bench_sesion_http.py [peticiones] [concurrencia]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clase_apifandit import FanditAPI
+from servidor_fandit_local import ServidorFanditLocal
+
+
+async def ejecutar(modo, peticiones, concurrencia):
+    async with ServidorFanditLocal(latencia=0.0) as servidor:
+        async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url) as api:
+            semaforo = asyncio.Semaphore(concurrencia)
+
+            async def detalle(indice):
+                async with semaforo:
+                    if modo == "sesión por petición":
+                        # Sesión propia para cada petición, como el cliente anterior
+                        async with FanditAPI(token="local", expert_token="local", base_url=servidor.base_url) as propia:
+                            resultado = await propia.obtener_detalle_subvencion(f"subvencion-{indice:06d}")
+                            api.tiempos["/fund-details/"].extend(propia.tiempos["/fund-details/"])
+                            return resultado
+                    return await api.obtener_detalle_subvencion(f"subvencion-{indice:06d}")
+
+            inicio = time.perf_counter()
+            resultados = await asyncio.gather(*(detalle(indice) for indice in range(peticiones)))
+            duracion = time.perf_counter() - inicio
+            assert all(resultados), "Alguna petición falló"
+            tiempos = api.resumen_tiempos()["/fund-details/"]
+    print(f"{modo:>20}: {duracion:6.2f} s  {peticiones / duracion:7.1f} peticiones/s  "
+          f"conexiones TCP={len(servidor.conexiones):5d}  p50={tiempos['p50_ms']} ms  p95={tiempos['p95_ms']} ms")
+
+
+async def main(peticiones, concurrencia):
+    print(f"{peticiones} peticiones de detalle, {concurrencia} simultáneas")
+    for modo in ["sesión por petición", "sesión compartida"]:
+        await ejecutar(modo, peticiones, concurrencia)
+
+
+if __name__ == "__main__":
+    peticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrencia = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(main(peticiones, concurrencia))
@@ -0,0 +1,78 @@
+"""
+Respaldo de subvenciones: el JSON anterior (json.dump con indent=4 y json.load para
+recargarlo) frente a los snapshots NDJSON comprimidos de snapshots.py con gzip y zstd,
+escritos por páginas de 50 y releídos en streaming (comprobando el manifiesto). Mide el
+tamaño, la escritura, la recarga y el pico de memoria de Python (tracemalloc) al recargar.
+Los datos sintéticos son muy repetitivos: comprimen más que los reales.
+
+    python tests/bench_snapshots.py [subvenciones ...]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_escritura_grants import grants_sinteticos
+from snapshots import EXTENSIONES, ZSTD_DISPONIBLE, SnapshotNDJSON, leer_snapshot
+
+POR_PAGINA = 50
+
+
+def escribir_json(grants, ruta):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(grants, f, ensure_ascii=False, indent=4)
+
+
+def leer_json(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return sum(1 for _ in json.load(f))
+
+
+def escribir_ndjson(grants, ruta):
+    with SnapshotNDJSON(ruta) as snapshot:
+        for desde in range(0, len(grants), POR_PAGINA):
+            snapshot.escribir(grants[desde:desde + POR_PAGINA])
+
+
+def leer_ndjson(ruta):
+    return sum(1 for _ in leer_snapshot(ruta))
+
+
+def medir(nombre, escribir, leer, grants, ruta):
+    inicio = time.perf_counter()
+    escribir(grants, ruta)
+    escritura = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    leidos = leer(ruta)
+    lectura = time.perf_counter() - inicio
+
+    # tracemalloc ralentiza mucho la lectura: la memoria se mide en una segunda recarga
+    tracemalloc.start()
+    leer(ruta)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert leidos == len(grants), (nombre, leidos)
+    print(f"{len(grants):>7}  {nombre:<14} {os.path.getsize(ruta) / 1e6:8.1f} MB  escritura {escritura:5.2f} s  "
+          f"recarga {lectura:5.2f} s  pico al recargar {pico / 1e6:7.1f} MB")
+
+
+def main(tamanos):
+    formatos = [("json indent=4", escribir_json, leer_json, ".json"),
+                ("ndjson gzip", escribir_ndjson, leer_ndjson, EXTENSIONES['gzip'])]
+    if ZSTD_DISPONIBLE:
+        formatos.append(("ndjson zstd", escribir_ndjson, leer_ndjson, EXTENSIONES['zstd']))
+    with tempfile.TemporaryDirectory() as directorio:
+        for total in tamanos:
+            grants = grants_sinteticos(total)
+            for nombre, escribir, leer, extension in formatos:
+                medir(nombre, escribir, leer, grants, os.path.join(directorio, f"subvenciones_{total}{extension}"))
+
+
+if __name__ == "__main__":
+    main([int(valor) for valor in sys.argv[1:]] or [10000, 100000])
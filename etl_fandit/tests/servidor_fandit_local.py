@@ -0,0 +1,130 @@
+"""
+Sustituto local de la API de Fandit para los benchmarks del ETL.
+
+Sirve /funds/ paginado y /fund-details/<slug>/ con datos sintéticos, una latencia
+fija por petición y, opcionalmente, fallos en las primeras peticiones de ciertas
+páginas o detalles. Con `capacidad`, la latencia crece con las peticiones simultáneas por
+encima de ella y, pasado `limite_429`, responde 429 con Retry-After, como una API que
+limita. Cada subvención tiene una start_date (`por_dia` subvenciones por día desde
+`fecha_inicial`) y /funds/ respeta el filtro start_date de requestData. Cuenta las peticiones, los 429, las simultáneas como máximo y las conexiones TCP abiertas.
+"""
+import asyncio
+import json
+from collections import Counter
+from datetime import date, timedelta
+
+from aiohttp import web
+
+
+class ServidorFanditLocal:
+    def __init__(self, total_subvenciones=500, por_pagina=10, latencia=0.05, fallos_por_pagina=None,
+                 fallos_por_detalle=None, capacidad=None, limite_429=None, retry_after="1",
+                 bytes_texto=0, fecha_inicial=None, por_dia=100):
+        """
+        :param fallos_por_pagina: {página: nº de peticiones iniciales que responden 500}
+        :param fallos_por_detalle: {slug: nº de peticiones iniciales que responden 500}
+        :param capacidad: Peticiones simultáneas a partir de las que la latencia crece proporcionalmente
+        :param limite_429: Peticiones simultáneas a partir de las que se responde 429
+        :param retry_after: Valor de la cabecera Retry-After de los 429
+        :param bytes_texto: Tamaño aproximado de los campos de texto largos de cada subvención
+        :param fecha_inicial: start_date de la primera subvención (por defecto, hoy)
+        :param por_dia: Subvenciones con la misma start_date
+        """
+        self.total_subvenciones = total_subvenciones
+        self.por_pagina = por_pagina
+        self.latencia = latencia
+        self.fallos_por_pagina = dict(fallos_por_pagina or {})
+        self.fallos_por_detalle = dict(fallos_por_detalle or {})
+        self.peticiones = Counter()
+        self.simultaneas = 0
+        self.max_simultaneas = 0
+        self.capacidad = capacidad
+        self.limite_429 = limite_429
+        self.retry_after = retry_after
+        self.respuestas_429 = 0
+        self.bytes_texto = bytes_texto
+        self.fecha_inicial = fecha_inicial or date.today()
+        self.por_dia = por_dia
+        self.conexiones = set()
+        self._runner = None
+        self.base_url = None
+
+    def subvencion(self, indice):
+        return {
+            "slug": f"subvencion-{indice:06d}",
+            "formatted_title": f"Subvención de prueba {indice}",
+            "status_text": "Abierta",
+            "entity": "Entidad de prueba",
+            "total_amount": 1000 * indice,
+            "request_amount": 100 * indice,
+            "scope": "Nacional",
+            "start_date": (self.fecha_inicial + timedelta(days=indice // self.por_dia)).isoformat(),
+            "goal_extra": f"Objetivo de la subvención {indice}. " * (self.bytes_texto // 30),
+        }
+
+    async def _con_latencia(self, request, clave):
+        self.conexiones.add(request.transport.get_extra_info("peername"))
+        self.peticiones[clave] += 1
+        self.simultaneas += 1
+        self.max_simultaneas = max(self.max_simultaneas, self.simultaneas)
+        try:
+            if self.limite_429 and self.simultaneas > self.limite_429:
+                self.respuestas_429 += 1
+                return web.json_response({"detail": "Demasiadas peticiones"}, status=429,
+                                         headers={"Retry-After": self.retry_after})
+            carga = self.simultaneas / self.capacidad if self.capacidad else 1
+            await asyncio.sleep(self.latencia * max(carga, 1))
+        finally:
+            self.simultaneas -= 1
+
+    async def funds(self, request):
+        pagina = int(request.query.get("page", 1))
+        limitada = await self._con_latencia(request, ("funds", pagina))
+        if limitada:
+            return limitada
+        if self.peticiones[("funds", pagina)] <= self.fallos_por_pagina.get(pagina, 0):
+            return web.json_response({"detail": "error simulado"}, status=500)
+        # Las start_date crecen con el índice: el filtro deja un sufijo del catálogo
+        desde = json.loads(request.query.get("requestData") or "{}").get("start_date")
+        primera = 0
+        if desde:
+            dias = (date.fromisoformat(desde) - self.fecha_inicial).days
+            primera = min(max(dias, 0) * self.por_dia, self.total_subvenciones)
+        total = self.total_subvenciones - primera
+        inicio = (pagina - 1) * self.por_pagina
+        if inicio >= total and pagina > 1:
+            return web.json_response({"detail": "Página no válida."}, status=404)
+        fin = min(inicio + self.por_pagina, total)
+        return web.json_response({
+            "count": total,
+            "next": f"{self.base_url}/funds/?page={pagina + 1}" if fin < total else None,
+            "results": [self.subvencion(primera + indice) for indice in range(inicio, fin)],
+        })
+
+    async def detalle(self, request):
+        slug = request.match_info["slug"]
+        limitada = await self._con_latencia(request, ("detalle", slug))
+        if limitada:
+            return limitada
+        if self.peticiones[("detalle", slug)] <= self.fallos_por_detalle.get(slug, 0):
+            return web.json_response({"detail": "error simulado"}, status=500)
+        return web.json_response({"slug": slug, "info_extra": f"Detalle de {slug}", "expenses": "Gastos elegibles"})
+
+    @property
+    def total_peticiones(self):
+        return sum(self.peticiones.values())
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/funds/", self.funds)
+        app.router.add_get("/fund-details/{slug}/", self.detalle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sitio = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await sitio.start()
+        puerto = sitio._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{puerto}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
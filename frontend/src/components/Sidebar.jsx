@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { useAuthActions } from "../context/AuthContext";
-import { getUserConversations, getChatHistory } from "../services/services";
+import { getUserConversations, getChatHistory, setCurrentConversation } from "../services/services";
 import {
     Button,
     Card,
@@ -44,6 +44,7 @@ export function Sidebar({
             text: msg.message_content,
         }));
         setMessages(formattedMessages);
+        setCurrentConversation(conversationId, formattedMessages.length); // Ya guardada: no se vuelve a enviar
         setIsInputDisabled(true);
         setInputMessage("");
         setIsSavedConversation(true);
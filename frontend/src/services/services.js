@@ -3,7 +3,20 @@ export const API_URL =
 
 import axios from "axios";
 
+// Conversación en curso: id estable y número de mensajes ya guardados,
+// para enviar a `/append_chat_messages` solo los mensajes nuevos
+let currentConversation = { id: null, savedCount: 0 };
+
+const newConversationId = () =>
+    crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+
+// Empieza una conversación nueva (o retoma una ya guardada con `savedCount` mensajes)
+export const setCurrentConversation = (conversationId = null, savedCount = 0) => {
+    currentConversation = { id: conversationId, savedCount };
+};
+
 export async function startSession(userId) {
+    setCurrentConversation(); // Cada sesión nueva es una conversación nueva
     try {
         const response = await axios.post(`${API_URL}/start_session`, {
             user_id: userId,
@@ -43,17 +56,29 @@ export async function chat(userId, inputMessage) {
 
 export const saveChat = async (userId, messages) => {
     try {
-        if (messages.length === 0) return; // No enviar si no hay mensajes
+        if (messages.length <= currentConversation.savedCount) return; // No hay mensajes nuevos
 
-        // Formatear mensajes para coincidir con el endpoint `/save_chat`
-        const formattedMessages = messages.map(msg => ({
-            userId: userId,  // Clave de partición en DynamoDB
+        if (!currentConversation.id) {
+            currentConversation.id = newConversationId();
+        }
+        const { id: conversationId, savedCount } = currentConversation;
+
+        // Solo los mensajes nuevos, numerados por su posición en la conversación
+        const formattedMessages = messages.slice(savedCount).map((msg, idx) => ({
+            sequence: savedCount + idx,
             timestamp: new Date().toISOString(),  // Marca de tiempo ISO
             role: msg.sender,  // "user" o "bot"
             message_content: msg.text  // Contenido del mensaje
         }));
 
-        await axios.post(`${API_URL}/save_chat`, { messages: formattedMessages });
+        await axios.post(`${API_URL}/append_chat_messages`, {
+            userId: userId,  // Clave de partición en DynamoDB
+            conversation_id: conversationId,
+            messages: formattedMessages,
+        });
+        if (currentConversation.id === conversationId) {
+            currentConversation.savedCount = Math.max(currentConversation.savedCount, messages.length);
+        }
         console.log("✅ Conversación guardada en la base de datos");
     } catch (error) {
         console.error("❌ Error guardando conversación:", error);
@@ -93,6 +118,7 @@ export const getUserConversations = async (userId) => {
 export const clearChat = async (userId, messages, setMessages) => {
     try {
         await saveChat(userId, messages); // Guarda la conversación antes de limpiarla
+        setCurrentConversation(); // Lo siguiente que se guarde será otra conversación
         setMessages([]); // Limpia los mensajes del estado
         console.log("🗑 Conversación limpiada");
     } catch (error) {